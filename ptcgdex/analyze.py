@@ -0,0 +1,260 @@
+# Encoding: UTF-8
+"""Query plan checks for the queries import, export and lookups rely on
+
+Each query in HOT_QUERIES is run through EXPLAIN QUERY PLAN (SQLite) or
+EXPLAIN (PostgreSQL), and plans that scan a whole table are flagged.
+
+Indexes are suggested separately, since a plan that already uses some
+index can still lack the best one: for every table a query filters or
+sorts on, a composite index on the filter columns followed by the sort
+columns is suggested if no index the database has can use all of them.
+"""
+from __future__ import division, unicode_literals
+
+import re
+from collections import namedtuple, defaultdict
+
+from sqlalchemy import Index, inspect
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.sql.visitors import traverse_depthfirst
+from pokedex.db import tables as dex_tables
+from pokedex.db import util
+
+from ptcgdex import tcg_tables
+
+QueryPlan = namedtuple('QueryPlan', 'name lines scanned_tables')
+
+
+def _en(session):
+    return session.query(dex_tables.Language).get(session.default_language_id)
+
+def _card_lookup(session):
+    # import_card's search for an existing identical card
+    query = session.query(tcg_tables.Card)
+    query = query.filter(tcg_tables.Card.family_id == 1)
+    query = query.filter(tcg_tables.Card.stage_id == 1)
+    query = query.filter(tcg_tables.Card.hp == 60)
+    query = query.filter(tcg_tables.Card.class_id == 1)
+    query = query.filter(tcg_tables.Card.retreat_cost == 1)
+    return query
+
+def _family_by_name(session):
+    query = session.query(tcg_tables.CardFamily)
+    return util.filter_name(query, tcg_tables.CardFamily, 'Pikachu',
+                            _en(session))
+
+def _mechanic_lookup(session):
+    query = session.query(tcg_tables.Mechanic)
+    query = util.filter_name(query, tcg_tables.Mechanic, 'Thunder Jolt',
+                             _en(session))
+    return query.filter(tcg_tables.Mechanic.class_id == 1)
+
+def _illustrator_by_identifier(session):
+    return session.query(tcg_tables.Illustrator).filter_by(
+        identifier='ken-sugimori')
+
+def _set_prints(session):
+    # export_set's listing
+    query = session.query(tcg_tables.SetPrint).filter_by(set_id=1)
+    return query.order_by(tcg_tables.SetPrint.order,
+                          tcg_tables.SetPrint.number)
+
+def _costs_by_type(session):
+    return session.query(tcg_tables.MechanicCost).filter_by(type_id=1)
+
+def _card_evolutions(session):
+    return session.query(tcg_tables.Evolution).filter_by(card_id=1)
+
+def _card_prints(session):
+    return session.query(tcg_tables.Print).filter_by(card_id=1)
+
+def _print_scans(session):
+    return session.query(tcg_tables.Scan).filter_by(print_id=1)
+
+def _illustrator_prints(session):
+    return session.query(tcg_tables.PrintIllustrator).filter_by(
+        illustrator_id=1)
+
+HOT_QUERIES = [
+    ('import: card lookup', _card_lookup),
+    ('import: family by name', _family_by_name),
+    ('import: mechanic lookup', _mechanic_lookup),
+    ('import: illustrator by identifier', _illustrator_by_identifier),
+    ('export: set prints', _set_prints),
+    ('export: card evolutions', _card_evolutions),
+    ('export: print scans', _print_scans),
+    ('lookup: mechanic costs by type', _costs_by_type),
+    ('lookup: prints of card', _card_prints),
+    ('lookup: prints by illustrator', _illustrator_prints),
+]
+
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+POSTGRESQL_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+
+
+def scanned_table(dialect, line):
+    """Return the table a plan line scans in full, or None"""
+    if dialect == 'sqlite':
+        match = SQLITE_SCAN_RE.match(line.strip())
+        # "SCAN t USING [COVERING] INDEX" walks an index, not the table
+        if match and 'USING' not in match.group(2):
+            return match.group(1)
+    else:
+        match = POSTGRESQL_SCAN_RE.search(line)
+        if match:
+            return match.group(1)
+
+
+def explain(connection, query):
+    """Return (plan lines, names of fully scanned tables) for a query"""
+    compiled = query.statement.compile(dialect=connection.dialect)
+    if compiled.positional:
+        params = [compiled.params[name] for name in compiled.positiontup]
+    else:
+        params = compiled.params
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        rows = connection.execute('EXPLAIN QUERY PLAN ' + unicode(compiled),
+                                  params)
+        lines = [row[-1] for row in rows]
+    elif dialect == 'postgresql':
+        rows = connection.execute('EXPLAIN ' + unicode(compiled), params)
+        lines = [row[0] for row in rows]
+    else:
+        raise ValueError('Cannot explain queries for {}'.format(dialect))
+    scanned = []
+    for line in lines:
+        table = scanned_table(dialect, line)
+        if table and table not in scanned:
+            scanned.append(table)
+    return lines, scanned
+
+
+def analyze(session):
+    """Explain all HOT_QUERIES; return a list of QueryPlans"""
+    connection = session.connection()
+    plans = []
+    for name, make_query in HOT_QUERIES:
+        lines, scanned = explain(connection, make_query(session))
+        plans.append(QueryPlan(name, lines, scanned))
+    return plans
+
+
+def query_columns(query):
+    """Return {table name: (filter columns, sort columns)} for a query
+
+    Both are lists of column names, in the order the query mentions them.
+    """
+    result = defaultdict(lambda: ([], []))
+    clauses = query.whereclause, query.statement._order_by_clause
+    for clause, i in zip(clauses, (0, 1)):
+        if clause is None:
+            continue
+        columns = []
+        traverse_depthfirst(clause, {}, {'column': columns.append})
+        for column in columns:
+            table = column.table
+            # Joins may alias tables; look through to the real one
+            table = getattr(table, 'original', table)
+            name = getattr(table, 'name', None)
+            if name in dex_tables.metadata.tables:
+                if column.name not in result[name][i]:
+                    result[name][i].append(column.name)
+    return dict(result)
+
+
+def usable_prefix(index_columns, columns):
+    """Return how many leading index columns a lookup on `columns` can use
+    """
+    count = 0
+    for name in index_columns:
+        if name not in columns:
+            break
+        count += 1
+    return count
+
+
+def existing_indexes(inspector, table_name):
+    """Return {name: [column names]} of the indexes a table has
+
+    The primary key and unique constraints count: both are backed by an
+    index.
+    """
+    indexes = dict((index['name'], index['column_names'])
+                   for index in inspector.get_indexes(table_name))
+    primary_key = inspector.get_pk_constraint(table_name)
+    if primary_key['constrained_columns']:
+        indexes[primary_key.get('name') or 'primary key'] = (
+            primary_key['constrained_columns'])
+    for constraint in inspector.get_unique_constraints(table_name):
+        columns = constraint['column_names']
+        name = constraint['name'] or 'unique ' + ', '.join(columns)
+        indexes.setdefault(name, columns)
+    return indexes
+
+
+def candidate_index(table, filter_columns, sort_columns):
+    """Return a composite Index on a query's filter, then sort columns
+
+    The index is not added to the table's metadata.
+    """
+    names = filter_columns + [c for c in sort_columns
+                              if c not in filter_columns]
+    index = Index('ix_{}_{}'.format(table.name, '_'.join(names)),
+                  *[table.c[name] for name in names])
+    table.indexes.discard(index)
+    return index
+
+
+def missing_indexes(session, queries=HOT_QUERIES):
+    """Return indexes that would serve the given queries better than the
+    ones the database has
+
+    For each table a query filters or sorts on, the candidate is an index
+    on the filter columns followed by the sort columns. It is suggested
+    when it has more usable leading columns than any existing index. An
+    index the schema declares but the database lacks is suggested in its
+    place when it covers all the filter columns and still beats the
+    existing ones.
+    """
+    inspector = inspect(session.connection())
+    table_names = set(inspector.get_table_names())
+    tables = dex_tables.metadata.tables
+    existing = {}
+    missing = {}
+    for name, make_query in queries:
+        query_tables = query_columns(make_query(session))
+        for table_name, (filters, sorts) in query_tables.items():
+            if table_name not in table_names:
+                continue
+            if table_name not in existing:
+                existing[table_name] = existing_indexes(inspector, table_name)
+            columns = set(filters) | set(sorts)
+            best = max([usable_prefix(index_columns, columns)
+                        for index_columns in existing[table_name].values()]
+                       or [0])
+            if best == len(columns):
+                continue
+            suggestion = None
+            for index in tables[table_name].indexes:
+                if index.name in existing[table_name]:
+                    continue
+                index_columns = [column.name for column in index.columns]
+                prefix = usable_prefix(index_columns, columns)
+                if prefix >= len(filters) and prefix > best:
+                    suggestion = index
+            if suggestion is None:
+                suggestion = candidate_index(tables[table_name], filters,
+                                             sorts)
+            missing[suggestion.name] = suggestion
+    return [index for name, index in sorted(missing.items())]
+
+
+def index_ddl(session, index):
+    return unicode(CreateIndex(index).compile(dialect=session.bind.dialect))
+
+
+def refresh_statistics(session):
+    """Update the planner statistics (ANALYZE)"""
+    session.connection().execute('ANALYZE')
+    session.commit()
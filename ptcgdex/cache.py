@@ -0,0 +1,14 @@
+# Encoding: UTF-8
+"""Location of ptcgdex's on-disk caches
+
+Kept free of heavy imports, so any module can use it.
+"""
+from __future__ import division, unicode_literals
+
+import os
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'ptcgdex')
@@ -0,0 +1,219 @@
+# Encoding: UTF-8
+"""Columnar export of the card tables to a NumPy .npz file
+
+Each exported table becomes a set of arrays named "<table>/<column>":
+
+- integers, booleans and dates become plain arrays; nullable integer
+  columns get an extra "<table>/<column>.null" mask when they hold NULLs
+  (and 0 in place of NULL)
+- references to small lookup tables (types, stages, rarities, classes,
+  mechanic classes) are dictionary-encoded: int8 codes, -1 for NULL,
+  decoded by the "dict/<lookup>" array of identifiers
+- strings are int32 indices into one shared, de-duplicated heap of UTF-8
+  bytes ("strings/heap", with "strings/offsets"), -1 for NULL
+
+Reading it back needs only NumPy; see load().
+NumPy is an optional dependency (pip install TCGdex[analytics]).
+"""
+from __future__ import division, unicode_literals
+
+from sqlalchemy import Boolean, Date, DateTime, Integer, Unicode, select
+from pokedex.db import tables as dex_tables
+
+from ptcgdex import tcg_tables
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CATEGORIES = [
+    ('types', tcg_tables.TCGType),
+    ('stages', tcg_tables.Stage),
+    ('rarities', tcg_tables.Rarity),
+    ('classes', tcg_tables.Class),
+    ('mechanic_classes', tcg_tables.MechanicClass),
+]
+
+# Exported table name -> (mapped class, {column: translation table}).
+# Translated columns are exported in the default language.
+TABLES = [
+    ('cards', tcg_tables.Card, {'family': 'tcg_card_family_names'}),
+    ('prints', tcg_tables.Print, {}),
+    ('set_prints', tcg_tables.SetPrint, {}),
+    ('mechanics', tcg_tables.Mechanic, {'name': 'tcg_mechanic_names',
+                                        'effect': 'tcg_mechanic_effects'}),
+    ('card_mechanics', tcg_tables.CardMechanic, {}),
+    ('mechanic_costs', tcg_tables.MechanicCost, {}),
+    ('damage_modifiers', tcg_tables.DamageModifier, {}),
+    ('card_types', tcg_tables.CardType, {}),
+]
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('Columnar export needs NumPy; '
+                          'install it with pip install numpy')
+
+
+class StringHeap(object):
+    """De-duplicated strings, stored as one UTF-8 byte buffer"""
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def add(self, string):
+        if string is None:
+            return -1
+        try:
+            return self.index[string]
+        except KeyError:
+            self.index[string] = position = len(self.strings)
+            self.strings.append(string)
+            return position
+
+    def arrays(self):
+        encoded = [string.encode('utf-8') for string in self.strings]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(data) for data in encoded], out=offsets[1:])
+        heap = numpy.array(bytearray(b''.join(encoded)), dtype=numpy.uint8)
+        return heap, offsets
+
+
+def _category_for(column):
+    for foreign_key in column.foreign_keys:
+        for name, cls in CATEGORIES:
+            if foreign_key.column.table is cls.__table__:
+                return name
+
+
+def _translated(connection, table_name, language_id):
+    """Return {foreign id: text} for a translation table's text column"""
+    table = dex_tables.metadata.tables[table_name]
+    [id_column] = [c for c in table.c if c.foreign_keys and
+                   c.name != 'local_language_id']
+    [text_column] = [c for c in table.c if c.name not in (
+        id_column.name, 'local_language_id')]
+    query = select([id_column, text_column])
+    query = query.where(table.c.local_language_id == language_id)
+    return dict(connection.execute(query).fetchall())
+
+
+def _export_table(connection, name, cls, translated, codes, heap,
+                  language_id):
+    table = cls.__table__
+    columns = list(table.c)
+    rows = connection.execute(
+        select(columns).order_by(*table.primary_key.columns)).fetchall()
+    arrays = {}
+    for position, column in enumerate(columns):
+        values = [row[position] for row in rows]
+        key = '{}/{}'.format(name, column.name)
+        category = _category_for(column)
+        if category:
+            key = '{}/{}'.format(name, column.name[:-len('_id')])
+            code_of = codes[category]
+            arrays[key] = numpy.array(
+                [code_of.get(value, -1) for value in values], dtype=numpy.int8)
+        elif isinstance(column.type, Boolean):
+            arrays[key] = numpy.array(values, dtype=bool)
+        elif isinstance(column.type, (Date, DateTime)):
+            arrays[key] = numpy.array(
+                [value.strftime('%Y-%m-%d') if value else 'NaT'
+                 for value in values], dtype='datetime64[D]')
+        elif isinstance(column.type, Integer):
+            nulls = numpy.array([value is None for value in values],
+                                dtype=bool)
+            arrays[key] = numpy.array(
+                [value or 0 for value in values], dtype=numpy.int32)
+            if nulls.any():
+                arrays[key + '.null'] = nulls
+        elif isinstance(column.type, Unicode):
+            arrays[key] = numpy.array(
+                [heap.add(value) for value in values], dtype=numpy.int32)
+        else:
+            raise TypeError('Cannot export {}.{} of type {}'.format(
+                table.name, column.name, column.type))
+    for column_name, translation_table in sorted(translated.items()):
+        texts = _translated(connection, translation_table, language_id)
+        if column_name == 'family':
+            ids = arrays[name + '/family_id']
+        else:
+            ids = arrays[name + '/id']
+        arrays['{}/{}'.format(name, column_name)] = numpy.array(
+            [heap.add(texts.get(id)) for id in ids.tolist()],
+            dtype=numpy.int32)
+    return arrays
+
+
+def export(session, filename):
+    """Write the card tables to a compressed .npz file
+
+    Returns {table name: row count}.
+    """
+    _require_numpy()
+    connection = session.connection()
+    language_id = session.default_language_id
+    arrays = {}
+    codes = {}
+    for name, cls in CATEGORIES:
+        table = cls.__table__
+        rows = connection.execute(select(
+            [table.c.id, table.c.identifier], order_by=table.c.id)).fetchall()
+        identifiers = [identifier for id, identifier in rows]
+        codes[name] = dict((id, code) for code, (id, identifier)
+                           in enumerate(rows))
+        arrays['dict/' + name] = numpy.array(identifiers, dtype=numpy.unicode_)
+    heap = StringHeap()
+    counts = {}
+    for name, cls, translated in TABLES:
+        table_arrays = _export_table(connection, name, cls, translated,
+                                     codes, heap, language_id)
+        counts[name] = len(next(iter(table_arrays.values())))
+        arrays.update(table_arrays)
+    arrays['strings/heap'], arrays['strings/offsets'] = heap.arrays()
+    with open(filename, 'wb') as f:
+        numpy.savez_compressed(f, **arrays)
+    return counts
+
+
+class Catalog(object):
+    """The contents of a columnar export
+
+    `tables` maps table names to {column: array}; `dicts` maps lookup
+    names to their identifiers.
+    """
+    def __init__(self, arrays):
+        self.tables = {}
+        self.dicts = {}
+        for key, array in arrays.items():
+            group, column = key.split('/', 1)
+            if group == 'dict':
+                self.dicts[column] = array
+            elif group == 'strings':
+                setattr(self, '_' + column, array)
+            else:
+                self.tables.setdefault(group, {})[column] = array
+
+    def string(self, index):
+        if index < 0:
+            return None
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return self._heap[start:end].tobytes().decode('utf-8')
+
+    def strings(self, table, column):
+        """Decode a string column to a list"""
+        return [self.string(index) for index in self.tables[table][column]]
+
+    def decode(self, table, column, dict_name):
+        """Decode a dictionary-encoded column to a list of identifiers"""
+        identifiers = self.dicts[dict_name]
+        return [unicode(identifiers[code]) if code >= 0 else None
+                for code in self.tables[table][column]]
+
+
+def load(filename):
+    """Read a columnar export into a Catalog"""
+    _require_numpy()
+    with numpy.load(filename) as data:
+        return Catalog(dict((key, data[key]) for key in data.files))
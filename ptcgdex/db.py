@@ -0,0 +1,68 @@
+# Encoding: UTF-8
+"""Pooled, read-only database sessions for concurrent readers
+
+`connect_read_only` returns the same kind of session as pokedex.db.connect:
+a scoped session, which gives each thread its own session. Behind it is an
+engine with a fixed-size connection pool, whose connections cannot write.
+Threads should call `session.remove()` when done with a unit of work, to
+return their connection to the pool.
+
+SQLite databases are opened with `mode=ro&immutable=1&cache=shared`, so
+they must not be changed while open. Python 2's sqlite3 module cannot
+open URI filenames; there the file is opened normally and made read-only
+with `PRAGMA query_only`. PostgreSQL connections default to read-only
+transactions.
+"""
+from __future__ import division, unicode_literals
+
+import os
+import sys
+import sqlite3
+import functools
+try:
+    from urllib import pathname2url
+except ImportError:
+    from urllib.request import pathname2url
+
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+DEFAULT_POOL_SIZE = 8
+
+
+def _connect_sqlite(path):
+    if sys.version_info >= (3, 4):
+        uri = 'file:{}?mode=ro&immutable=1&cache=shared'.format(
+            pathname2url(path))
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('PRAGMA query_only = ON')
+    return connection
+
+
+def read_only_engine_args(uri, pool_size=DEFAULT_POOL_SIZE):
+    """Return create_engine arguments for a pooled read-only engine"""
+    url = make_url(uri)
+    args = dict(poolclass=QueuePool, pool_size=pool_size, max_overflow=0)
+    if url.drivername.startswith('sqlite'):
+        if not url.database or url.database == ':memory:':
+            raise ValueError('An in-memory database cannot be shared')
+        args['creator'] = functools.partial(
+            _connect_sqlite, os.path.abspath(url.database))
+    elif url.drivername.startswith('postgresql'):
+        args['connect_args'] = dict(
+            options='-c default_transaction_read_only=on')
+    return args
+
+
+def connect_read_only(uri=None, pool_size=DEFAULT_POOL_SIZE):
+    """Return a thread-safe scoped session on a read-only engine
+
+    The URI defaults to the same database `ptcgdex` commands use.
+    """
+    import pokedex.db
+    from pokedex import defaults
+    if uri is None:
+        uri, origin = defaults.get_default_db_uri_with_origin()
+    return pokedex.db.connect(
+        uri, engine_args=read_only_engine_args(uri, pool_size))
@@ -0,0 +1,257 @@
+# Encoding: UTF-8
+"""Comparing two card databases, and making one match the other
+
+Database ids differ between databases, so mechanics and prints are
+compared by the fingerprint of their export (see ptcgdex.load's
+fingerprint functions), which names everything by content. Sets are
+compared by a digest of their whole contents first; only the prints of
+sets that differ are compared one by one.
+
+Prints are keyed by set identifier and card number ("base-set 58");
+prints not in any set by their own fingerprint. Mechanics are keyed by
+class and name, so a changed effect text shows up as a changed mechanic.
+"""
+from __future__ import division, unicode_literals
+
+import json
+import hashlib
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import select
+from pokedex.db import tables as dex_tables
+
+from ptcgdex import tcg_tables
+from ptcgdex import versions
+
+Diff = namedtuple('Diff', 'kind added removed changed')
+
+LOOSE = '(no set)'
+
+
+def _digest(*parts):
+    data = json.dumps(parts, sort_keys=True, default=unicode)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _identifiers(connection, cls):
+    table = cls.__table__
+    return dict(connection.execute(
+        select([table.c.id, table.c.identifier])).fetchall())
+
+
+def _translated(connection, table_name, language_id, *columns):
+    """Return {foreign id: (texts...)} from a translation table"""
+    table = dex_tables.metadata.tables[table_name]
+    [id_column] = [c for c in table.c if c.foreign_keys and
+                   c.name != 'local_language_id']
+    query = select([id_column] + [table.c[name] for name in columns],
+                   table.c.local_language_id == language_id)
+    return dict((row[0], tuple(row[1:]))
+                for row in connection.execute(query))
+
+
+class Fingerprints(object):
+    """Content digests of a database's mechanics, prints and sets"""
+    def __init__(self, session):
+        from ptcgdex import load as ptcg_load
+        connection = session.connection()
+        language_id = session.default_language_id
+        self.mechanics = ptcg_load.mechanic_fingerprints(session)
+        self.mechanic_keys = {}
+        for id, fingerprint in self.mechanics.items():
+            info = json.loads(fingerprint)
+            self.mechanic_keys[id] = '{}: {}'.format(
+                info.get('type'), info.get('name', ''))
+        self.prints = ptcg_load.print_fingerprints(session)
+        session.expunge_all()
+        self.sets, self.set_prints, self.loose_prints = self._sets(
+            connection, language_id)
+
+    def _sets(self, connection, language_id):
+        sets = tcg_tables.Set.__table__
+        set_prints = tcg_tables.SetPrint.__table__
+        names = _translated(connection, 'tcg_set_names', language_id, 'name')
+        identifiers = _identifiers(connection, tcg_tables.Set)
+        keyed = defaultdict(dict)  # identifier -> {print key: fingerprint}
+        seen = defaultdict(int)
+        in_sets = set()
+        for set_id, number, print_id in connection.execute(select(
+                [set_prints.c.set_id, set_prints.c.number,
+                 set_prints.c.print_id],
+                order_by=[set_prints.c.set_id, set_prints.c.order])):
+            identifier = identifiers[set_id]
+            key = '{} {}'.format(identifier, number or '-')
+            seen[key] += 1
+            if seen[key] > 1:
+                key = '{} ({})'.format(key, seen[key])
+            keyed[identifier][key] = self.prints[print_id]
+            in_sets.add(print_id)
+        digests = {}
+        for row in connection.execute(sets.select()):
+            identifier = row['identifier']
+            digests[identifier] = _digest(
+                names.get(row['id']), row['total'], row['release_date'],
+                row['ban_date'], sorted(keyed[identifier].items()))
+        loose = {}
+        for print_id, fingerprint in self.prints.items():
+            if print_id not in in_sets:
+                key = '{} {}'.format(LOOSE, _digest(fingerprint)[:12])
+                loose[key] = print_id
+        return digests, keyed, loose
+
+
+def _compare(kind, old, new):
+    """Diff two {key: digest} dicts"""
+    return Diff(kind,
+                sorted(set(new) - set(old)),
+                sorted(set(old) - set(new)),
+                sorted(key for key in set(old) & set(new)
+                       if old[key] != new[key]))
+
+
+def _mechanic_digests(fingerprints):
+    """Return {key: digest of all the key's mechanics}"""
+    by_key = defaultdict(list)
+    for id, key in fingerprints.mechanic_keys.items():
+        by_key[key].append(fingerprints.mechanics[id])
+    return dict((key, _digest(sorted(digests)))
+                for key, digests in by_key.items())
+
+
+def diff(old, new):
+    """Return set, print and mechanic Diffs between two Fingerprints
+
+    "Added" things are in `new` but not in `old`.
+    """
+    set_diff = _compare('set', old.sets, new.sets)
+    old_prints = {}
+    new_prints = {}
+    for identifier in set(set_diff.added + set_diff.removed +
+                          set_diff.changed):
+        old_prints.update(old.set_prints.get(identifier, {}))
+        new_prints.update(new.set_prints.get(identifier, {}))
+    for key in old.loose_prints:
+        old_prints[key] = key
+    for key in new.loose_prints:
+        new_prints[key] = key
+    return [set_diff,
+            _compare('print', old_prints, new_prints),
+            _compare('mechanic', _mechanic_digests(old),
+                     _mechanic_digests(new))]
+
+
+def _dependents(cls):
+    """Return (table, column name) pairs of columns referencing cls"""
+    parent = cls.__table__
+    return [(table, column.name)
+            for table in dex_tables.metadata.sorted_tables
+            for column in table.c
+            for foreign_key in column.foreign_keys
+            if foreign_key.column.table is parent]
+
+
+def _delete(connection, cls, ids):
+    """Delete the given rows and all rows that reference them"""
+    ids = list(ids)
+    if not ids:
+        return
+    for table, column in _dependents(cls):
+        connection.execute(table.delete().where(table.c[column].in_(ids)))
+    table = cls.__table__
+    connection.execute(table.delete().where(table.c.id.in_(ids)))
+
+
+def _unreferenced(connection, cls, ids, table, column):
+    ids = set(ids)
+    if not ids:
+        return ids
+    used = connection.execute(select([table.c[column]]).where(
+        table.c[column].in_(list(ids))).distinct())
+    return ids - set(id for id, in used)
+
+
+def remove_prints(session, print_ids):
+    """Delete prints, and the cards and mechanics only they used"""
+    if not print_ids:
+        return
+    connection = session.connection()
+    prints = tcg_tables.Print.__table__
+    card_ids = set(id for id, in connection.execute(
+        select([prints.c.card_id], prints.c.id.in_(list(print_ids)))))
+    _delete(connection, tcg_tables.Print, print_ids)
+
+    card_ids = _unreferenced(connection, tcg_tables.Card, card_ids,
+                             prints, 'card_id')
+    card_mechanics = tcg_tables.CardMechanic.__table__
+    mechanic_ids = set(id for id, in connection.execute(
+        select([card_mechanics.c.mechanic_id],
+               card_mechanics.c.card_id.in_(list(card_ids))))) \
+        if card_ids else set()
+    _delete(connection, tcg_tables.Card, card_ids)
+
+    _delete(connection, tcg_tables.Mechanic, _unreferenced(
+        connection, tcg_tables.Mechanic, mechanic_ids,
+        card_mechanics, 'mechanic_id'))
+
+
+def remove_sets(session, identifiers):
+    """Delete sets, and the prints that were in no other set"""
+    connection = session.connection()
+    sets = tcg_tables.Set.__table__
+    set_prints = tcg_tables.SetPrint.__table__
+    set_ids = [id for id, in connection.execute(
+        select([sets.c.id], sets.c.identifier.in_(list(identifiers))))]
+    if not set_ids:
+        return
+    print_ids = set(id for id, in connection.execute(
+        select([set_prints.c.print_id], set_prints.c.set_id.in_(set_ids))))
+    _delete(connection, tcg_tables.Set, set_ids)
+    remove_prints(session, _unreferenced(
+        connection, tcg_tables.Print, print_ids, set_prints, 'print_id'))
+
+
+def sync(session, other_session, print_status=None):
+    """Make session's database match other_session's
+
+    Sets that differ are deleted and imported anew from the other
+    database, as are prints not in any set. Returns the Diffs applied.
+    """
+    from ptcgdex import load as ptcg_load
+    print_status = print_status or (lambda status: None)
+    tcg_tables.create_derived_tables(session.connection())
+    old = Fingerprints(session)
+    new = Fingerprints(other_session)
+    diffs = diff(old, new)
+    set_diff = diffs[0]
+
+    stale = set_diff.removed + set_diff.changed
+    remove_sets(session, stale)
+    remove_prints(session, [old.loose_prints[key]
+                            for key in old.loose_prints
+                            if key not in new.loose_prints])
+    versions.bump(session, stale)
+
+    cache = ptcg_load.ImportCache()
+    for identifier in set_diff.added + set_diff.changed:
+        tcg_set = (other_session.query(tcg_tables.Set)
+                   .filter_by(identifier=identifier)
+                   .options(*ptcg_load.print_load_options(
+                       'set_prints.print_.'))
+                   .one())
+        info = ptcg_load.export_set(tcg_set)
+        other_session.expunge_all()
+        ptcg_load.import_set(session, info, identifier, print_status,
+                             cache=cache)
+        session.flush()
+    added_loose = [new.loose_prints[key] for key in new.loose_prints
+                   if key not in old.loose_prints]
+    for print_id in added_loose:
+        tcg_print = other_session.query(tcg_tables.Print).get(print_id)
+        ptcg_load.import_print(session, ptcg_load.export_print(tcg_print),
+                               do_commit=False, cache=cache)
+    if added_loose:
+        versions.bump(session)
+
+    ptcg_load.rebuild_derived(session)
+    session.commit()
+    return diffs
@@ -0,0 +1,207 @@
+# Encoding: UTF-8
+"""Decklist parsing and Modified legality checks
+
+A decklist has one entry per line, either a set identifier and card
+number or a print ID:
+
+    4 base-set 58
+    2 id:1234
+
+Blank lines and lines starting with '#' are ignored; a line of '---'
+starts the next deck, so one file can hold many decks.
+
+CardIndex loads everything the checks need with a few Core queries, so
+checking a deck touches no database at all. A card is legal on a date if
+it is marked legal and any print of it is: released on or before the
+date, and not banned by then. A print's own release and ban dates, if
+set, override those of its set.
+"""
+from __future__ import division, unicode_literals
+
+import re
+from collections import defaultdict, namedtuple
+from datetime import date
+
+from sqlalchemy import select
+from pokedex.db import tables as dex_tables
+
+from ptcgdex import tcg_tables
+
+DECK_SIZE = 60
+MAX_COPIES = 4
+
+DeckEntry = namedtuple('DeckEntry',
+                       'line count set_identifier number print_id')
+DeckError = namedtuple('DeckError', 'deck line message')
+
+ENTRY_RE = re.compile(r'^(\d+)\s+(?:id:(\d+)|(\S+)\s+(\S+))$')
+
+
+def parse_decks(lines):
+    """Split decklist lines into decks
+
+    Returns a list of decks; each deck is a list of DeckEntry, or of
+    (line number, message) tuples for lines that do not parse.
+    """
+    decks = [[]]
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line == '---':
+            if decks[-1]:
+                decks.append([])
+            continue
+        match = ENTRY_RE.match(line)
+        if not match:
+            decks[-1].append((line_number, 'cannot parse {!r}'.format(line)))
+            continue
+        count, print_id, set_identifier, number = match.groups()
+        decks[-1].append(DeckEntry(
+            line_number, int(count), set_identifier, number,
+            int(print_id) if print_id else None))
+    if not decks[-1]:
+        decks.pop()
+    return decks
+
+
+def _to_date(value):
+    if value is not None and hasattr(value, 'date'):
+        return value.date()
+    return value
+
+
+class CardIndex(object):
+    """Preloaded lookup tables for deck checks
+
+    prints: print id -> card id
+    set_numbers: (set identifier, number) -> print id
+    family_names: card id -> card family name (the copy-limit key)
+    windows: card id -> list of (release, ban) date pairs, either None
+    legal: ids of cards marked legal
+    basic_energy: ids of basic Energy cards (no copy limit)
+    """
+    def __init__(self, prints, set_numbers, family_names, windows, legal,
+                 basic_energy):
+        self.prints = prints
+        self.set_numbers = set_numbers
+        self.family_names = family_names
+        self.windows = windows
+        self.legal = legal
+        self.basic_energy = basic_energy
+
+    @classmethod
+    def from_session(cls, session):
+        connection = session.connection()
+        cards = tcg_tables.Card.__table__
+        prints = tcg_tables.Print.__table__
+        set_prints = tcg_tables.SetPrint.__table__
+        sets = tcg_tables.Set.__table__
+        family_names = dex_tables.metadata.tables['tcg_card_family_names']
+        classes = tcg_tables.Class.__table__
+        card_subclasses = tcg_tables.CardSubclass.__table__
+        subclasses = tcg_tables.Subclass.__table__
+
+        print_cards = dict(connection.execute(
+            select([prints.c.id, prints.c.card_id])).fetchall())
+
+        set_numbers = {}
+        windows = defaultdict(list)
+        query = select([prints.c.id, prints.c.card_id,
+                        prints.c.card_release_date, prints.c.card_ban_date,
+                        sets.c.identifier, set_prints.c.number,
+                        sets.c.release_date, sets.c.ban_date])
+        query = query.where(set_prints.c.print_id == prints.c.id)
+        query = query.where(set_prints.c.set_id == sets.c.id)
+        for row in connection.execute(query):
+            if row.number is not None:
+                set_numbers[row.identifier, row.number] = row.id
+            windows[row.card_id].append((
+                _to_date(row.card_release_date) or row.release_date,
+                _to_date(row.card_ban_date) or row.ban_date))
+
+        query = select([cards.c.id, family_names.c.name])
+        query = query.where(family_names.c.tcg_card_family_id ==
+                            cards.c.family_id)
+        query = query.where(family_names.c.local_language_id ==
+                            session.default_language_id)
+        names = dict(connection.execute(query).fetchall())
+
+        legal = set(id for id, in connection.execute(
+            select([cards.c.id], cards.c.legal == True)))
+
+        query = select([cards.c.id])
+        query = query.where(cards.c.class_id == classes.c.id)
+        query = query.where(classes.c.identifier == 'energy')
+        query = query.where(card_subclasses.c.card_id == cards.c.id)
+        query = query.where(card_subclasses.c.subclass_id == subclasses.c.id)
+        query = query.where(subclasses.c.identifier == 'basic')
+        basic_energy = set(id for id, in connection.execute(query))
+
+        return cls(print_cards, set_numbers, names, dict(windows), legal,
+                   basic_energy)
+
+    def resolve(self, entry):
+        """Return the card id for a DeckEntry, or None"""
+        if entry.print_id is not None:
+            return self.prints.get(entry.print_id)
+        print_id = self.set_numbers.get((entry.set_identifier, entry.number))
+        return self.prints.get(print_id)
+
+    def is_legal(self, card_id, on_date):
+        if card_id not in self.legal:
+            return False
+        for release, ban in self.windows.get(card_id, ()):
+            if release is not None and release > on_date:
+                continue
+            if ban is not None and ban <= on_date:
+                continue
+            return True
+        return False
+
+
+def check_deck(index, entries, on_date=None, deck=None):
+    """Return a list of DeckErrors for one parsed deck"""
+    if on_date is None:
+        on_date = date.today()
+    errors = []
+    total = 0
+    copies = defaultdict(int)
+    first_line = {}
+    for entry in entries:
+        if not isinstance(entry, DeckEntry):
+            errors.append(DeckError(deck, entry[0], entry[1]))
+            continue
+        total += entry.count
+        card_id = index.resolve(entry)
+        if card_id is None:
+            if entry.print_id is not None:
+                message = 'unknown print id {}'.format(entry.print_id)
+            else:
+                message = 'no card {} in set {}'.format(
+                    entry.number, entry.set_identifier)
+            errors.append(DeckError(deck, entry.line, message))
+            continue
+        name = index.family_names.get(card_id)
+        if not index.is_legal(card_id, on_date):
+            errors.append(DeckError(deck, entry.line,
+                '{} is not legal in Modified on {}'.format(
+                    name, on_date.isoformat())))
+        if card_id not in index.basic_energy:
+            copies[name] += entry.count
+            first_line.setdefault(name, entry.line)
+    for name, count in sorted(copies.items()):
+        if count > MAX_COPIES:
+            errors.append(DeckError(deck, first_line[name],
+                '{} copies of {}; at most {} are allowed'.format(
+                    count, name, MAX_COPIES)))
+    if total != DECK_SIZE:
+        errors.append(DeckError(deck, None,
+            'deck has {} cards, not {}'.format(total, DECK_SIZE)))
+    return errors
+
+
+def check_decks(index, decks, on_date=None):
+    """Check many (label, entries) decks; return {label: [DeckError]}"""
+    return dict((label, check_deck(index, entries, on_date, label))
+                for label, entries in decks)
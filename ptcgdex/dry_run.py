@@ -0,0 +1,167 @@
+# Encoding: UTF-8
+"""Previewing what an import would do, without writing anything
+
+The database's existing families, illustrators, subclasses, mechanics and
+cards are loaded once into an in-memory index, keyed the way the importer
+matches them (names, identifiers, and export fingerprints). The documents
+are then walked against that index, counting the rows each table would
+get. The rules for names, costs, flavors, set identifiers and checkpoints
+are the importer's own functions from ptcgdex.load.
+
+The runtime estimate scales the seconds per print of earlier imports, as
+recorded in tcg_import_checkpoints, to the number of prints planned.
+"""
+from __future__ import division, unicode_literals
+
+import hashlib
+from collections import Counter
+
+import yaml
+from sqlalchemy import func, inspect, select
+from pokedex.db import tables as dex_tables
+
+from ptcgdex import tcg_tables
+from ptcgdex import load as ptcg_load
+
+
+def _names(connection, table_name, language_id):
+    table = dex_tables.metadata.tables[table_name]
+    return set(name for name, in connection.execute(select(
+        [table.c.name], table.c.local_language_id == language_id)))
+
+
+class ExistingIndex(object):
+    """Keys of the entities an import could reuse"""
+    def __init__(self, session):
+        connection = session.connection()
+        language_id = session.default_language_id
+        self.families = _names(connection, 'tcg_card_family_names',
+                               language_id)
+        self.subclasses = _names(connection, 'tcg_subclass_names',
+                                 language_id)
+        illustrators = tcg_tables.Illustrator.__table__
+        self.illustrators = set(identifier for identifier, in
+                                connection.execute(select(
+                                    [illustrators.c.identifier])))
+        self.mechanics = set(
+            ptcg_load.mechanic_fingerprints(session).values())
+        self.cards = set(ptcg_load.card_fingerprints(session).values())
+        session.expunge_all()
+
+
+class Plan(object):
+    """Planned inserts per table, and reuse counts per kind of entity"""
+    def __init__(self, index):
+        self.index = index
+        self.inserts = Counter()
+        self.reused = Counter()
+
+    def _family(self, name):
+        name = ptcg_load.family_name(name)
+        if name in self.index.families:
+            self.reused['families'] += 1
+        else:
+            self.index.families.add(name)
+            self.inserts['tcg_card_families'] += 1
+
+    def _mechanic(self, mechanic_info):
+        key = ptcg_load.fingerprint(mechanic_info)
+        if key in self.index.mechanics:
+            self.reused['mechanics'] += 1
+            return
+        self.index.mechanics.add(key)
+        self.inserts['tcg_mechanics'] += 1
+        self.inserts['tcg_mechanic_costs'] += len(
+            ptcg_load.cost_runs(mechanic_info.get('cost', '')))
+
+    def card(self, card_info):
+        key = ptcg_load.fingerprint(card_info)
+        if key in self.index.cards:
+            self.reused['cards'] += 1
+            return
+        self._family(card_info['name'])
+        self.index.cards.add(key)
+        self.inserts['tcg_cards'] += 1
+        for mechanic_info in card_info.get('mechanics', ()):
+            self._mechanic(mechanic_info)
+        self.inserts['tcg_card_mechanics'] += len(
+            card_info.get('mechanics', ()))
+        self.inserts['tcg_card_types'] += len(card_info.get('types', ()))
+        self.inserts['tcg_damage_modifiers'] += len(
+            card_info.get('damage modifiers', ()))
+        for name in card_info.get('subclasses', ()):
+            if name not in self.index.subclasses:
+                self.index.subclasses.add(name)
+                self.inserts['tcg_subclasses'] += 1
+        self.inserts['tcg_card_subclasses'] += len(
+            card_info.get('subclasses', ()))
+        for key in 'evolves from', 'evolves into':
+            for name in card_info.get(key, ()):
+                self._family(name)
+                self.inserts['tcg_evolutions'] += 1
+
+    def print_(self, card_info):
+        self.card(ptcg_load.card_part(card_info))
+        self.inserts['tcg_prints'] += 1
+        self.inserts['tcg_scans'] += 1
+        for name in card_info.get('illustrators', ()):
+            identifier = ptcg_load.identifier_from_name(name)
+            if identifier in self.index.illustrators:
+                self.reused['illustrators'] += 1
+            else:
+                self.index.illustrators.add(identifier)
+                self.inserts['tcg_illustrators'] += 1
+            self.inserts['tcg_print_illustrators'] += 1
+        if ptcg_load.has_flavor(card_info):
+            self.inserts['tcg_pokemon_flavors'] += 1
+
+    def document(self, info, identifier=None):
+        """Plan one YAML document: a set or a loose print"""
+        if 'cards' not in info:
+            self.print_(info)
+            return
+        if ptcg_load.set_identifier(info, identifier) is not None:
+            self.inserts['tcg_sets'] += 1
+            self.inserts['tcg_set_prints'] += len(info['cards'])
+        for entry in info['cards']:
+            self.print_(entry['card'])
+
+    def add_file(self, session, fileobj, label, identifier=None,
+                 resume=False):
+        """Plan the documents of a file
+
+        With `resume`, documents an earlier import of the same file
+        committed are skipped, as `import --resume` would; like the import,
+        this fails if the file changed since.
+        """
+        content = fileobj.read()
+        skip = set()
+        if resume and identifier is not None and _has_checkpoints(session):
+            checksum = hashlib.sha1(content).hexdigest()
+            skip = ptcg_load.completed_documents(session, identifier,
+                                                 checksum, label)
+        for i, info in enumerate(yaml.safe_load_all(content)):
+            if i not in skip:
+                self.document(info, identifier)
+
+    @property
+    def prints(self):
+        return self.inserts['tcg_prints']
+
+
+def _has_checkpoints(session):
+    table_names = inspect(session.connection()).get_table_names()
+    return tcg_tables.ImportCheckpoint.__tablename__ in table_names
+
+
+def seconds_per_print(session):
+    """Return the mean import time per print of earlier imports, or None"""
+    checkpoints = tcg_tables.ImportCheckpoint.__table__
+    if not _has_checkpoints(session):
+        return None
+    duration, prints = session.connection().execute(select(
+        [func.sum(checkpoints.c.duration),
+         func.sum(checkpoints.c.prints)])).fetchone()
+    if not prints:
+        return None
+    return duration / prints
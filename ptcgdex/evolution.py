@@ -0,0 +1,153 @@
+# Encoding: UTF-8
+"""Evolution lines, through the tcg_evolution_closure table
+
+A card's "evolves from" entry is an edge from that family to the card's
+family; "evolves into" is an edge the other way. The closure table holds
+every (ancestor, descendant) pair of the resulting graph with the
+shortest distance between them, so evolution lines can be read with one
+indexed query instead of walking the ORM graph.
+"""
+from __future__ import division, unicode_literals
+
+from collections import defaultdict, deque
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased, joinedload, subqueryload_all
+
+from ptcgdex import tcg_tables
+
+closure_table = tcg_tables.EvolutionClosure.__table__
+
+
+def edges(connection, card_ids=None):
+    """Return the set of (ancestor, descendant) family id pairs
+
+    If card_ids is given, only evolutions printed on those cards are used.
+    """
+    evolutions = tcg_tables.Evolution.__table__
+    cards = tcg_tables.Card.__table__
+    query = select([evolutions.c.family_id, evolutions.c.family_to_card,
+                    cards.c.family_id],
+                   evolutions.c.card_id == cards.c.id)
+    if card_ids is not None:
+        query = query.where(cards.c.id.in_(card_ids))
+    result = set()
+    for other, family_to_card, own in connection.execute(query):
+        if other == own:
+            continue
+        if family_to_card:
+            result.add((other, own))
+        else:
+            result.add((own, other))
+    return result
+
+
+def rebuild(session):
+    """Recompute the whole closure table from tcg_evolutions"""
+    connection = session.connection()
+    children = defaultdict(set)
+    for ancestor, descendant in edges(connection):
+        children[ancestor].add(descendant)
+        children[descendant]
+    rows = []
+    for start in children:
+        depths = {start: 0}
+        queue = deque([start])
+        while queue:
+            family = queue.popleft()
+            for child in children[family]:
+                if child not in depths:
+                    depths[child] = depths[family] + 1
+                    queue.append(child)
+        rows.extend(dict(ancestor_id=start, descendant_id=descendant,
+                         depth=depth)
+                    for descendant, depth in depths.items())
+    connection.execute(closure_table.delete())
+    if rows:
+        connection.execute(closure_table.insert(), rows)
+
+
+def add_edges(session, new_edges):
+    """Update the closure table for newly added (ancestor, descendant) edges
+    """
+    connection = session.connection()
+    c = closure_table.c
+    for ancestor, descendant in new_edges:
+        above = dict(connection.execute(
+            select([c.ancestor_id, c.depth], c.descendant_id == ancestor)))
+        above.setdefault(ancestor, 0)
+        below = dict(connection.execute(
+            select([c.descendant_id, c.depth], c.ancestor_id == descendant)))
+        below.setdefault(descendant, 0)
+        existing = {}
+        for upper, lower, depth in connection.execute(select(
+                [c.ancestor_id, c.descendant_id, c.depth],
+                c.ancestor_id.in_(above) & c.descendant_id.in_(below))):
+            existing[upper, lower] = depth
+        inserts = []
+        for family in ancestor, descendant:
+            if (family, family) not in existing:
+                existing[family, family] = 0
+                inserts.append(dict(ancestor_id=family,
+                                    descendant_id=family, depth=0))
+        for upper, upper_depth in above.items():
+            for lower, lower_depth in below.items():
+                depth = upper_depth + 1 + lower_depth
+                old_depth = existing.get((upper, lower))
+                if old_depth is None:
+                    inserts.append(dict(ancestor_id=upper,
+                                        descendant_id=lower, depth=depth))
+                elif depth < old_depth:
+                    connection.execute(closure_table.update().where(
+                        (c.ancestor_id == upper) & (c.descendant_id == lower)
+                    ).values(depth=depth))
+        if inserts:
+            connection.execute(closure_table.insert(), inserts)
+
+
+def _line_subquery(session, family):
+    """Families sharing an ancestor with `family`, with their generation"""
+    upper = aliased(tcg_tables.EvolutionClosure)
+    lower = aliased(tcg_tables.EvolutionClosure)
+    query = session.query(lower.descendant_id.label('family_id'),
+                          func.max(lower.depth).label('generation'))
+    query = query.join(upper, upper.ancestor_id == lower.ancestor_id)
+    query = query.filter(upper.descendant_id == family.id)
+    query = query.group_by(lower.descendant_id)
+    return query.subquery()
+
+
+def evolution_line(session, family):
+    """Return [(family, generation)] for the whole line `family` belongs to
+
+    Generation 0 is the line's first stage. Branches (e.g. all of Eevee's
+    evolutions) are included.
+    """
+    line = _line_subquery(session, family)
+    query = session.query(tcg_tables.CardFamily, line.c.generation)
+    query = query.join(line, line.c.family_id == tcg_tables.CardFamily.id)
+    query = query.order_by(line.c.generation,
+                           tcg_tables.CardFamily.identifier)
+    return query.all() or [(family, 0)]
+
+
+def line_cards(session, family):
+    """Return a query for all cards in `family`'s evolution line"""
+    line = _line_subquery(session, family)
+    query = session.query(tcg_tables.Card)
+    query = query.filter(tcg_tables.Card.family_id.in_(
+        select([line.c.family_id])) | (tcg_tables.Card.family_id == family.id))
+    return query
+
+
+def line_set_prints(session, family):
+    """Return a query for the set prints of all cards in `family`'s line
+
+    Sets and card families are loaded eagerly, for listing the prints.
+    """
+    cards = line_cards(session, family).with_entities(tcg_tables.Card.id)
+    query = session.query(tcg_tables.SetPrint)
+    query = query.join(tcg_tables.SetPrint.print_)
+    query = query.filter(tcg_tables.Print.card_id.in_(cards.subquery()))
+    return query.options(joinedload('set'),
+                         subqueryload_all('print_.card.family.names'))
@@ -0,0 +1,104 @@
+# Encoding: UTF-8
+"""On-disk cache of rendered YAML exports
+
+Entries live in an SQLite file and are keyed by what was exported (e.g.
+"set:base-set") together with the data version token of that data; a
+changed token is simply a miss. Least recently used entries are evicted
+once the cache grows past its size limit.
+"""
+from __future__ import division, unicode_literals
+
+import os
+import time
+import sqlite3
+import hashlib
+
+from ptcgdex.cache import default_cache_dir
+
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    key TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL,
+    data BLOB NOT NULL
+)
+"""
+
+
+def default_path():
+    return os.path.join(default_cache_dir(), 'exports.sqlite')
+
+
+class ExportCache(object):
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES, scope=''):
+        """`scope` separates entries of different databases"""
+        if path is None:
+            path = default_path()
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(SCHEMA)
+        self.max_bytes = max_bytes
+        self.scope = hashlib.sha1(scope.encode('utf-8')).hexdigest()[:12]
+
+    def _key(self, key):
+        return '{}:{}'.format(self.scope, key)
+
+    def get(self, key, token):
+        """Return the cached text for key at this token, or None"""
+        row = self.connection.execute(
+            'SELECT token, data FROM exports WHERE key = ?',
+            (self._key(key), )).fetchone()
+        if row is None or row[0] != token:
+            return None
+        with self.connection:
+            self.connection.execute(
+                'UPDATE exports SET used = ? WHERE key = ?',
+                (time.time(), self._key(key)))
+        return bytes(row[1])
+
+    def put(self, key, token, data):
+        """Store rendered data (a byte string)"""
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO exports VALUES (?, ?, ?, ?, ?)',
+                (self._key(key), token, len(data), time.time(),
+                 sqlite3.Binary(data)))
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until under max_bytes"""
+        total, = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM exports').fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute(
+            'SELECT key, size FROM exports ORDER BY used').fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key, ))
+            total -= size
+        self.connection.executemany('DELETE FROM exports WHERE key = ?',
+                                    doomed)
+
+    def fetch(self, key, token, render):
+        """Return the cached text, or render(), cache and return it
+
+        With no token (no version data), always renders.
+        """
+        if token is None:
+            return render()
+        data = self.get(key, token)
+        if data is None:
+            data = render()
+            self.put(key, token, data)
+        return data
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,208 @@
+# Encoding: UTF-8
+"""Find (and merge) mechanics whose effect texts are near duplicates
+
+Effect texts are normalized (straight quotes, single spaces, lower case),
+cut into word shingles and summarized by MinHash signatures. Locality-
+sensitive hashing over bands of the signatures proposes candidate pairs
+in near-linear time; each candidate is then confirmed with the exact
+Jaccard similarity of the shingle sets.
+
+Mechanics in a cluster are only merged when they are duplicates in every
+respect: same class, normalized name, cost and damage, and the same
+normalized effect text. Other near duplicates are just reported.
+"""
+from __future__ import division, unicode_literals
+
+import re
+import random
+import zlib
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import select
+from pokedex.db import tables as dex_tables
+
+from ptcgdex import tcg_tables
+from ptcgdex import versions
+
+SHINGLE_SIZE = 3
+NUM_HASHES = 64
+BANDS = 16  # of NUM_HASHES // BANDS rows each
+DEFAULT_THRESHOLD = 0.8
+MERSENNE_PRIME = (1 << 61) - 1
+
+QUOTES = {'‘': "'", '’': "'", '“': '"', '”': '"', '—': '-', '–': '-'}
+QUOTES_RE = re.compile('|'.join(QUOTES))
+SPACE_RE = re.compile(r'\s+')
+
+MechanicText = namedtuple('MechanicText',
+                          'id class_id name cost damage effect')
+Cluster = namedtuple('Cluster', 'mechanics similarity mergeable')
+
+
+def normalize(text):
+    if text is None:
+        return ''
+    text = QUOTES_RE.sub(lambda match: QUOTES[match.group()], text)
+    return SPACE_RE.sub(' ', text).strip().lower()
+
+
+def shingles(text):
+    words = text.split()
+    if len(words) <= SHINGLE_SIZE:
+        return set([' '.join(words)])
+    return set(' '.join(words[i:i + SHINGLE_SIZE])
+               for i in range(len(words) - SHINGLE_SIZE + 1))
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHashLSH(object):
+    """MinHash signatures with banded LSH buckets"""
+    def __init__(self, num_hashes=NUM_HASHES, bands=BANDS, seed=0):
+        rng = random.Random(seed)
+        self.coefficients = [(rng.randrange(1, MERSENNE_PRIME),
+                              rng.randrange(0, MERSENNE_PRIME))
+                             for i in range(num_hashes)]
+        self.rows = num_hashes // bands
+        self.buckets = defaultdict(list)
+
+    def signature(self, shingle_set):
+        hashes = [zlib.crc32(s.encode('utf-8')) & 0xffffffff
+                  for s in shingle_set]
+        return [min((a * h + b) % MERSENNE_PRIME for h in hashes)
+                for a, b in self.coefficients]
+
+    def add(self, key, shingle_set):
+        signature = self.signature(shingle_set)
+        for start in range(0, len(signature), self.rows):
+            band = (start, ) + tuple(signature[start:start + self.rows])
+            self.buckets[band].append(key)
+
+    def candidate_pairs(self):
+        pairs = set()
+        for keys in self.buckets.values():
+            for i, first in enumerate(keys):
+                for second in keys[i + 1:]:
+                    pairs.add((min(first, second), max(first, second)))
+        return pairs
+
+
+def mechanic_texts(session):
+    """Return a MechanicText for every mechanic with an effect"""
+    connection = session.connection()
+    language_id = session.default_language_id
+    mechanics = tcg_tables.Mechanic.__table__
+    costs = tcg_tables.MechanicCost.__table__
+    types = tcg_tables.TCGType.__table__
+    names = dex_tables.metadata.tables['tcg_mechanic_names']
+    effects = dex_tables.metadata.tables['tcg_mechanic_effects']
+
+    name_of = dict(connection.execute(select(
+        [names.c.tcg_mechanic_id, names.c.name],
+        names.c.local_language_id == language_id)).fetchall())
+    cost_of = defaultdict(unicode)
+    for mechanic_id, initial, amount in connection.execute(select(
+            [costs.c.mechanic_id, types.c.initial, costs.c.amount],
+            costs.c.type_id == types.c.id,
+            order_by=[costs.c.mechanic_id, costs.c.order])):
+        cost_of[mechanic_id] += initial * amount
+    query = select([mechanics.c.id, mechanics.c.class_id,
+                    mechanics.c.damage_base, mechanics.c.damage_modifier,
+                    effects.c.effect],
+                   (effects.c.tcg_mechanic_id == mechanics.c.id) &
+                   (effects.c.local_language_id == language_id),
+                   order_by=mechanics.c.id)
+    return [MechanicText(id, class_id, name_of.get(id), cost_of[id],
+                         (damage_base, damage_modifier), effect)
+            for id, class_id, damage_base, damage_modifier, effect
+            in connection.execute(query) if effect]
+
+
+def _find(parents, item):
+    while parents[item] != item:
+        parents[item] = parents[parents[item]]
+        item = parents[item]
+    return item
+
+
+def find_clusters(texts, threshold=DEFAULT_THRESHOLD):
+    """Group MechanicTexts whose effects are at least `threshold` similar
+    """
+    by_id = dict((text.id, text) for text in texts)
+    shingle_sets = {}
+    lsh = MinHashLSH()
+    for text in texts:
+        shingle_sets[text.id] = shingles(normalize(text.effect))
+        lsh.add(text.id, shingle_sets[text.id])
+
+    parents = dict((id, id) for id in by_id)
+    similarity = {}
+    for first, second in lsh.candidate_pairs():
+        score = jaccard(shingle_sets[first], shingle_sets[second])
+        if score >= threshold:
+            root_a, root_b = _find(parents, first), _find(parents, second)
+            if root_a != root_b:
+                parents[max(root_a, root_b)] = min(root_a, root_b)
+            similarity[first, second] = score
+
+    groups = defaultdict(list)
+    for id in by_id:
+        groups[_find(parents, id)].append(by_id[id])
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda text: text.id)
+        ids = set(text.id for text in members)
+        scores = [score for (a, b), score in similarity.items() if a in ids]
+        clusters.append(Cluster(members, min(scores), _mergeable(members)))
+    clusters.sort(key=lambda cluster: cluster.mechanics[0].id)
+    return clusters
+
+
+def _identity(text):
+    return (text.class_id, normalize(text.name), text.cost, text.damage,
+            normalize(text.effect))
+
+
+def _mergeable(members):
+    """Return lists of mechanics in `members` that are true duplicates"""
+    groups = defaultdict(list)
+    for text in members:
+        groups[_identity(text)].append(text.id)
+    return [ids for ids in groups.values() if len(ids) > 1]
+
+
+def merge_duplicates(session, duplicate_ids):
+    """Point card mechanics at the first of each list of duplicate ids and
+    delete the rest; return the number of mechanics removed"""
+    connection = session.connection()
+    card_mechanics = tcg_tables.CardMechanic.__table__
+    removed = 0
+    for ids in duplicate_ids:
+        keep, others = min(ids), sorted(set(ids) - set([min(ids)]))
+        connection.execute(card_mechanics.update().where(
+            card_mechanics.c.mechanic_id.in_(others)).values(mechanic_id=keep))
+        for table in [tcg_tables.MechanicCost.__table__] + [
+                cls.__table__
+                for cls in tcg_tables.Mechanic.translation_classes]:
+            connection.execute(table.delete().where(
+                table.c[_mechanic_column(table)].in_(others)))
+        mechanics = tcg_tables.Mechanic.__table__
+        connection.execute(mechanics.delete().where(
+            mechanics.c.id.in_(others)))
+        removed += len(others)
+    if removed:
+        versions.bump_all_sets(session)
+    return removed
+
+
+def _mechanic_column(table):
+    [column] = [column.name for column in table.c
+                for foreign_key in column.foreign_keys
+                if foreign_key.column.table is tcg_tables.Mechanic.__table__]
+    return column
@@ -1,13 +1,21 @@
 # Encoding: UTF-8
 from __future__ import division, unicode_literals
 
+import io
 import os
+import sys
+import json
 import time
+import hashlib
+import resource
 import re
 from collections import namedtuple, OrderedDict
 from datetime import datetime
 
 import yaml
+from sqlalchemy import text, inspect
+from sqlalchemy.schema import AddConstraint, ForeignKeyConstraint
+from sqlalchemy.types import String
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm import (
     joinedload, joinedload_all, subqueryload, subqueryload_all)
@@ -17,6 +25,11 @@ from pokedex.db import util, multilang
 import pokedex.db
 
 from ptcgdex import tcg_tables
+from ptcgdex import evolution
+from ptcgdex import names
+from ptcgdex import reprints
+from ptcgdex import set_stats
+from ptcgdex import versions
 
 NOTHING = object()
 
@@ -90,32 +103,271 @@ def identifier_from_name(name):
     name = name.replace('δ', 'delta')
     return pokedex.db.identifier_from_name(name)
 
-def get_family(session, en, name):
+def fingerprint(info):
+    """Return a hashable key for a card or mechanic info dict"""
+    return json.dumps(info, sort_keys=True)
+
+def peak_memory():
+    """Return the peak resident set size of this process, in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+
+class ImportCache(object):
+    """Ids of entities that later cards of an import are likely to reuse
+
+    Only ids are kept, so the session can be cleared after each document
+    without losing the lookups. New objects are registered with `remember`
+    and get their ids recorded on the next `flushed` call.
+    """
+    def __init__(self):
+        self.families = {}  # name -> id
+        self.illustrators = {}  # identifier -> id
+        self.mechanics = {}  # fingerprint -> id
+        self.cards = {}  # fingerprint -> id
+        self.new_evolutions = set()  # (ancestor, descendant) family ids
+        self.new_set_ids = set()  # sets whose stats are out of date
+        self.name_indexes = None  # built on first use
+        self.near_duplicates = []  # (kind, new name, [similar names])
+        self._pending = []
+        self._pending_evolutions = []
+
+    def get(self, session, table, mapping, key):
+        try:
+            ident = mapping[key]
+        except KeyError:
+            return None
+        return session.query(table).get(ident)
+
+    def remember(self, mapping, key, entity):
+        if entity.id is None:
+            self._pending.append((mapping, key, entity))
+        else:
+            mapping[key] = entity.id
+
+    def add_evolution(self, ancestor, descendant):
+        self._pending_evolutions.append((ancestor, descendant))
+
+    def flushed(self):
+        for mapping, key, entity in self._pending:
+            mapping[key] = entity.id
+        del self._pending[:]
+        for ancestor, descendant in self._pending_evolutions:
+            self.new_evolutions.add((ancestor.id, descendant.id))
+        del self._pending_evolutions[:]
+
+    def check_new_name(self, session, kind, name):
+        """Note a new family/mechanic/illustrator name similar to known ones
+        """
+        if self.name_indexes is None:
+            self.name_indexes = names.build_indexes(session)
+        index = self.name_indexes[kind]
+        if name is None or name in index:
+            return
+        similar = index.near_duplicates(name)
+        if similar:
+            self.near_duplicates.append((kind, name, similar))
+        index.add(name)
+
+    def update_derived(self, session):
+        """Bring derived tables up to date with what was imported so far"""
+        evolution.add_edges(session, sorted(self.new_evolutions))
+        self.new_evolutions.clear()
+        set_stats.refresh(session, self.new_set_ids)
+        reprints.refresh(session, self.new_set_ids)
+        self.new_set_ids.clear()
+
+
+def rebuild_derived(session):
+    """Recompute all derived tables from the card data"""
+    evolution.rebuild(session)
+    set_stats.rebuild(session)
+    reprints.rebuild(session)
+
+
+def family_name(name):
+    """Return the name a card family is stored under"""
     if name == 'Ho-oh':
         # Standardize Ho-Oh capitaliation
         name = 'Ho-Oh'  # TODO
+    return name
+
+def get_family(session, en, name, cache=None):
+    name = family_name(name)
+    if cache:
+        family = cache.get(session, tcg_tables.CardFamily, cache.families,
+                           name)
+        if family:
+            return family
     try:
-        return util.get(session, tcg_tables.CardFamily,
-                        name=name)
+        family = util.get(session, tcg_tables.CardFamily,
+                          name=name)
     except NoResultFound:
         family = tcg_tables.CardFamily()
         family.name_map[en] = name
         family.identifier = identifier_from_name(name)
         session.add(family)
+        if cache:
+            cache.check_new_name(session, 'family', name)
+    if cache:
+        cache.remember(cache.families, name, family)
     return family
 
-def get_illustrator(session, en, name):
+def get_illustrator(session, en, name, cache=None):
     identifier = identifier_from_name(name)
+    if cache:
+        entity = cache.get(session, tcg_tables.Illustrator,
+                           cache.illustrators, identifier)
+        if entity:
+            return entity
     try:
-        return util.get(session, tcg_tables.Illustrator, identifier)
+        entity = util.get(session, tcg_tables.Illustrator, identifier)
     except NoResultFound:
         entity = tcg_tables.Illustrator()
         entity.name = name
         entity.identifier = identifier
         session.add(entity)
+        if cache:
+            cache.check_new_name(session, 'illustrator', name)
+    if cache:
+        cache.remember(cache.illustrators, identifier, entity)
     return entity
 
 
+def reference_tables():
+    """Tables an import needs to look things up in, but never writes to"""
+    tables = []
+    for cls in (dex_tables.Language, dex_tables.PokemonSpecies,
+                tcg_tables.TCGType, tcg_tables.Class, tcg_tables.Stage,
+                tcg_tables.MechanicClass, tcg_tables.Rarity):
+        tables.append(cls.__table__)
+        tables.extend(t.__table__ for t in cls.translation_classes)
+    return tables
+
+def make_scratch_session(source_session, uri='sqlite://'):
+    """Make a session on an empty TCG database seeded with reference data
+
+    The reference tables (languages, species, and the CSV-loaded TCG tables)
+    are copied over from `source_session`; all card tables are left empty.
+    """
+    session = pokedex.db.connect(uri)
+    bind = session.get_bind()
+    seeded = reference_tables()
+    card_tables = [t.__table__ for t in tcg_tables.tcg_classes]
+    for cls in tcg_tables.tcg_classes:
+        card_tables.extend(t.__table__ for t in cls.translation_classes)
+    source = source_session.connection()
+    for table in seeded + card_tables:
+        table.create(bind=bind, checkfirst=True)
+    for table in seeded:
+        rows = [dict(row) for row in source.execute(table.select())]
+        if rows:
+            bind.execute(table.insert(), rows)
+    return session
+
+
+COPY_ESCAPES = [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]
+
+def _copy_value(value):
+    """Format a value for PostgreSQL's COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    value = unicode(value)
+    for char, escaped in COPY_ESCAPES:
+        value = value.replace(char, escaped)
+    return value
+
+def copy_rows(connection, table, columns, rows):
+    """Stream rows into a PostgreSQL table with COPY FROM STDIN"""
+    buf = io.BytesIO()
+    for row in rows:
+        line = '\t'.join(_copy_value(value) for value in row) + '\n'
+        buf.write(line.encode('utf-8'))
+    buf.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert('COPY {} ({}) FROM STDIN'.format(
+        table.name, ', '.join('"{}"'.format(c) for c in columns)), buf)
+
+def reset_sequences(connection, tables):
+    """Move PostgreSQL id sequences past ids that were inserted explicitly"""
+    for table in tables:
+        if 'id' not in table.c or not table.c.id.autoincrement:
+            continue
+        connection.execute(text(
+            "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+            "coalesce(max(id), 0) + 1, false) FROM {}".format(table.name)),
+            table=table.name)
+
+def copy_from_csv(session, directory, table_names, drop_tables=False,
+                  verbose=True):
+    """Load CSV files into PostgreSQL with COPY FROM STDIN
+
+    Foreign keys and non-unique indexes of the loaded tables are dropped
+    and rebuilt after all data is in; recreating a foreign key checks it.
+    """
+    print_start, print_status, print_done = dex_load._get_verbose_prints(
+        verbose)
+    names = set(table_names)
+    tables = [t for t in dex_tables.metadata.sorted_tables if t.name in names]
+    connection = session.connection()
+    if drop_tables:
+        for table in reversed(tables):
+            table.drop(connection, checkfirst=True)
+    for table in tables:
+        table.create(connection, checkfirst=True)
+    inspector = inspect(connection)
+    for table in tables:
+        for fk in inspector.get_foreign_keys(table.name):
+            connection.execute('ALTER TABLE {} DROP CONSTRAINT "{}"'.format(
+                table.name, fk['name']))
+    foreign_keys = [constraint for table in tables
+                    for constraint in table.constraints
+                    if isinstance(constraint, ForeignKeyConstraint)]
+    indexes = [index for table in tables for index in table.indexes
+               if not index.unique]
+    for index in indexes:
+        index.drop(connection)
+
+    cursor = connection.connection.cursor()
+    for table in tables:
+        print_start(table.name)
+        path = os.path.join(directory, table.name + '.csv')
+        try:
+            csvfile = open(path, 'rb')
+        except IOError:
+            print_done('missing?')
+            continue
+        with csvfile:
+            columns = csvfile.readline().decode('utf-8').strip().split(',')
+            csvfile.seek(0)
+            # Empty strings in NOT NULL text columns must not become NULL
+            not_null = [c for c in columns
+                        if not table.c[c].nullable and
+                        isinstance(table.c[c].type, String)]
+            command = 'COPY {} ({}) FROM STDIN WITH CSV HEADER'.format(
+                table.name, ', '.join('"{}"'.format(c) for c in columns))
+            if not_null:
+                command += ' FORCE NOT NULL {}'.format(
+                    ', '.join('"{}"'.format(c) for c in not_null))
+            cursor.copy_expert(command, csvfile)
+        print_done()
+
+    print_start('Rebuilding indexes and foreign keys')
+    for index in indexes:
+        index.create(connection)
+    for constraint in foreign_keys:
+        connection.execute(AddConstraint(constraint))
+    reset_sequences(connection, tables)
+    session.commit()
+    print_done()
+
+
 def assert_dicts_equal(a, b):
     if a != b:
         for key in sorted(set(a) | set(b)):
@@ -124,34 +376,93 @@ def assert_dicts_equal(a, b):
                 print yaml_dump({key: [ai, bi]})
         assert a == b
 
-def import_(session, fileobj, label, identifier=None, verbose=True):
+def completed_documents(session, identifier, checksum, label):
+    """Return the indexes of a file's documents an earlier import committed
+
+    Raises ValueError if the file changed since.
+    """
+    completed = set()
+    query = session.query(tcg_tables.ImportCheckpoint)
+    query = query.filter_by(identifier=identifier)
+    for checkpoint in query:
+        if checkpoint.checksum != checksum:
+            raise ValueError(
+                '{} changed since it was partially imported'.format(label))
+        completed.add(checkpoint.document)
+    return completed
+
+
+def import_(session, fileobj, label, identifier=None, verbose=True,
+            resume=False, cache=None):
+    """Import cards from a YAML file
+
+    Each document is committed on its own, together with an
+    ImportCheckpoint row.
+    With `resume`, documents already checkpointed for an identical file are
+    skipped, so an interrupted import can be restarted.
+
+    The session is cleared after each commit to keep memory use flat;
+    entities later documents may reuse are found through `cache`, which
+    can be shared between calls.
+    """
+    if cache is None:
+        cache = ImportCache()
     prints = dex_load._get_verbose_prints(verbose)
     print_start, print_status, print_done = prints
     print_start(label)
-    infos = list(yaml.safe_load_all(fileobj))
+    content = fileobj.read()
+    checksum = hashlib.sha1(content).hexdigest()
+    infos = list(yaml.safe_load_all(content))
+    completed = set()
+    if resume and identifier is not None:
+        completed = completed_documents(session, identifier, checksum, label)
     def _status_printer(x):
         if len(infos) == 1:
             print_status(x)
         else:
             print_status('{}/{} {}'.format(i, len(infos), x))
     for i, info in enumerate(infos):
+        if i in completed:
+            continue
+        start = time.time()
         if 'cards' in info:
-            import_set(session, info, identifier, _status_printer)
+            import_set(session, info, identifier, _status_printer, cache)
+            num_prints = len(info['cards'])
         else:
             _status_printer(info.get('name'))
-            import_print(session, info, do_commit=False)
-    session.commit()
-    print_done()
+            import_print(session, info, do_commit=False, cache=cache)
+            versions.bump(session)
+            num_prints = 1
+        if identifier is not None:
+            session.merge(tcg_tables.ImportCheckpoint(
+                identifier=identifier,
+                document=i,
+                checksum=checksum,
+                prints=num_prints,
+                duration=time.time() - start,
+                completed=datetime.now(),
+            ))
+        cache.update_derived(session)
+        session.commit()
+        session.expunge_all()
+    if completed:
+        print_done('resumed after {} documents'.format(len(completed)))
+    else:
+        print_done()
 
 
-def import_set(session, info, identifier=None, print_status=None):
+def set_identifier(info, identifier=None):
+    """Return the identifier a set document is stored under, or None"""
+    if 'name' in info:
+        return identifier_from_name(info['name'])
+    return identifier
+
+
+def import_set(session, info, identifier=None, print_status=None, cache=None):
     tcg_set = tcg_tables.Set()
     en = session.query(dex_tables.Language).get(session.default_language_id)
-    if 'name' in info:
-        tcg_set.name_map[en] = info['name']
-        identifier = identifier_from_name(info['name'])
-    else:
-        tcg_set.name_map[en] = identifier
+    tcg_set.name_map[en] = info.get('name', identifier)
+    identifier = set_identifier(info, identifier)
     if identifier is None:
         tcg_set = None
     else:
@@ -182,7 +493,7 @@ def import_set(session, info, identifier=None, print_status=None):
     for i, c_info in enumerate(info['cards']):
         card = c_info['card']
         print_status('{}/{} {}'.format(i, len(info['cards']), card['name']))
-        print_ = import_print(session, card, do_commit=False)
+        print_ = import_print(session, card, do_commit=False, cache=cache)
         if tcg_set:
             link = tcg_tables.SetPrint(
                 print_=print_,
@@ -192,9 +503,25 @@ def import_set(session, info, identifier=None, print_status=None):
             if 'number' in c_info:
                 link.number = c_info['number']
             session.add(link)
+    if tcg_set and cache is not None:
+        cache.new_set_ids.add(tcg_set.id)
+    versions.bump(session, [tcg_set.identifier] if tcg_set else [])
+
+
+def cost_runs(cost_string):
+    """Split a cost string such as 'GGC' into (type initial, amount) runs"""
+    if cost_string == '#':
+        cost_string = ''
+    runs = []
+    for initial in cost_string:
+        if runs and runs[-1][0] == initial:
+            runs[-1][1] += 1
+        else:
+            runs.append([initial, 1])
+    return [tuple(run) for run in runs]
 
 
-def import_card(session, card_info):
+def import_card(session, card_info, cache=None):
     def type_by_initial(initial):
         query = session.query(tcg_tables.TCGType)
         query = query.filter_by(initial=initial)
@@ -222,7 +549,13 @@ def import_card(session, card_info):
 
     damage_mod_info = card_info.get('damage modifiers', [])
 
-    card_family = get_family(session, en, card_name)
+    if cache:
+        card_key = fingerprint(card_info)
+        card = cache.get(session, tcg_tables.Card, cache.cards, card_key)
+        if card:
+            return card
+
+    card_family = get_family(session, en, card_name, cache)
 
     # Find/make corresponding card
     query = session.query(tcg_tables.Card)
@@ -244,6 +577,8 @@ def import_card(session, card_info):
         if mnames != [m.get('name') for m in card_info.get('mechanics', [])]:
             continue
         if card_info == export_card(card):
+            if cache:
+                cache.remember(cache.cards, card_key, card)
             return card
 
     # No card found, make a new one
@@ -255,6 +590,8 @@ def import_card(session, card_info):
     card.legal = card_info.get('legal', False)
     card.family = card_family
     session.add(card)
+    if cache:
+        cache.remember(cache.cards, card_key, card)
     for mechanic_index, mechanic_info in enumerate(
             card_info.get('mechanics', ())):
         # Mechanic bits
@@ -267,39 +604,40 @@ def import_card(session, card_info):
         damage = mechanic_info.get('damage', None)
 
         # Find/make mechanic
-        query = session.query(tcg_tables.Mechanic)
-        if mechanic_name:
-            query = util.filter_name(query, tcg_tables.Mechanic,
-                                mechanic_name, en)
-        if effect:
-            query = query.filter(tcg_tables.Mechanic.effect == effect)
-        query = query.filter(tcg_tables.Mechanic.class_ == mechanic_class)
-        for mechanic in query.all():
-            if export_mechanic(mechanic) == mechanic_info:
-                break
+        if cache:
+            mechanic_key = fingerprint(mechanic_info)
+            mechanic = cache.get(session, tcg_tables.Mechanic,
+                                 cache.mechanics, mechanic_key)
         else:
             mechanic = None
+        if not mechanic:
+            query = session.query(tcg_tables.Mechanic)
+            if mechanic_name:
+                query = util.filter_name(query, tcg_tables.Mechanic,
+                                    mechanic_name, en)
+            if effect:
+                query = query.filter(tcg_tables.Mechanic.effect == effect)
+            query = query.filter(tcg_tables.Mechanic.class_ == mechanic_class)
+            for mechanic in query.all():
+                if export_mechanic(mechanic) == mechanic_info:
+                    break
+            else:
+                mechanic = None
         if not mechanic:
             mechanic = tcg_tables.Mechanic()
             mechanic.name_map[en] = mechanic_name
             mechanic.effect_map[en] = effect
             mechanic.class_ = mechanic_class
+            if cache:
+                cache.check_new_name(session, 'mechanic', mechanic_name)
 
-            if cost_string == '#':
-                cost_string = ''
-            cost_list = list(cost_string)
-            cost_index = 0
-            while cost_list:
+            for cost_index, (initial, amount) in enumerate(
+                    cost_runs(cost_string)):
                 cost = tcg_tables.MechanicCost()
-                initial = cost_list[0]
                 cost.type = type_by_initial(initial)
-                cost.amount = 0
-                while cost_list and cost_list[0] == initial:
-                    cost.amount += 1
-                    del cost_list[0]
+                cost.amount = amount
                 cost.mechanic = mechanic
                 cost.order = cost_index
-                cost_index += 1
                 session.add(cost)
 
             if damage:
@@ -310,6 +648,8 @@ def import_card(session, card_info):
                     mechanic.damage_base = int(damage)
 
             session.add(mechanic)
+        if cache:
+            cache.remember(cache.mechanics, mechanic_key, mechanic)
 
         link = tcg_tables.CardMechanic()
         link.card = card
@@ -354,42 +694,55 @@ def import_card(session, card_info):
         session.add(link)
 
     for evolves_from in card_info.get('evolves from', []):
-        family = get_family(session, en, evolves_from)
+        family = get_family(session, en, evolves_from, cache)
         link = tcg_tables.Evolution()
         link.card = card
         link.family = family
         link.order = 0
         link.family_to_card = True
         session.add(link)
+        if cache is not None and family is not card_family:
+            cache.add_evolution(family, card_family)
 
     for evolves_into in card_info.get('evolves into', []):
-        family = get_family(session, en, evolves_into)
+        family = get_family(session, en, evolves_into, cache)
         link = tcg_tables.Evolution()
         link.card = card
         link.family = family
         link.order = 0
         link.family_to_card = False
         session.add(link)
+        if cache is not None and family is not card_family:
+            cache.add_evolution(card_family, family)
 
-    # TODO: make sure we actually roundtrip!
-    #assert_dicts_equal(card_info, export_card(card))
+    # Round-tripping is checked in bulk by `ptcgdex verify`
 
     return card
 
 
-def import_print(session, card_info, do_commit=True):
+def card_part(card_info):
+    """Return the part of a print's info that describes its card"""
+    return {k: v for k, v in card_info.items() if k in CARD_EXPORT_KEYS}
+
+
+def has_flavor(card_info):
+    """Tell whether a print's info makes a tcg_pokemon_flavors row"""
+    return bool(card_info.get('dex number') or any(x in card_info for x in (
+        'height', 'weight', 'dex entry', 'species')))
+
+
+def import_print(session, card_info, do_commit=True, cache=None):
     en = session.query(dex_tables.Language).get(session.default_language_id)
 
     card_name = card_info['name']
 
-    card = import_card(session,
-        {k: v for k, v in card_info.items() if k in CARD_EXPORT_KEYS})
+    card = import_card(session, card_part(card_info), cache=cache)
 
     # Print bits
     illustrator_names = card_info.get('illustrators', ())
     if 'illustrator' in card_info:
         illustrators.append(card_info.get('illustrator'))
-    illustrators = [get_illustrator(session, en, name)
+    illustrators = [get_illustrator(session, en, name, cache)
         for name in illustrator_names]
 
     if card_info.get('rarity'):
@@ -427,8 +780,7 @@ def import_print(session, card_info, do_commit=True):
         link.order = i
         session.add(link)
 
-    if dex_number or any(x in card_info for x in (
-            'height', 'weight', 'dex entry', 'species')):
+    if has_flavor(card_info):
         session.flush()
         flavor = tcg_tables.PokemonFlavor()
         if dex_number:
@@ -463,9 +815,10 @@ def import_print(session, card_info, do_commit=True):
     card_info.pop('in-set-variant-of', None)  # XXX
 
     session.flush()
+    if cache:
+        cache.flushed()
 
-    # TODO: make sure we actually roundtrip!
-    # assert_dicts_equal(card_info, export_print(card_print))
+    # Round-tripping is checked in bulk by `ptcgdex verify`
 
     if do_commit:
         session.commit()
@@ -492,6 +845,66 @@ def export_set(tcg_set):
         res['card'] = export_print(set_print.print_)
     return result
 
+PRINT_LOAD_PATHS = [
+    'card.family.names',
+    'card.stage.names',
+    'card.class_',
+    'card.card_types.type.names',
+    'card.card_subclasses.subclass.names',
+    'card.card_mechanics.mechanic.names',
+    'card.card_mechanics.mechanic.effects',
+    'card.card_mechanics.mechanic.class_',
+    'card.card_mechanics.mechanic.costs.type',
+    'card.damage_modifiers.type.names',
+    'card.evolutions.family.names',
+    'rarity',
+    'scans',
+    'print_illustrators.illustrator',
+    'pokemon_flavor.species.names',
+    'pokemon_flavor.flavor',
+]
+
+def print_load_options(prefix=''):
+    """Eager loading options that let export_print run without lazy loads
+
+    `prefix` is the relationship path from the queried entity to Print,
+    e.g. 'set_prints.print_.' for a Set query.
+    """
+    return [subqueryload_all(prefix + path) for path in PRINT_LOAD_PATHS]
+
+CARD_LOAD_PATHS = [path[len('card.'):] for path in PRINT_LOAD_PATHS
+                   if path.startswith('card.')]
+
+MECHANIC_LOAD_PATHS = [
+    path[len('card.card_mechanics.mechanic.'):] for path in PRINT_LOAD_PATHS
+    if path.startswith('card.card_mechanics.mechanic.')]
+
+def card_fingerprints(session, min_id=0):
+    """Return {card id: fingerprint} for cards with ids over min_id
+
+    The fingerprint is that of the card's export, so it doesn't depend on
+    the ids of families, mechanics or subclasses.
+    """
+    query = session.query(tcg_tables.Card).filter(tcg_tables.Card.id > min_id)
+    query = query.options(*[subqueryload_all(p) for p in CARD_LOAD_PATHS])
+    return {card.id: fingerprint(export_card(card)) for card in query}
+
+def print_fingerprints(session, min_id=0):
+    """Return {print id: fingerprint} for prints with ids over min_id"""
+    query = session.query(tcg_tables.Print).filter(
+        tcg_tables.Print.id > min_id)
+    query = query.options(*print_load_options())
+    return {print_.id: fingerprint(export_print(print_)) for print_ in query}
+
+def mechanic_fingerprints(session, min_id=0):
+    """Return {mechanic id: fingerprint} for mechanics with ids over min_id
+    """
+    query = session.query(tcg_tables.Mechanic).filter(
+        tcg_tables.Mechanic.id > min_id)
+    query = query.options(*[subqueryload_all(p) for p in MECHANIC_LOAD_PATHS])
+    return {mechanic.id: fingerprint(export_mechanic(mechanic))
+            for mechanic in query}
+
 def make_ordered_dict(data, key_order, always_included_keys=[]):
     items = [(k, v) for k, v in data.items() if v or k in always_included_keys]
     items.sort(key=lambda k_v: key_order.index(k_v[0]))
@@ -2,23 +2,78 @@
 
 Usage:
     ptcgdex [options] help
+    ptcgdex [options] batch
     ptcgdex [options] setup [-x | --no-pokedex]
     ptcgdex [options] load [<table-name> ...]
     ptcgdex [options] dump [--all] [<table-identifier> ...]
-    ptcgdex [options] import [<file> ...]
+    ptcgdex [options] dump --sets --cards-dir DIR
+    ptcgdex [options] import [--resume] [--shards N] [--dry-run] [<file> ...]
     ptcgdex [options] export-card [--all | <print-id> ...]
     ptcgdex [options] export-set [--all | <set-identifier> ...]
+    ptcgdex [options] export-columnar [<output>]
+    ptcgdex [options] verify [<file> ...]
+    ptcgdex [options] validate [<file> ...]
+    ptcgdex [options] analyze [--create-indexes]
+    ptcgdex [options] evolution-line [--cards] <name> ...
+    ptcgdex [options] check-deck [--date DATE] <deck-file> ...
+    ptcgdex [options] stats [--json] [--min-damage N]
+    ptcgdex [options] lint-mechanics [--threshold T] [--merge]
+    ptcgdex [options] set-stats [--rebuild] [<set-identifier> ...]
+    ptcgdex [options] scans <scan-dir>
+    ptcgdex [options] diff --other URI
+    ptcgdex [options] sync --other URI
 
 Commands:
     help: Does just what you'd expect.
+    batch: Read commands from standard input, one per line (without the
+        leading "ptcgdex"), and run them all in this process with one
+        database connection, made from the batch's own options. Saves
+        the start-up cost of running many commands. Commands in a batch
+        cannot give their own --engine-uri or --display-sql.
     setup: Combine `pokedex load` and `ptcgdex load`. For more control,
         run these commands separately.
     load: Load PTCGdex CSV files.
-    dump: Dump the database into CSV files. Useful for developers.
+    dump: Dump the database into CSV files. Useful for developers. Or,
+        with --sets, write each set into its own .cards file in the
+        directory given by --cards-dir. Card files are written in
+        parallel, and only if their contents changed.
     import: Import cards from YAML files. If no file is given, imports from
-        standard input
+        standard input. Each set is committed separately. With --dry-run,
+        only reports what would be inserted and estimates the runtime.
     export-card: Export cards in a YAML format. Writes to stdout. 
     export-set: Export whole sets in a YAML format. Writes to stdout. 
+    export-columnar: Export the card tables to a compressed NumPy .npz
+        file (default: ptcgdex.npz) for analysis without the database.
+        Needs NumPy.
+    verify: Check that card files survive an import/export round trip
+        unchanged. If no file is given, checks the bundled card files.
+    validate: Check card files against the card schema and reference CSVs,
+        without using the database. If no file is given, checks the
+        bundled card files. Files given to `import` are validated first.
+    evolution-line: List the card families in the evolution lines of the
+        given families. With --cards, list their prints too.
+    check-deck: Check decklists for Modified legality, the 4-copy rule and
+        deck size. See ptcgdex/decks.py for the decklist format.
+    stats: Show attack statistics: damage per Energy by set and type, and
+        the number of attacks by Energy cost. With --min-damage, also
+        show the cheapest attack doing at least N damage. Needs NumPy.
+    lint-mechanics: Report clusters of mechanics with near-identical effect
+        texts. With --merge, merge the ones that are exact duplicates
+        once whitespace, quotes and case are normalized.
+    set-stats: Show print counts of the given sets (default: all) by
+        rarity, class and type, and their numbers of distinct cards and
+        of reprints. The counts are kept up to date by import and load;
+        with --rebuild, they are all recomputed first.
+    scans: Check the scan image files in the given directory against the
+        database: list scans with no file, files with no scan, and
+        files that changed since the last check. Files are only hashed
+        again if their size or modification time changed.
+    diff: Compare the database with another one, and list the sets,
+        prints and mechanics the other one added, removed or changed.
+    sync: Make the database match the other one, re-importing only the
+        sets that differ.
+    analyze: Refresh the query planner statistics, show the plans of the
+        queries import and export rely on, and flag full table scans.
 
 Global options:
     -h --help               Display this help
@@ -35,14 +90,55 @@ Load/dump options:
 
     -D --drop-tables        Drop existing tables before loading (default for
                                 setup)
-    -S --safe               Disable engine-specific optimizations.
+    -S --safe               Disable engine-specific optimizations (such as
+                                COPY on PostgreSQL for load).
 
 Setup options:
     -x --no-pokedex         Do not touch base pokedex tables when loading
 
+Import options:
+    --resume                Skip documents committed by an earlier run of
+                                the same import
+    --shards N              Import files in N parallel processes, each into
+                                its own SQLite copy of the database, and
+                                merge the copies at the end (with COPY on
+                                PostgreSQL)
+    --dry-run               Write nothing; count the rows the import would
+                                insert, and the cards, mechanics, families
+                                and illustrators it would reuse
+
+Verify/validate/dump/scans options:
+    -j --jobs N             Number of worker processes (default: CPU count)
+
+Deck options:
+    --date DATE             Check legality as of this YYYY-MM-DD date
+                                (default: today)
+
+Stats options:
+    --json                  Print the statistics as JSON
+    --min-damage N          Find the cheapest attack doing N damage or more
+
+Lint options:
+    --threshold T           Minimum similarity of effect texts, between 0
+                                and 1 (default: 0.8)
+    --merge                 Merge duplicate mechanics, moving their cards
+                                to the one with the lowest ID
+
+Set stats options:
+    --rebuild               Recompute the counts of all sets
+
+Diff/sync options:
+    --other URI             The database to compare with (or copy from)
+
+Analyze options:
+    --create-indexes        Create the indexes the analysis suggests
+
 Dump options:
-    --sets                  Only dump card files
-    --csv                   Only dump CSV files
+    --sets                  Dump card files instead of CSV files
+    --cards-dir DIR         Directory for the card files. The database
+                                drops some keys of the bundled files
+                                (e.g. "reprint of"), so dumping over
+                                ptcgdex/data/cards loses data
 """
 
 import os
@@ -82,6 +178,7 @@ def all_tables(tcg_tables):
 
 def load(session, options):
     from ptcgdex import tcg_tables
+    from ptcgdex.tcg_tables import create_derived_tables
     from ptcgdex import load as ptcg_load
     from pokedex.db import load as dex_load
     tcg_tables = [c.__tablename__ for c in all_tables(tcg_tables.tcg_classes)]
@@ -102,7 +199,14 @@ def load(session, options):
         tables = tcg_tables
         sets = None
 
-    if tables:
+    if tables and (session.connection().dialect.name == 'postgresql' and
+                   not options['--safe']):
+        ptcg_load.copy_from_csv(session,
+            directory=options['--ptcg-csv-dir'],
+            table_names=tables,
+            drop_tables=options['--drop-tables'],
+            verbose=options['--verbose'])
+    elif tables:
         dex_load.load(session,
             directory=options['--ptcg-csv-dir'],
             drop_tables=options['--drop-tables'],
@@ -112,11 +216,20 @@ def load(session, options):
             recursive=False,
             langs=[])
 
+    if tables:
+        from ptcgdex import versions
+        create_derived_tables(session.connection())
+        ptcg_load.rebuild_derived(session)
+        versions.bump_all_sets(session)
+        session.commit()
+
 
 def dump(session, options):
     from ptcgdex import tcg_tables
     from pokedex.db import load as dex_load
     from ptcgdex import load as ptcg_load
+    if options['--sets']:
+        return dump_set_files(session, options)
     tables = options['<table-identifier>']
     if options['--all']:
         tables = [t.__tablename__ for t in all_tables(tcg_tables.tcg_classes)]
@@ -132,57 +245,443 @@ def dump(session, options):
         langs=['en'])
 
 
+def dump_set_files(session, options):
+    from ptcgdex import tcg_tables
+    from ptcgdex import set_files
+    from pokedex.db import load as dex_load
+    print_start, print_status, print_done = dex_load._get_verbose_prints(
+        options['--verbose'])
+    directory = options['--cards-dir']
+    identifiers = [identifier for identifier, in
+                   session.query(tcg_tables.Set.identifier)]
+    jobs = int(options['--jobs']) if options['--jobs'] else None
+    print_start('Dumping {} sets to {}'.format(len(identifiers), directory))
+    written, unchanged, errors = set_files.dump_sets(
+        str(session.bind.url), identifiers, directory, jobs=jobs,
+        print_status=print_status)
+    print_done('{} written, {} unchanged'.format(len(written),
+                                                 len(unchanged)))
+    for identifier, error in sorted(errors.items()):
+        print 'ERROR {}: {}'.format(identifier, error)
+    if errors:
+        exit(1)
+
+
+def import_dry_run(session, options):
+    import time
+    from ptcgdex import dry_run
+    from pokedex.db import load as dex_load
+    print_start, print_status, print_done = dex_load._get_verbose_prints(
+        options['--verbose'])
+    start = time.time()
+    print_start('Indexing existing cards')
+    plan = dry_run.Plan(dry_run.ExistingIndex(session))
+    print_done()
+    print_start('Planning')
+    if not options['<file>']:
+        plan.add_file(session, sys.stdin, 'stdin')
+    for filename in options['<file>']:
+        with open(filename) as f:
+            identifier, ext = os.path.splitext(os.path.basename(filename))
+            plan.add_file(session, f, filename, identifier,
+                          resume=options['--resume'])
+    print_done()
+    session.rollback()
+    print 'Rows to insert:'
+    for table_name, count in sorted(plan.inserts.items()):
+        print '{:8} {}'.format(count, table_name)
+    print 'Reused:'
+    for kind, count in sorted(plan.reused.items()):
+        print '{:8} {}'.format(count, kind)
+    rate = dry_run.seconds_per_print(session)
+    if rate is None:
+        print 'Expected runtime: unknown (no earlier imports to go by)'
+    else:
+        print 'Expected runtime: {:.0f} s ({:.1f} ms per print)'.format(
+            rate * plan.prints, rate * 1000)
+    print 'Dry run took {:.1f} s'.format(time.time() - start)
+
+
 def import_(session, options):
+    from ptcgdex import tcg_tables
     from ptcgdex import load as ptcg_load
+    if options['--dry-run']:
+        return import_dry_run(session, options)
+    cache = ptcg_load.ImportCache()
     def _load(f, label, name=None):
-        ptcg_load.import_(session, f, label, name, verbose=options['--verbose'])
+        ptcg_load.import_(session, f, label, name,
+                          verbose=options['--verbose'],
+                          resume=options['--resume'],
+                          cache=cache)
+
+    tcg_tables.create_derived_tables(session.bind)
+
+    dialect = session.connection().dialect.name
+    if dialect == 'sqlite':
+        # WAL keeps the per-set commits cheap while still surviving a crash
+        session.connection().execute("PRAGMA journal_mode=WAL")
+        session.connection().execute("PRAGMA synchronous=NORMAL")
+
     if not options['<file>']:
         _load(sys.stdin, 'stdin')
 
-    if session.connection().dialect.name == 'sqlite':
-        session.connection().execute("PRAGMA synchronous=OFF")
-        session.connection().execute("PRAGMA journal_mode=OFF")
+    if options['--shards'] and options['<file>']:
+        from ptcgdex import shard
+        shard.import_sharded(session, options['<file>'],
+                             int(options['--shards']),
+                             verbose=options['--verbose'],
+                             resume=options['--resume'],
+                             cache=cache)
+    else:
+        for filename in options['<file>']:
+            with open(filename) as f:
+                identifier, ext = os.path.splitext(os.path.basename(filename))
+                _load(f, filename, identifier)
+
+    if dialect == 'sqlite':
+        result = session.connection().execute("PRAGMA quick_check").fetchall()
+        if [tuple(row) for row in result] != [('ok', )]:
+            for row in result:
+                print >>sys.stderr, row[0]
+            exit('Database check failed')
+
+    for kind, name, similar in cache.near_duplicates:
+        print >>sys.stderr, (
+            u"Warning: new {} name '{}' is similar to {}".format(
+                kind, name, ', '.join("'{}'".format(s) for s in similar))
+        ).encode('utf-8')
 
-    for filename in options['<file>']:
-        with open(filename) as f:
-            identifier, ext = os.path.splitext(os.path.basename(filename))
-            _load(f, filename, identifier)
+    if options['--verbose']:
+        print >>sys.stderr, 'Peak memory use: {:.1f} MiB'.format(
+            ptcg_load.peak_memory() / 2.0 ** 20)
 
-    if session.connection().dialect.name == 'sqlite':
-        session.connection().execute("PRAGMA integrity_check")
+
+def make_export_cache(session):
+    from ptcgdex.export_cache import ExportCache
+    return ExportCache(scope=unicode(session.bind.url))
 
 
 def export(session, options):
     from ptcgdex import tcg_tables
     from ptcgdex import load as ptcg_load
+    from ptcgdex import versions
     from pokedex.db import util
     prints = []
     for print_id in options['<print-id>']:
         prints.append(util.get(session, tcg_tables.Print, id=int(print_id)))
     if options['--all']:
         prints = session.query(tcg_tables.Print)
+    cache = make_export_cache(session)
+    token = versions.token(session)
     for tcg_print in prints:
-        print ptcg_load.yaml_dump(ptcg_load.export_print(tcg_print)),
+        print cache.fetch(
+            'print:{}'.format(tcg_print.id), token,
+            lambda: ptcg_load.yaml_dump(ptcg_load.export_print(tcg_print))),
 
 
 def export_set(session, options):
     from ptcgdex import tcg_tables
     from ptcgdex import load as ptcg_load
+    from ptcgdex import versions
     from pokedex.db import util
     sets = []
     for set_ident in options['<set-identifier>']:
         sets.append(util.get(session, tcg_tables.Set, set_ident))
     if options['--all']:
-        sets = session.query(tcg_tables.Set)
+        sets = session.query(tcg_tables.Set).all()
+    cache = make_export_cache(session)
+    tokens = versions.tokens(session, [s.identifier for s in sets])
     for tcg_set in sets:
-        print ptcg_load.yaml_dump(ptcg_load.export_set(tcg_set)),
+        token = tokens.get(tcg_set.identifier)
+        print cache.fetch(
+            'set:{}'.format(tcg_set.identifier), token,
+            lambda: ptcg_load.yaml_dump(ptcg_load.export_set(tcg_set))),
 
 
-def main(argv=None):
-    if argv is None:
-        argv = sys.argv
+def export_columnar(session, options):
+    from pokedex.db import load as dex_load
+    from ptcgdex import columnar
+    print_start, print_status, print_done = dex_load._get_verbose_prints(
+        options['--verbose'])
+    filename = options['<output>'] or 'ptcgdex.npz'
+    print_start('Exporting to {}'.format(filename))
+    counts = columnar.export(session, filename)
+    print_done('{} cards, {} prints'.format(counts['cards'], counts['prints']))
+
+
+def default_cards_dir():
+    return os.path.join(os.path.dirname(__file__), 'data', 'cards')
+
+
+def card_files(options):
+    if options['<file>']:
+        return options['<file>']
+    directory = default_cards_dir()
+    return sorted(os.path.join(directory, name)
+                  for name in os.listdir(directory)
+                  if name.endswith('.cards'))
+
+
+def verify(session, options):
+    from pokedex.db import load as dex_load
+    from ptcgdex import load as ptcg_load
+    from ptcgdex import verify as ptcg_verify
+    print_start, print_status, print_done = dex_load._get_verbose_prints(
+        options['--verbose'])
+    filenames = card_files(options)
+    jobs = int(options['--jobs']) if options['--jobs'] else None
+    print_start('Verifying {} files'.format(len(filenames)))
+    mismatches, errors = ptcg_verify.verify_files(
+        str(session.bind.url), filenames, jobs=jobs,
+        print_status=print_status)
+    print_done()
+    for filename, error in sorted(errors.items()):
+        print 'ERROR {}: {}'.format(filename, error)
+    if options['--verbose']:
+        for mismatch in mismatches:
+            print ptcg_load.yaml_dump({
+                '{} {}'.format(mismatch.label, mismatch.path):
+                    [mismatch.expected, mismatch.got]}),
+    for field, count in ptcg_verify.summarize(mismatches):
+        print '{:6} {}'.format(count, field)
+    if mismatches or errors:
+        exit(1)
+
+
+def validate(options):
+    from ptcgdex import validate as ptcg_validate
+    filenames = card_files(options)
+    jobs = int(options['--jobs']) if options['--jobs'] else None
+    errors = ptcg_validate.validate_files(
+        filenames, csv_dir=options['--ptcg-csv-dir'], jobs=jobs)
+    for error in errors:
+        print >>sys.stderr, '{}#{} {}: {}'.format(
+            error.filename, error.document, error.path,
+            error.message).encode('utf-8')
+    if options['--verbose']:
+        print >>sys.stderr, '{} files checked, {} errors'.format(
+            len(filenames), len(errors))
+    return not errors
+
+
+def analyze(session, options):
+    from ptcgdex import analyze as ptcg_analyze
+    ptcg_analyze.refresh_statistics(session)
+    for plan in ptcg_analyze.analyze(session):
+        if plan.scanned_tables:
+            flag = 'FULL SCAN: ' + ', '.join(plan.scanned_tables)
+        else:
+            flag = 'ok'
+        print '{}: {}'.format(plan.name, flag)
+        if options['--verbose']:
+            for line in plan.lines:
+                print '    ' + line
+    missing = ptcg_analyze.missing_indexes(session)
+    if missing:
+        print
+        print 'Suggested indexes:'
+        for index in missing:
+            print ptcg_analyze.index_ddl(session, index).strip() + ';'
+        if options['--create-indexes']:
+            for index in missing:
+                index.create(session.connection())
+            ptcg_analyze.refresh_statistics(session)
+            print 'Created {} indexes'.format(len(missing))
+
+
+def evolution_line(session, options):
+    from ptcgdex import tcg_tables
+    from ptcgdex import evolution
+    from pokedex.db import util
+    for name in options['<name>']:
+        family = util.get(session, tcg_tables.CardFamily, name=name)
+        for member, generation in evolution.evolution_line(session, family):
+            print u'{}{}'.format('  ' * generation, member.name).encode('utf-8')
+        if options['--cards']:
+            set_prints = evolution.line_set_prints(session, family).all()
+            set_prints.sort(key=tcg_tables.set_print_sort_key)
+            for set_print in set_prints:
+                print u'    {} {} {}'.format(
+                    set_print.set.identifier, set_print.number or '',
+                    set_print.card.name).encode('utf-8')
+
+
+def check_deck(session, options):
+    from datetime import datetime
+    from ptcgdex import decks
+    if options['--date']:
+        on_date = datetime.strptime(options['--date'], '%Y-%m-%d').date()
+    else:
+        on_date = None
+    labeled = []
+    for filename in options['<deck-file>']:
+        with open(filename) as f:
+            file_decks = decks.parse_decks(f.read().decode('utf-8').splitlines())
+        for number, entries in enumerate(file_decks, start=1):
+            if len(file_decks) > 1:
+                label = '{}#{}'.format(filename, number)
+            else:
+                label = filename
+            labeled.append((label, entries))
+    index = decks.CardIndex.from_session(session)
+    results = decks.check_decks(index, labeled, on_date)
+    bad = 0
+    for label, entries in labeled:
+        errors = results[label]
+        if errors:
+            bad += 1
+        for error in errors:
+            if error.line is None:
+                message = u'{}: {}'.format(label, error.message)
+            else:
+                message = u'{}:{}: {}'.format(label, error.line, error.message)
+            print message.encode('utf-8')
+    if options['--verbose']:
+        print >>sys.stderr, '{} decks checked, {} with errors'.format(
+            len(labeled), bad)
+    return not bad
 
-    options = docopt(__doc__, argv=argv[1:])
+
+def stats(session, options):
+    import json
+    from ptcgdex import tcg_tables
+    from ptcgdex import stats as ptcg_stats
+    result = ptcg_stats.cached_stats(session)
+    cheapest = None
+    if options['--min-damage']:
+        point = ptcg_stats.cheapest_attack(result,
+                                           int(options['--min-damage']))
+        if point:
+            damage, cost, mechanic_id = point
+            mechanic = session.query(tcg_tables.Mechanic).get(mechanic_id)
+            cheapest = dict(name=mechanic.name, damage=damage, cost=cost,
+                            cost_string=mechanic.cost_string)
+    if options['--json']:
+        result = dict(result, cheapest=cheapest)
+        print json.dumps(result, sort_keys=True, indent=2)
+        return
+    print 'Damage per Energy'
+    print '{:30} {:10} {:>7} {:>7}'.format('set', 'type', 'attacks', 'mean')
+    for row in result['damage_per_energy']:
+        print '{:30} {:10} {:7} {:7.2f}'.format(
+            row['set'], row['type'], row['attacks'], row['mean'])
+    print
+    print 'Attacks by Energy cost'
+    for row in result['cost_curve']:
+        print '{:3} {:6} {}'.format(row['cost'], row['attacks'],
+                                    '#' * (row['attacks'] * 60 //
+                                           max(1, result['attacks'])))
+    if options['--min-damage']:
+        print
+        if cheapest:
+            print u'Cheapest attack with {}+ damage: {} ({}, {} damage)'.format(
+                options['--min-damage'], cheapest['name'],
+                cheapest['cost_string'] or 'free',
+                cheapest['damage']).encode('utf-8')
+        else:
+            print 'No attack does {} damage'.format(options['--min-damage'])
+
+
+def lint_mechanics(session, options):
+    from ptcgdex import lint
+    threshold = float(options['--threshold'] or lint.DEFAULT_THRESHOLD)
+    texts = lint.mechanic_texts(session)
+    clusters = lint.find_clusters(texts, threshold)
+    duplicates = []
+    for cluster in clusters:
+        print '{} mechanics, similarity {:.2f}{}'.format(
+            len(cluster.mechanics), cluster.similarity,
+            ', mergeable' if cluster.mergeable else '')
+        for text in cluster.mechanics:
+            print u'    {:6} {}: {}'.format(
+                text.id, text.name or '-', text.effect[:60]).encode('utf-8')
+        duplicates.extend(cluster.mergeable)
+    if options['--verbose']:
+        print >>sys.stderr, '{} mechanics, {} clusters, {} mergeable'.format(
+            len(texts), len(clusters), len(duplicates))
+    if options['--merge'] and duplicates:
+        removed = lint.merge_duplicates(session, duplicates)
+        session.commit()
+        print >>sys.stderr, 'Merged away {} mechanics'.format(removed)
+
+
+def set_stats(session, options):
+    from ptcgdex import tcg_tables
+    from ptcgdex import set_stats as ptcg_set_stats
+    if options['--rebuild']:
+        tcg_tables.create_derived_tables(session.bind)
+        ptcg_set_stats.rebuild(session)
+        session.commit()
+    all_stats = ptcg_set_stats.read(session, options['<set-identifier>'])
+    for identifier, counts in sorted(all_stats.items()):
+        print '{}: {}'.format(identifier, ', '.join(
+            '{} {}'.format(counts.get(stat, 0), stat)
+            for stat in ptcg_set_stats.SUMMARY_STATS))
+        for breakdown in ptcg_set_stats.BREAKDOWNS:
+            prefix = breakdown + ':'
+            parts = ['{} {}'.format(stat[len(prefix):], count)
+                     for stat, count in sorted(counts.items())
+                     if stat.startswith(prefix)]
+            if parts:
+                print '    {}: {}'.format(breakdown, ', '.join(parts))
+
+
+def scans(session, options):
+    from ptcgdex import tcg_tables
+    from ptcgdex import scans as ptcg_scans
+    from pokedex.db import load as dex_load
+    print_start, print_status, print_done = dex_load._get_verbose_prints(
+        options['--verbose'])
+    tcg_tables.create_derived_tables(session.bind)
+    directory = options['<scan-dir>']
+    jobs = int(options['--jobs']) if options['--jobs'] else None
+    print_start('Checking {}'.format(directory))
+    update = ptcg_scans.update_manifest(session, directory, jobs=jobs,
+                                        print_status=print_status)
+    session.commit()
+    print_done('{} files, {} hashed, {} gone'.format(
+        update.files, update.hashed, update.removed))
+    for path in update.duplicates:
+        print >>sys.stderr, 'Warning: skipped duplicate name {}'.format(path)
+    report = ptcg_scans.report(session)
+    for filename, print_id in report.missing:
+        print 'missing {} (print {})'.format(filename, print_id)
+    for filename, print_id in report.changed:
+        print 'changed {} (print {})'.format(filename, print_id)
+    for path in report.orphaned:
+        print 'orphaned {}'.format(path)
+    if report.missing:
+        exit(1)
+
+
+def diff(session, options):
+    from pokedex.db import connect
+    from pokedex.db import load as dex_load
+    from ptcgdex import dbdiff
+    print_start, print_status, print_done = dex_load._get_verbose_prints(
+        options['--verbose'])
+    other = connect(options['--other'])
+    if options['sync']:
+        print_start('Syncing with {}'.format(other.bind.url))
+        diffs = dbdiff.sync(session, other, print_status)
+    else:
+        print_start('Comparing with {}'.format(other.bind.url))
+        diffs = dbdiff.diff(dbdiff.Fingerprints(session),
+                            dbdiff.Fingerprints(other))
+    print_done()
+    for result in diffs:
+        for sign, keys in [('+', result.added), ('-', result.removed),
+                           ('~', result.changed)]:
+            for key in keys:
+                print u'{} {} {}'.format(sign, result.kind, key).encode('utf-8')
+    for result in diffs:
+        print '{}s: {} added, {} removed, {} changed'.format(
+            result.kind, len(result.added), len(result.removed),
+            len(result.changed))
+
+
+def parse_options(argv):
+    options = docopt(__doc__, argv=argv)
 
     if not options['--verbose'] and not options['--quiet']:
         if options['export-card'] or options['export-set']:
@@ -194,12 +693,57 @@ def main(argv=None):
         options['--ptcg-csv-dir'] = os.path.join(
             os.path.dirname(__file__), 'data', 'csv')
 
+    return options
+
+
+def batch(options):
+    import shlex
+    import traceback
+    session = None
+    failures = 0
+    for line in sys.stdin:
+        args = shlex.split(line, comments=True)
+        if not args:
+            continue
+        try:
+            command_options = parse_options(args)
+            if command_options['batch']:
+                exit('batch cannot be nested')
+            for option in '--engine-uri', '--display-sql':
+                if command_options[option]:
+                    exit('{} must be given to batch, not to its commands'
+                         .format(option))
+            if session is None:
+                session = make_session(options)
+            run(command_options, session)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                failures += 1
+                if not isinstance(e.code, int):
+                    print >>sys.stderr, e.code
+            if session is not None:
+                session.rollback()
+        except Exception:
+            traceback.print_exc()
+            failures += 1
+            if session is not None:
+                session.rollback()
+        sys.stdout.flush()
+    if failures:
+        exit('{} commands failed'.format(failures))
+
+
+def run(options, session=None):
+    """Run one parsed command
+
+    If `session` is given, it is used instead of connecting anew.
+    """
     if options['help']:
         print __doc__
 
     elif options['setup']:
         from pokedex.db import load as dex_load
-        session = make_session(options)
+        session = session or make_session(options)
         if not options['--no-pokedex']:
             dex_load.load(session,
                 directory=options['--dex-csv-dir'],
@@ -209,24 +753,83 @@ def main(argv=None):
         load(session, options)
 
     elif options['load']:
-        session = make_session(options)
+        session = session or make_session(options)
         load(session, options)
 
     elif options['dump']:
-        session = make_session(options)
+        session = session or make_session(options)
         dump(session, options)
 
+    elif options['evolution-line']:
+        session = session or make_session(options)
+        evolution_line(session, options)
+
+    elif options['check-deck']:
+        session = session or make_session(options)
+        if not check_deck(session, options):
+            exit(1)
+
+    elif options['stats']:
+        session = session or make_session(options)
+        stats(session, options)
+
+    elif options['lint-mechanics']:
+        session = session or make_session(options)
+        lint_mechanics(session, options)
+
+    elif options['set-stats']:
+        session = session or make_session(options)
+        set_stats(session, options)
+
+    elif options['scans']:
+        session = session or make_session(options)
+        scans(session, options)
+
+    elif options['diff'] or options['sync']:
+        session = session or make_session(options)
+        diff(session, options)
+
+    elif options['analyze']:
+        session = session or make_session(options)
+        analyze(session, options)
+
+    elif options['validate']:
+        if not validate(options):
+            exit(1)
+
     elif options['import']:
-        session = make_session(options)
+        if options['<file>'] and not validate(options):
+            exit('Not importing invalid files')
+        session = session or make_session(options)
         import_(session, options)
 
     elif options['export-card']:
-        session = make_session(options)
+        session = session or make_session(options)
         export(session, options)
 
     elif options['export-set']:
-        session = make_session(options)
+        session = session or make_session(options)
         export_set(session, options)
 
+    elif options['export-columnar']:
+        session = session or make_session(options)
+        export_columnar(session, options)
+
+    elif options['verify']:
+        session = session or make_session(options)
+        verify(session, options)
+
     else:
         exit('Subcommand not supported yet')
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    options = parse_options(argv[1:])
+
+    if options['batch']:
+        batch(options)
+    else:
+        run(options)
@@ -0,0 +1,237 @@
+# Encoding: UTF-8
+"""Batch attack damage calculations with NumPy
+
+DamageMatrix loads every attack and every card's Weakness/Resistance into
+dense arrays once, then answers "how much does each of these attacks deal
+to each of these defenders" and "which attacks can this Energy pay for"
+for whole batches at a time, instead of walking the ORM per pair.
+
+Damage follows the printed numbers only: base damage, then Weakness
+(× or +), then Resistance (-), floored at 0. Attacks whose damage has a
+modifier (20+, 30×, 10-, ?) are flagged in `variable`; their base number
+is used as is. Modifiers with a blank operation are ignored.
+
+NumPy is an optional dependency (pip install TCGdex[analytics]).
+"""
+from __future__ import division, unicode_literals
+
+from sqlalchemy import select
+
+from ptcgdex import tcg_tables
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Cap on the size of the (attacks × defenders × types) temporaries
+CHUNK_ELEMENTS = 1 << 22
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('DamageMatrix needs NumPy; '
+                          'install it with pip install numpy')
+
+
+def _index(ids):
+    return dict((id, i) for i, id in enumerate(ids))
+
+
+class DamageMatrix(object):
+    """Dense arrays describing all attacks and cards
+
+    Cards and types are indexed in id order; `card_ids[i]` and
+    `type_ids[t]` map indices back to database ids.
+
+    Per card (N cards, T types):
+        hp              (N,) int, 0 for cards without HP
+        card_types      (N, T) bool, the card's own types
+        weakness_factor (N, T) int, damage multiplier for attackers of type t
+        weakness_bonus  (N, T) int, damage added for attackers of type t
+        resistance      (N, T) int, damage subtracted for attackers of type t
+    Per attack (A attacks, i.e. card/mechanic pairs):
+        attack_card     (A,) int, index of the attacking card
+        mechanic_ids    (A,) int, the attack's tcg_mechanics id
+        base_damage     (A,) int, printed damage (0 if none)
+        variable        (A,) bool, whether the damage has a modifier
+        cost            (A, T) int, Energy of each type in the cost
+    """
+
+    def __init__(self, type_ids, type_initials, colorless, card_ids, hp,
+                 card_types, weakness_factor, weakness_bonus, resistance,
+                 attack_card, mechanic_ids, base_damage, variable, cost):
+        _require_numpy()
+        self.type_ids = type_ids
+        self.type_initials = type_initials
+        self.colorless = colorless
+        self.card_ids = card_ids
+        self.hp = hp
+        self.card_types = card_types
+        self.weakness_factor = weakness_factor
+        self.weakness_bonus = weakness_bonus
+        self.resistance = resistance
+        self.attack_card = attack_card
+        self.mechanic_ids = mechanic_ids
+        self.base_damage = base_damage
+        self.variable = variable
+        self.cost = cost
+        self.card_index = _index(card_ids)
+        self.type_index = _index(type_ids)
+
+    @classmethod
+    def from_session(cls, session):
+        """Build the arrays with a handful of Core queries"""
+        _require_numpy()
+        connection = session.connection()
+        types = tcg_tables.TCGType.__table__
+        cards = tcg_tables.Card.__table__
+        card_types = tcg_tables.CardType.__table__
+        modifiers = tcg_tables.DamageModifier.__table__
+        mechanics = tcg_tables.Mechanic.__table__
+        mechanic_classes = tcg_tables.MechanicClass.__table__
+        card_mechanics = tcg_tables.CardMechanic.__table__
+        costs = tcg_tables.MechanicCost.__table__
+
+        type_rows = connection.execute(
+            select([types.c.id, types.c.identifier, types.c.initial])
+            .order_by(types.c.id)).fetchall()
+        type_ids = [row.id for row in type_rows]
+        type_initials = [row.initial for row in type_rows]
+        [colorless] = [i for i, row in enumerate(type_rows)
+                       if row.identifier == 'colorless']
+        type_index = _index(type_ids)
+
+        card_rows = connection.execute(
+            select([cards.c.id, cards.c.hp]).order_by(cards.c.id)).fetchall()
+        card_ids = [id for id, hp in card_rows]
+        card_index = _index(card_ids)
+        n_cards, n_types = len(card_ids), len(type_ids)
+        hp = numpy.array([hp or 0 for id, hp in card_rows], dtype=numpy.int32)
+
+        own_types = numpy.zeros((n_cards, n_types), dtype=bool)
+        for card_id, type_id in connection.execute(
+                select([card_types.c.card_id, card_types.c.type_id])):
+            own_types[card_index[card_id], type_index[type_id]] = True
+
+        factor = numpy.ones((n_cards, n_types), dtype=numpy.int32)
+        bonus = numpy.zeros((n_cards, n_types), dtype=numpy.int32)
+        resistance = numpy.zeros((n_cards, n_types), dtype=numpy.int32)
+        for card_id, type_id, operation, amount in connection.execute(
+                select([modifiers.c.card_id, modifiers.c.type_id,
+                        modifiers.c.operation, modifiers.c.amount])):
+            if not amount:
+                continue
+            position = card_index[card_id], type_index[type_id]
+            if operation == '×':
+                factor[position] *= amount
+            elif operation == '+':
+                bonus[position] += amount
+            elif operation == '-':
+                resistance[position] += amount
+
+        attack_rows = connection.execute(
+            select([card_mechanics.c.card_id, mechanics.c.id,
+                    mechanics.c.damage_base, mechanics.c.damage_modifier])
+            .where(card_mechanics.c.mechanic_id == mechanics.c.id)
+            .where(mechanics.c.class_id == mechanic_classes.c.id)
+            .where(mechanic_classes.c.identifier == 'attack')
+            .order_by(card_mechanics.c.card_id, card_mechanics.c.order)
+        ).fetchall()
+        attack_card = numpy.array(
+            [card_index[row[0]] for row in attack_rows], dtype=numpy.int32)
+        mechanic_ids = numpy.array(
+            [row[1] for row in attack_rows], dtype=numpy.int32)
+        base_damage = numpy.array(
+            [row[2] or 0 for row in attack_rows], dtype=numpy.int32)
+        variable = numpy.array(
+            [bool(row[3]) for row in attack_rows], dtype=bool)
+
+        mechanic_cost = {}
+        for mechanic_id, type_id, amount in connection.execute(
+                select([costs.c.mechanic_id, costs.c.type_id,
+                        costs.c.amount])):
+            row = mechanic_cost.setdefault(
+                mechanic_id, numpy.zeros(n_types, dtype=numpy.int32))
+            row[type_index[type_id]] += amount
+        cost = numpy.zeros((len(attack_rows), n_types), dtype=numpy.int32)
+        for i, row in enumerate(attack_rows):
+            if row[1] in mechanic_cost:
+                cost[i] = mechanic_cost[row[1]]
+
+        return cls(type_ids, type_initials, colorless, card_ids, hp,
+                   own_types, factor, bonus, resistance,
+                   attack_card, mechanic_ids, base_damage, variable, cost)
+
+    def attacks_of(self, card_id):
+        """Return the attack indices of a card, by tcg_cards id"""
+        return numpy.flatnonzero(
+            self.attack_card == self.card_index[card_id])
+
+    def damage(self, attacks=None, defenders=None):
+        """Return an (attacks, defenders) array of damage dealt
+
+        `attacks` are attack indices and `defenders` card indices; both
+        default to everything. Attacks with no base damage deal 0.
+        """
+        if attacks is None:
+            attacks = numpy.arange(len(self.attack_card))
+        if defenders is None:
+            defenders = numpy.arange(len(self.card_ids))
+        attacks = numpy.asarray(attacks)
+        defenders = numpy.asarray(defenders)
+        result = numpy.empty((len(attacks), len(defenders)),
+                             dtype=numpy.int32)
+
+        factor = self.weakness_factor[defenders][numpy.newaxis]
+        bonus = self.weakness_bonus[defenders]
+        resistance = self.resistance[defenders]
+        n_types = len(self.type_ids)
+        step = max(1, CHUNK_ELEMENTS // max(1, len(defenders) * n_types))
+        for start in range(0, len(attacks), step):
+            chunk = attacks[start:start + step]
+            attacker_types = self.card_types[self.attack_card[chunk]]
+            # Weakness multipliers of all matching types are combined
+            multiplier = numpy.where(attacker_types[:, numpy.newaxis],
+                                     factor, 1).prod(axis=2)
+            mask = attacker_types.astype(numpy.int32)
+            added = mask.dot(bonus.T)
+            removed = mask.dot(resistance.T)
+            base = self.base_damage[chunk][:, numpy.newaxis]
+            damage = base * multiplier + added - removed
+            numpy.maximum(damage, 0, out=damage)
+            damage *= base != 0
+            result[start:start + step] = damage
+        return result
+
+    def knockouts(self, attacks=None, defenders=None):
+        """Return an (attacks, defenders) bool array: damage >= HP"""
+        if defenders is None:
+            defenders = numpy.arange(len(self.card_ids))
+        damage = self.damage(attacks, defenders)
+        hp = self.hp[numpy.asarray(defenders)]
+        return (damage >= hp) & (hp > 0)
+
+    def energy_vector(self, initials):
+        """Turn a cost-style string of type initials ('RRC') into a vector
+        """
+        vector = numpy.zeros(len(self.type_ids), dtype=numpy.int32)
+        for initial in initials:
+            vector[self.type_initials.index(initial)] += 1
+        return vector
+
+    def affordable(self, energy, attacks=None):
+        """Return which attacks the attached Energy can pay for
+
+        `energy` is a (T,) vector of Energy counts by type, or an (E, T)
+        array of several; the result is (A,) or (E, A) booleans.
+        Colorless requirements can be paid with Energy of any type.
+        """
+        cost = self.cost if attacks is None else self.cost[attacks]
+        energy = numpy.asarray(energy)
+        specific = numpy.ones(len(self.type_ids), dtype=bool)
+        specific[self.colorless] = False
+        have = energy[..., numpy.newaxis, :]
+        typed_ok = (have[..., specific] >= cost[:, specific]).all(axis=-1)
+        total_ok = energy.sum(axis=-1)[..., numpy.newaxis] >= cost.sum(axis=1)
+        return typed_ok & total_ok
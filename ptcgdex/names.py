@@ -0,0 +1,135 @@
+# Encoding: UTF-8
+"""Fuzzy lookup of card family, mechanic and illustrator names
+
+NameIndex keeps names in memory with an index of their trigrams. A lookup
+only computes edit distances for names sharing enough trigrams with the
+query to possibly be within the allowed distance, so it stays fast over
+every name in the database.
+
+Matching ignores case: 'Ho-oh' is at distance 0 from 'Ho-Oh'.
+"""
+from __future__ import division, unicode_literals
+
+from collections import defaultdict
+
+from sqlalchemy import select
+from pokedex.db import tables as dex_tables
+
+from ptcgdex import tcg_tables
+
+
+def normalize(name):
+    return name.lower()
+
+
+def trigrams(name):
+    padded = '$${}$$'.format(name)
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def edit_distance(a, b, limit):
+    """Return the Levenshtein distance of a and b, or limit + 1 if above"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def default_distance(name):
+    """Edit distance tolerated for a name: 1 for short names, else 2"""
+    return 1 if len(name) <= 5 else 2
+
+
+class NameIndex(object):
+    """In-memory trigram index of names"""
+    def __init__(self, names=()):
+        self.names = []
+        self.normalized = []
+        self.known = set()
+        self.by_trigram = defaultdict(list)
+        self.by_length = defaultdict(list)
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.known
+
+    def add(self, name):
+        if name is None or name in self.known:
+            return
+        position = len(self.names)
+        self.known.add(name)
+        self.names.append(name)
+        key = normalize(name)
+        self.normalized.append(key)
+        for trigram in trigrams(key):
+            self.by_trigram[trigram].append(position)
+        self.by_length[len(key)].append(position)
+
+    def _candidates(self, key, max_distance):
+        query_trigrams = trigrams(key)
+        # Each edit changes at most 3 trigrams
+        needed = len(query_trigrams) - 3 * max_distance
+        if needed <= 0:
+            return [position
+                    for length in range(len(key) - max_distance,
+                                        len(key) + max_distance + 1)
+                    for position in self.by_length.get(length, ())]
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for position in self.by_trigram.get(trigram, ()):
+                shared[position] += 1
+        return [position for position, count in shared.items()
+                if count >= needed]
+
+    def lookup(self, name, max_distance=None, limit=5):
+        """Return up to `limit` (distance, name) pairs, closest first"""
+        if max_distance is None:
+            max_distance = default_distance(name)
+        key = normalize(name)
+        matches = []
+        for position in self._candidates(key, max_distance):
+            distance = edit_distance(key, self.normalized[position],
+                                     max_distance)
+            if distance <= max_distance:
+                matches.append((distance, self.names[position]))
+        matches.sort()
+        return matches[:limit]
+
+    def near_duplicates(self, name, max_distance=None):
+        """Return names that are close to, but not exactly, `name`"""
+        return [other for distance, other in self.lookup(name, max_distance)
+                if other != name]
+
+
+def _translated_names(connection, table_name, language_id):
+    table = dex_tables.metadata.tables[table_name]
+    query = select([table.c.name], table.c.local_language_id == language_id)
+    return [name for name, in connection.execute(query)]
+
+
+def build_indexes(session):
+    """Return {'family'|'mechanic'|'illustrator': NameIndex} of all names
+    in the database"""
+    connection = session.connection()
+    language_id = session.default_language_id
+    illustrators = tcg_tables.Illustrator.__table__
+    return dict(
+        family=NameIndex(_translated_names(
+            connection, 'tcg_card_family_names', language_id)),
+        mechanic=NameIndex(_translated_names(
+            connection, 'tcg_mechanic_names', language_id)),
+        illustrator=NameIndex(name for name, in connection.execute(
+            select([illustrators.c.name]))),
+    )
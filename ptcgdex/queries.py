@@ -0,0 +1,133 @@
+# Encoding: UTF-8
+"""Set-based queries for per-family and per-illustrator print listings
+
+These replace walking CardFamily.set_prints or
+Illustrator.print_illustrators object by object: each listing is one
+query, sorted (like set_print_sort_key: release date, set identifier,
+card number) and paginated in SQL, and each count is one more.
+"""
+from __future__ import division, unicode_literals
+
+from collections import namedtuple
+
+from sqlalchemy import func, select
+from pokedex.db import tables as dex_tables
+
+from ptcgdex import tcg_tables
+
+PrintRow = namedtuple('PrintRow', 'print_id card_id family set_identifier '
+                                  'set_name release_date number rarity '
+                                  'holographic scan')
+IllustratorRow = namedtuple('IllustratorRow', 'id identifier name prints '
+                                              'families first_release '
+                                              'latest_release')
+
+set_prints = tcg_tables.SetPrint.__table__
+prints = tcg_tables.Print.__table__
+cards = tcg_tables.Card.__table__
+sets = tcg_tables.Set.__table__
+print_illustrators = tcg_tables.PrintIllustrator.__table__
+illustrators = tcg_tables.Illustrator.__table__
+
+
+def _set_print_join():
+    return (set_prints.join(prints, set_prints.c.print_id == prints.c.id)
+            .join(cards, prints.c.card_id == cards.c.id)
+            .join(sets, set_prints.c.set_id == sets.c.id))
+
+
+def _print_rows(session, where, extra_join=None, limit=None, offset=0):
+    language_id = session.default_language_id
+    family_names = dex_tables.metadata.tables['tcg_card_family_names']
+    set_names = dex_tables.metadata.tables['tcg_set_names']
+    rarities = tcg_tables.Rarity.__table__
+    scans = tcg_tables.Scan.__table__
+    joined = _set_print_join()
+    if extra_join is not None:
+        joined = extra_join(joined)
+    joined = (joined
+              .outerjoin(family_names,
+                         (family_names.c.tcg_card_family_id ==
+                          cards.c.family_id) &
+                         (family_names.c.local_language_id == language_id))
+              .outerjoin(set_names,
+                         (set_names.c.tcg_set_id == sets.c.id) &
+                         (set_names.c.local_language_id == language_id))
+              .outerjoin(rarities, prints.c.rarity_id == rarities.c.id))
+    first_scan = (select([scans.c.filename])
+                  .where(scans.c.print_id == prints.c.id)
+                  .order_by(scans.c.order).limit(1).as_scalar())
+    query = select([prints.c.id, cards.c.id, family_names.c.name,
+                    sets.c.identifier, set_names.c.name,
+                    sets.c.release_date, set_prints.c.number,
+                    rarities.c.identifier, prints.c.holographic,
+                    first_scan]).select_from(joined).where(where)
+    query = query.order_by(sets.c.release_date == None, sets.c.release_date,
+                           sets.c.identifier, set_prints.c.number,
+                           prints.c.id)
+    if limit is not None:
+        query = query.limit(limit)
+    if offset:
+        query = query.offset(offset)
+    return [PrintRow(*row) for row in session.connection().execute(query)]
+
+
+def _count(session, where, extra_join=None):
+    joined = _set_print_join()
+    if extra_join is not None:
+        joined = extra_join(joined)
+    query = select([func.count()]).select_from(joined).where(where)
+    return session.connection().execute(query).scalar()
+
+
+def _with_illustrators(joined):
+    return joined.join(print_illustrators,
+                       print_illustrators.c.print_id == prints.c.id)
+
+
+def family_prints(session, family_id, limit=None, offset=0):
+    """Return PrintRows for all set prints of the family's cards"""
+    return _print_rows(session, cards.c.family_id == family_id,
+                       limit=limit, offset=offset)
+
+
+def count_family_prints(session, family_id):
+    return _count(session, cards.c.family_id == family_id)
+
+
+def illustrator_prints(session, illustrator_id, limit=None, offset=0):
+    """Return PrintRows for all set prints the illustrator worked on"""
+    return _print_rows(session,
+                       print_illustrators.c.illustrator_id == illustrator_id,
+                       extra_join=_with_illustrators,
+                       limit=limit, offset=offset)
+
+
+def count_illustrator_prints(session, illustrator_id):
+    return _count(session,
+                  print_illustrators.c.illustrator_id == illustrator_id,
+                  extra_join=_with_illustrators)
+
+
+def illustrator_summaries(session, limit=None, offset=0):
+    """Return IllustratorRows with per-illustrator totals, by name
+
+    Prints and families are counted over set prints, so a print in two
+    sets counts twice, like in illustrator_prints.
+    """
+    joined = _with_illustrators(_set_print_join()).join(
+        illustrators, print_illustrators.c.illustrator_id == illustrators.c.id)
+    query = select([illustrators.c.id, illustrators.c.identifier,
+                    illustrators.c.name, func.count(),
+                    func.count(cards.c.family_id.distinct()),
+                    func.min(sets.c.release_date),
+                    func.max(sets.c.release_date)]).select_from(joined)
+    query = query.group_by(illustrators.c.id, illustrators.c.identifier,
+                           illustrators.c.name)
+    query = query.order_by(illustrators.c.name, illustrators.c.id)
+    if limit is not None:
+        query = query.limit(limit)
+    if offset:
+        query = query.offset(offset)
+    return [IllustratorRow(*row)
+            for row in session.connection().execute(query)]
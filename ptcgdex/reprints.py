@@ -0,0 +1,124 @@
+# Encoding: UTF-8
+"""Reprint histories, through the tcg_card_reprints table
+
+For every card, the table lists its set prints in release order (the
+order of Card.set_prints: release date, then set identifier, then card
+number), so a card's first and latest prints can be read with one indexed
+query instead of loading every print and set and sorting them in Python.
+"""
+from __future__ import division, unicode_literals
+
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import or_, select
+from pokedex.db import tables as dex_tables
+
+from ptcgdex import tcg_tables
+
+reprint_table = tcg_tables.CardReprint.__table__
+
+Reprint = namedtuple('Reprint', 'card_id order print_id set_identifier '
+                                'set_name release_date number rarity')
+
+
+def _sort_key(row):
+    card_id, print_id, set_id, number, rarity_id, identifier, date = row
+    return card_id, date is None, date, identifier, number
+
+
+def _rows(connection, card_ids=None):
+    """Return CardReprint rows for the given cards (default: all)"""
+    set_prints = tcg_tables.SetPrint.__table__
+    prints = tcg_tables.Print.__table__
+    sets = tcg_tables.Set.__table__
+    query = select([prints.c.card_id, prints.c.id.label('print_id'),
+                    sets.c.id.label('set_id'),
+                    set_prints.c.number, prints.c.rarity_id,
+                    sets.c.identifier, sets.c.release_date],
+                   (set_prints.c.print_id == prints.c.id) &
+                   (set_prints.c.set_id == sets.c.id))
+    if card_ids is not None:
+        query = query.where(prints.c.card_id.in_(card_ids))
+    by_card = defaultdict(list)
+    for row in sorted(connection.execute(query), key=_sort_key):
+        by_card[row[0]].append(row)
+    rows = []
+    for card_id, card_rows in by_card.items():
+        for order, row in enumerate(card_rows):
+            rows.append(dict(card_id=card_id, order=order, print_id=row[1],
+                             set_id=row[2], number=row[3], rarity_id=row[4],
+                             latest=order == len(card_rows) - 1))
+    return rows
+
+
+def rebuild(session):
+    """Recompute the whole reprint table"""
+    connection = session.connection()
+    connection.execute(reprint_table.delete())
+    rows = _rows(connection)
+    if rows:
+        connection.execute(reprint_table.insert(), rows)
+
+
+def refresh(session, set_ids):
+    """Recompute the histories of cards printed in the given sets"""
+    if not set_ids:
+        return
+    connection = session.connection()
+    set_prints = tcg_tables.SetPrint.__table__
+    prints = tcg_tables.Print.__table__
+    card_ids = [id for id, in connection.execute(
+        select([prints.c.card_id],
+               (set_prints.c.print_id == prints.c.id) &
+               set_prints.c.set_id.in_(list(set_ids))).distinct())]
+    if not card_ids:
+        return
+    connection.execute(reprint_table.delete().where(
+        reprint_table.c.card_id.in_(card_ids)))
+    rows = _rows(connection, card_ids)
+    if rows:
+        connection.execute(reprint_table.insert(), rows)
+
+
+def _query(session, condition):
+    r = reprint_table
+    sets = tcg_tables.Set.__table__
+    rarities = tcg_tables.Rarity.__table__
+    set_names = dex_tables.metadata.tables['tcg_set_names']
+    joined = (r.join(sets, r.c.set_id == sets.c.id)
+               .outerjoin(rarities, r.c.rarity_id == rarities.c.id)
+               .outerjoin(set_names,
+                          (set_names.c.tcg_set_id == sets.c.id) &
+                          (set_names.c.local_language_id ==
+                           session.default_language_id)))
+    query = select([r.c.card_id, r.c.order, r.c.print_id, sets.c.identifier,
+                    set_names.c.name, sets.c.release_date, r.c.number,
+                    rarities.c.identifier]).select_from(joined)
+    query = query.where(condition).order_by(r.c.card_id, r.c.order)
+    return [Reprint(*row) for row in session.connection().execute(query)]
+
+
+def history(session, card_id):
+    """Return the card's Reprints in release order"""
+    return _query(session, reprint_table.c.card_id == card_id)
+
+
+def first_and_latest(session, card_ids):
+    """Return {card id: (first Reprint, latest Reprint)}
+
+    The two are the same for cards printed only once.
+    """
+    card_ids = list(card_ids)
+    if not card_ids:
+        return {}
+    r = reprint_table
+    result = {}
+    for reprint in _query(session, r.c.card_id.in_(card_ids) &
+                          or_(r.c.order == 0, r.c.latest)):
+        first, latest = result.get(reprint.card_id, (reprint, reprint))
+        if reprint.order == 0:
+            first = reprint
+        else:
+            latest = reprint
+        result[reprint.card_id] = first, latest
+    return result
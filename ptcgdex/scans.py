@@ -0,0 +1,162 @@
+# Encoding: UTF-8
+"""Checking scan image files against tcg_scans
+
+The scan directory is walked once (with os.scandir where available, so
+most files need no separate stat call) and compared with the manifest in
+tcg_scan_files. Only files whose path, size or modification time changed
+are hashed again, in parallel. Missing, orphaned and changed scans are
+then found by joining the manifest with tcg_scans.
+
+A file matches a scan if its name without extension is the scan's
+filename, wherever it is under the directory.
+"""
+from __future__ import division, unicode_literals
+
+import os
+import sys
+import hashlib
+import multiprocessing
+from collections import namedtuple
+
+from sqlalchemy import and_, select
+
+from ptcgdex import tcg_tables
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+manifest_table = tcg_tables.ScanFile.__table__
+
+FileInfo = namedtuple('FileInfo', 'filename path size mtime')
+ManifestUpdate = namedtuple('ManifestUpdate', 'files hashed removed duplicates')
+Report = namedtuple('Report', 'missing orphaned changed')
+
+FS_ENCODING = sys.getfilesystemencoding() or 'utf-8'
+
+
+def _text(path):
+    """Return a path as text; Python 2 gives bytes for a bytes directory"""
+    if isinstance(path, bytes):
+        return path.decode(FS_ENCODING)
+    return path
+
+
+def _file_info(directory, path, stat):
+    path = _text(path)
+    filename = os.path.splitext(os.path.basename(path))[0]
+    return FileInfo(filename, os.path.relpath(path, directory),
+                    stat.st_size, stat.st_mtime)
+
+
+def walk(directory):
+    """Yield a FileInfo for every file under directory"""
+    directory = _text(directory)
+    if scandir is None:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                yield _file_info(directory, path, os.stat(path))
+        return
+    pending = [directory]
+    while pending:
+        for entry in scandir(pending.pop()):
+            if entry.is_dir():
+                pending.append(entry.path)
+            elif entry.is_file():
+                yield _file_info(directory, entry.path, entry.stat())
+
+
+def _hash_file(args):
+    filename, path = args
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 16), b''):
+            digest.update(block)
+    return filename, digest.hexdigest()
+
+
+def update_manifest(session, directory, jobs=None, print_status=None):
+    """Bring tcg_scan_files up to date with the files in directory
+
+    Returns a ManifestUpdate with the number of files seen, hashed and
+    removed from the manifest, and the paths of files skipped because
+    another file already has their name.
+    """
+    directory = _text(directory)
+    connection = session.connection()
+    c = manifest_table.c
+    known = dict((row[0], tuple(row[1:])) for row in connection.execute(
+        select([c.filename, c.path, c.size, c.mtime])))
+    files = {}
+    duplicates = []
+    for info in sorted(walk(directory), key=lambda info: info.path):
+        if info.filename in files:
+            duplicates.append(info.path)
+        else:
+            files[info.filename] = info
+    stale = [info for filename, info in sorted(files.items())
+             if known.get(filename) != (info.path, info.size, info.mtime)]
+
+    hashes = {}
+    if stale:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.imap_unordered(_hash_file, [
+                (info.filename, os.path.join(directory, info.path))
+                for info in stale], chunksize=16)
+            for i, (filename, sha1) in enumerate(results):
+                if print_status:
+                    print_status('{}/{} {}'.format(i + 1, len(stale),
+                                                   filename))
+                hashes[filename] = sha1
+        finally:
+            pool.close()
+            pool.join()
+
+    removed = [filename for filename in known if filename not in files]
+    if removed:
+        connection.execute(manifest_table.delete().where(
+            c.filename.in_(removed)))
+    connection.execute(manifest_table.update().values(previous_sha1=c.sha1))
+    for info in stale:
+        values = dict(path=info.path, size=info.size, mtime=info.mtime,
+                      sha1=hashes[info.filename])
+        if info.filename in known:
+            connection.execute(manifest_table.update().where(
+                c.filename == info.filename).values(**values))
+        else:
+            connection.execute(manifest_table.insert().values(
+                filename=info.filename, previous_sha1=None, **values))
+    return ManifestUpdate(len(files), len(stale), len(removed), duplicates)
+
+
+def report(session):
+    """Return a Report of (filename, print id) lists of missing and changed
+    scans, and the paths of files no scan refers to"""
+    connection = session.connection()
+    scans = tcg_tables.Scan.__table__
+    files = manifest_table
+    missing = connection.execute(
+        select([scans.c.filename, scans.c.print_id])
+        .select_from(scans.outerjoin(
+            files, files.c.filename == scans.c.filename))
+        .where(files.c.filename == None)
+        .order_by(scans.c.filename)).fetchall()
+    changed = connection.execute(
+        select([scans.c.filename, scans.c.print_id],
+               and_(files.c.filename == scans.c.filename,
+                    files.c.previous_sha1 != None,
+                    files.c.previous_sha1 != files.c.sha1))
+        .order_by(scans.c.filename)).fetchall()
+    orphaned = [path for path, in connection.execute(
+        select([files.c.path])
+        .select_from(files.outerjoin(
+            scans, scans.c.filename == files.c.filename))
+        .where(scans.c.id == None)
+        .order_by(files.c.path))]
+    return Report(missing, orphaned, changed)
@@ -0,0 +1,121 @@
+# Encoding: UTF-8
+"""Writing every set to its own .cards file, in parallel
+
+Each worker process has its own read connection and exports whole sets,
+loading their prints in batches. A file is only replaced when its
+contents change, and then atomically, through a temporary file in the
+same directory.
+"""
+from __future__ import division, unicode_literals
+
+import os
+import hashlib
+import tempfile
+import multiprocessing
+
+_session = None
+
+
+def _init_worker(engine_uri):
+    global _session
+    import pokedex.db
+    _session = pokedex.db.connect(engine_uri)
+
+
+def file_digest(filename):
+    """Return the SHA-1 hex digest of a file, or None if it doesn't exist"""
+    digest = hashlib.sha1()
+    try:
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(2 ** 16), b''):
+                digest.update(block)
+    except IOError:
+        return None
+    return digest.hexdigest()
+
+
+def write_if_changed(filename, data):
+    """Atomically write data (a byte string) unless the file already has it
+
+    Returns True if the file was written.
+    """
+    if file_digest(filename) == hashlib.sha1(data).hexdigest():
+        return False
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_name = tempfile.mkstemp(
+        dir=directory, prefix='.' + os.path.basename(filename), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp makes the file private; give it the usual permissions
+        mode = (os.stat(filename).st_mode if os.path.exists(filename)
+                else 0o644)
+        os.chmod(temp_name, mode & 0o777)
+        if os.name == 'nt' and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(temp_name, filename)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+    return True
+
+
+def render_set(session, identifier):
+    """Return the .cards file contents for the given set, as bytes"""
+    from ptcgdex import tcg_tables
+    from ptcgdex import load as ptcg_load
+    tcg_set = (session.query(tcg_tables.Set)
+               .filter_by(identifier=identifier)
+               .options(*ptcg_load.print_load_options('set_prints.print_.'))
+               .one())
+    data = ptcg_load.yaml_dump(ptcg_load.export_set(tcg_set))
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return data
+
+
+def _dump_set(args):
+    identifier, directory = args
+    filename = os.path.join(directory, '{}.cards'.format(identifier))
+    try:
+        data = render_set(_session, identifier)
+        return identifier, write_if_changed(filename, data), None
+    except Exception as e:
+        return identifier, False, '{}: {}'.format(type(e).__name__, e)
+    finally:
+        # Don't hold the read transaction or the loaded objects
+        _session.rollback()
+        _session.expunge_all()
+
+
+def dump_sets(engine_uri, identifiers, directory, jobs=None,
+              print_status=None):
+    """Write <identifier>.cards into directory for each given set
+
+    Returns a (written, unchanged, errors) tuple; `errors` maps set
+    identifiers to messages.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    pool = multiprocessing.Pool(jobs, _init_worker, (engine_uri, ))
+    written = []
+    unchanged = []
+    errors = {}
+    try:
+        results = pool.imap_unordered(
+            _dump_set, [(identifier, directory) for identifier in identifiers])
+        for i, (identifier, changed, error) in enumerate(results):
+            if print_status:
+                print_status('{}/{} {}'.format(i + 1, len(identifiers),
+                                               identifier))
+            if error:
+                errors[identifier] = error
+            elif changed:
+                written.append(identifier)
+            else:
+                unchanged.append(identifier)
+    finally:
+        pool.close()
+        pool.join()
+    return sorted(written), sorted(unchanged), errors
@@ -0,0 +1,142 @@
+# Encoding: UTF-8
+"""Per-set counts, through the tcg_set_stats table
+
+Each set has a row per stat:
+
+- prints: prints in the set
+- holographic: holographic prints
+- cards: distinct cards
+- reprints: distinct cards already printed in an earlier-released set
+- rarity:<identifier>, class:<identifier>, type:<identifier>: prints of
+  each rarity, card class and type (dual-type cards count for both)
+
+The counts are computed with grouped INSERT ... SELECT statements, either
+for all sets or for the sets an import touched.
+"""
+from __future__ import division, unicode_literals
+
+from collections import defaultdict
+
+from sqlalchemy import Unicode, and_, exists, func, literal, select
+
+from ptcgdex import tcg_tables
+
+stats_table = tcg_tables.SetStat.__table__
+
+SUMMARY_STATS = ['prints', 'cards', 'reprints', 'holographic']
+BREAKDOWNS = ['rarity', 'class', 'type']
+
+
+def _label(text):
+    return literal(text, Unicode)
+
+
+def _stat_queries():
+    """Yield selects of (set_id, stat, count), to be filtered by set"""
+    set_prints = tcg_tables.SetPrint.__table__
+    prints = tcg_tables.Print.__table__
+    cards = tcg_tables.Card.__table__
+    sets = tcg_tables.Set.__table__
+    base = set_prints.join(prints, set_prints.c.print_id == prints.c.id)
+    set_id = set_prints.c.set_id
+
+    def grouped(label, count, from_=base, where=None, key=None):
+        stat = _label(label) if key is None else _label(label) + key
+        query = select([set_id, stat, count]).select_from(from_)
+        if where is not None:
+            query = query.where(where)
+        group_by = [set_id] if key is None else [set_id, key]
+        return query.group_by(*group_by)
+
+    yield grouped('prints', func.count())
+    yield grouped('holographic', func.count(), where=prints.c.holographic)
+    yield grouped('cards', func.count(prints.c.card_id.distinct()))
+
+    earlier_set_prints = set_prints.alias()
+    earlier_prints = prints.alias()
+    earlier_sets = sets.alias()
+    printed_earlier = exists().select_from(
+        earlier_set_prints
+        .join(earlier_prints,
+              earlier_set_prints.c.print_id == earlier_prints.c.id)
+        .join(earlier_sets, earlier_set_prints.c.set_id == earlier_sets.c.id)
+    ).where(and_(earlier_prints.c.card_id == prints.c.card_id,
+                 earlier_sets.c.release_date < sets.c.release_date))
+    yield grouped('reprints', func.count(prints.c.card_id.distinct()),
+                  from_=base.join(sets, set_id == sets.c.id),
+                  where=printed_earlier)
+
+    rarities = tcg_tables.Rarity.__table__
+    yield grouped('rarity:', func.count(),
+                  from_=base.join(rarities,
+                                  prints.c.rarity_id == rarities.c.id),
+                  key=rarities.c.identifier)
+    classes = tcg_tables.Class.__table__
+    with_cards = base.join(cards, prints.c.card_id == cards.c.id)
+    yield grouped('class:', func.count(),
+                  from_=with_cards.join(classes,
+                                        cards.c.class_id == classes.c.id),
+                  key=classes.c.identifier)
+    card_types = tcg_tables.CardType.__table__
+    types = tcg_tables.TCGType.__table__
+    yield grouped('type:', func.count(),
+                  from_=with_cards
+                  .join(card_types, card_types.c.card_id == cards.c.id)
+                  .join(types, card_types.c.type_id == types.c.id),
+                  key=types.c.identifier)
+
+
+def _fill(connection, set_ids=None):
+    columns = [stats_table.c.set_id, stats_table.c.stat, stats_table.c.count]
+    set_id = tcg_tables.SetPrint.__table__.c.set_id
+    for query in _stat_queries():
+        if set_ids is not None:
+            query = query.where(set_id.in_(set_ids))
+        connection.execute(stats_table.insert().from_select(columns, query))
+
+
+def rebuild(session):
+    """Recompute the whole stats table"""
+    connection = session.connection()
+    connection.execute(stats_table.delete())
+    _fill(connection)
+
+
+def affected_sets(connection, set_ids):
+    """Return ids of the given sets and of sets sharing cards with them
+
+    The reprint counts of the latter depend on the former.
+    """
+    set_prints = tcg_tables.SetPrint.__table__
+    prints = tcg_tables.Print.__table__
+    base = set_prints.join(prints, set_prints.c.print_id == prints.c.id)
+    their_cards = select([prints.c.card_id]).select_from(base).where(
+        set_prints.c.set_id.in_(set_ids))
+    query = select([set_prints.c.set_id]).select_from(base).where(
+        prints.c.card_id.in_(their_cards)).distinct()
+    return set(set_ids) | set(id for id, in connection.execute(query))
+
+
+def refresh(session, set_ids):
+    """Recompute the stats of the given sets, and of sets they affect"""
+    if not set_ids:
+        return
+    connection = session.connection()
+    set_ids = sorted(affected_sets(connection, list(set_ids)))
+    connection.execute(stats_table.delete().where(
+        stats_table.c.set_id.in_(set_ids)))
+    _fill(connection, set_ids)
+
+
+def read(session, identifiers=None):
+    """Return {set identifier: {stat: count}}, in one query"""
+    sets = tcg_tables.Set.__table__
+    query = select([sets.c.identifier, stats_table.c.stat,
+                    stats_table.c.count],
+                   stats_table.c.set_id == sets.c.id)
+    if identifiers:
+        query = query.where(sets.c.identifier.in_(identifiers))
+    result = defaultdict(dict)
+    for identifier, stat, count in session.connection().execute(query):
+        result[identifier][stat] = count
+    return result
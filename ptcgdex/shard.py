@@ -0,0 +1,434 @@
+# Encoding: UTF-8
+"""Parallel import into per-process SQLite shards, merged afterwards
+
+Every shard starts as a copy of the target database, so it sees all the
+families, mechanics and cards that exist already. Worker processes import
+disjoint groups of files into their shards; the shards are then merged
+into the target one at a time with ATTACH and INSERT ... SELECT.
+
+A PostgreSQL target can't ATTACH a shard; there, shards start out with
+just the reference data, and the merge streams remapped rows from them
+with COPY FROM STDIN.
+
+Rows a shard added (those with an id above the snapshot's maximum) get
+new ids in the target. Card families, illustrators, subclasses, mechanics
+and cards that some earlier shard (or the target) already has are not
+copied; references to them are pointed at the existing rows instead.
+"""
+from __future__ import division, unicode_literals
+
+import os
+import shutil
+import tempfile
+import multiprocessing
+from collections import defaultdict
+
+from sqlalchemy import text
+
+# Tables with surrogate ids, in the order they are merged.
+# Rows of the first five are deduplicated; the rest are always new.
+ID_TABLES = [
+    'tcg_card_families',
+    'tcg_illustrators',
+    'tcg_subclasses',
+    'tcg_mechanics',
+    'tcg_cards',
+    'tcg_pokemon_flavors',
+    'tcg_prints',
+    'tcg_scans',
+    'tcg_sets',
+]
+
+IDENTIFIER_TABLES = ['tcg_card_families', 'tcg_illustrators', 'tcg_subclasses']
+
+
+def _tables():
+    from ptcgdex import tcg_tables
+    tables = {}
+    for cls in tcg_tables.tcg_classes:
+        tables[cls.__tablename__] = cls.__table__
+        for translation in cls.translation_classes:
+            tables[translation.__tablename__] = translation.__table__
+    return tables
+
+
+def _remapped_table(table, column):
+    """Return the name of the id table whose ids `column` holds, if any"""
+    if column.name == 'id' and table.name in ID_TABLES:
+        return table.name
+    for fk in column.foreign_keys:
+        if fk.column.table.name in ID_TABLES:
+            return fk.column.table.name
+
+
+def _owner_column(table):
+    """Return the primary key column that ties a table's rows to an id table
+    """
+    for column in table.primary_key.columns:
+        if _remapped_table(table, column):
+            return column
+
+
+def dependent_tables():
+    """Return {id table name: [(table, owner column)]} for all other tables
+    """
+    from ptcgdex import tcg_tables
+    result = defaultdict(list)
+    skip = set(ID_TABLES)
+    skip.add(tcg_tables.ImportCheckpoint.__tablename__)
+    skip.add(tcg_tables.DataVersion.__tablename__)
+    skip.add(tcg_tables.ScanFile.__tablename__)
+    # Derived tables are rebuilt after merging
+    skip.update(cls.__tablename__ for cls in tcg_tables.tcg_classes
+                if getattr(cls, 'derived', False))
+    for name, table in sorted(_tables().items()):
+        if name in skip:
+            continue
+        owner = _owner_column(table)
+        if owner is not None:
+            result[_remapped_table(table, owner)].append((table, owner))
+    return result
+
+
+def _name(schema, table):
+    if schema:
+        return '{}.{}'.format(schema, table)
+    return table
+
+
+class MergeState(object):
+    """Target-side lookup tables, kept up to date across shard merges"""
+    def __init__(self, session, baseline, schema='main'):
+        from ptcgdex import load as ptcg_load
+        conn = session.connection()
+        self.baseline = baseline
+        self.schema = schema
+        self.identifiers = {}
+        for table in IDENTIFIER_TABLES:
+            self.identifiers[table] = dict(conn.execute(
+                'SELECT identifier, id FROM {}'.format(_name(schema, table))))
+        self.mechanics = {fp: ident for ident, fp in
+                          ptcg_load.mechanic_fingerprints(session).items()}
+        self.cards = {fp: ident for ident, fp in
+                      ptcg_load.card_fingerprints(session).items()}
+        self.set_identifiers = set(ident for ident, in conn.execute(
+            'SELECT identifier FROM {}'.format(_name(schema, 'tcg_sets'))))
+
+
+def _map_ids(target, shard, shard_schema, shard_session, table, state):
+    """Decide the target id of each new shard row of `table`
+
+    Mechanics and cards are matched by the fingerprint of their export, which
+    doesn't depend on the ids of the rows they refer to.
+
+    Returns {shard id: (target id, inserted)}.
+    """
+    from ptcgdex import load as ptcg_load
+    base = state.baseline[table]
+    next_id = (target.execute('SELECT max(id) FROM {}'.format(
+        _name(state.schema, table))).scalar() or 0) + 1
+    shard_table = _name(shard_schema, table)
+    if table in IDENTIFIER_TABLES:
+        existing = state.identifiers[table]
+        rows = shard.execute(text(
+            'SELECT id, identifier FROM {} WHERE id > :base'.format(
+                shard_table)), base=base).fetchall()
+        keyed = [(ident, key, existing) for ident, key in rows]
+    elif table == 'tcg_mechanics':
+        keyed = [(ident, fp, state.mechanics) for ident, fp in
+                 ptcg_load.mechanic_fingerprints(shard_session, base).items()]
+    elif table == 'tcg_cards':
+        keyed = [(ident, fp, state.cards) for ident, fp in
+                 ptcg_load.card_fingerprints(shard_session, base).items()]
+    else:
+        if table == 'tcg_sets':
+            for ident, in shard.execute(text(
+                    'SELECT identifier FROM {} WHERE id > :base'.format(
+                        shard_table)), base=base):
+                if ident in state.set_identifiers:
+                    raise ValueError('Set {} imported twice'.format(ident))
+                state.set_identifiers.add(ident)
+        keyed = [(ident, None, None) for ident, in shard.execute(text(
+            'SELECT id FROM {} WHERE id > :base'.format(shard_table)),
+            base=base)]
+    mapping = {}
+    for ident, key, existing in sorted(keyed):
+        if existing is not None and key in existing:
+            mapping[ident] = existing[key], False
+        else:
+            mapping[ident] = next_id, True
+            if existing is not None:
+                existing[key] = next_id
+            next_id += 1
+    return mapping
+
+
+def _copy_rows(conn, table, owner):
+    """INSERT ... SELECT the rows of `table` that belong to new owner rows"""
+    columns = []
+    expressions = []
+    for column in table.columns:
+        name = '"{}"'.format(column.name)
+        columns.append(name)
+        remapped = _remapped_table(table, column)
+        if remapped:
+            expressions.append(
+                'COALESCE((SELECT new_id FROM temp.map_{0} '
+                'WHERE old_id = s.{1}), s.{1})'.format(remapped, name))
+        else:
+            expressions.append('s.' + name)
+    conn.execute('''
+        INSERT INTO main.{table} ({columns})
+        SELECT {expressions} FROM shard.{table} s
+        WHERE s."{owner}" IN (
+            SELECT old_id FROM temp.map_{owner_table} WHERE inserted)
+        '''.format(table=table.name, columns=', '.join(columns),
+                   expressions=', '.join(expressions), owner=owner.name,
+                   owner_table=_remapped_table(table, owner)))
+
+
+def merge_shard(engine, shard_path, state):
+    """Merge one shard database into the target"""
+    import pokedex.db
+    from ptcgdex import tcg_tables
+    tables = _tables()
+    dependents = dependent_tables()
+    shard_session = pokedex.db.connect('sqlite:///' + shard_path)
+    conn = engine.connect()
+    # ATTACH and CREATE must happen outside of a transaction
+    conn.execute('ATTACH DATABASE ? AS shard', shard_path)
+    for table in ID_TABLES:
+        conn.execute('CREATE TEMP TABLE map_{} (old_id INTEGER PRIMARY KEY, '
+                     'new_id INTEGER NOT NULL, inserted BOOLEAN NOT NULL)'
+                     .format(table))
+    transaction = conn.begin()
+    try:
+        maps = {}
+        for name in ID_TABLES:
+            maps[name] = mapping = _map_ids(conn, conn, 'shard',
+                                            shard_session, name, state)
+            if mapping:
+                conn.execute(
+                    'INSERT INTO temp.map_{} VALUES (?, ?, ?)'.format(name),
+                    [(old, new, inserted)
+                     for old, (new, inserted) in mapping.items()])
+            table = tables[name]
+            _copy_rows(conn, table, table.c.id)
+            for dependent, owner in dependents[name]:
+                _copy_rows(conn, dependent, owner)
+        checkpoints = tcg_tables.ImportCheckpoint.__tablename__
+        conn.execute('INSERT OR REPLACE INTO main.{0} SELECT * FROM shard.{0}'
+                     .format(checkpoints))
+        transaction.commit()
+    except:
+        transaction.rollback()
+        raise
+    finally:
+        for table in ID_TABLES:
+            conn.execute('DROP TABLE temp.map_{}'.format(table))
+        conn.execute('DETACH DATABASE shard')
+        conn.close()
+        shard_session.close()
+    return {name: sum(1 for new, inserted in mapping.values() if inserted)
+            for name, mapping in maps.items()}
+
+
+def _remapped_rows(shard, table, owner, maps):
+    """Yield the shard rows of `table` that belong to new owner rows,
+    with all ids translated to target ids
+    """
+    owner_map = maps[_remapped_table(table, owner)]
+    remaps = [maps.get(_remapped_table(table, column)) for column in table.c]
+    owner_index = list(table.c).index(owner)
+    for row in shard.execute(table.select()):
+        new_owner = owner_map.get(row[owner_index])
+        if new_owner is None or not new_owner[1]:
+            continue
+        yield [mapping[value][0] if mapping and value in mapping else value
+               for mapping, value in zip(remaps, row)]
+
+
+def merge_shard_copy(connection, shard_path, state):
+    """Merge one shard into a PostgreSQL target with COPY FROM STDIN
+
+    Nothing is committed. Tables are copied in dependency order, so the
+    (non-deferrable) foreign keys hold after every COPY.
+    """
+    import pokedex.db
+    from ptcgdex import tcg_tables
+    from ptcgdex import load as ptcg_load
+    tables = _tables()
+    dependents = dependent_tables()
+    shard_session = pokedex.db.connect('sqlite:///' + shard_path)
+    shard = shard_session.connection()
+    try:
+        maps = {}
+        for name in ID_TABLES:
+            maps[name] = _map_ids(connection, shard, None, shard_session,
+                                  name, state)
+            table = tables[name]
+            for copied, owner in [(table, table.c.id)] + dependents[name]:
+                ptcg_load.copy_rows(connection, copied,
+                                    [c.name for c in copied.c],
+                                    _remapped_rows(shard, copied, owner, maps))
+        checkpoints = tcg_tables.ImportCheckpoint.__table__
+        rows = shard.execute(checkpoints.select()).fetchall()
+        for row in rows:
+            connection.execute(checkpoints.delete().where(
+                (checkpoints.c.identifier == row.identifier) &
+                (checkpoints.c.document == row.document)))
+        ptcg_load.copy_rows(connection, checkpoints,
+                            [c.name for c in checkpoints.c], rows)
+        ptcg_load.reset_sequences(connection,
+                                  [tables[name] for name in ID_TABLES])
+    finally:
+        shard_session.close()
+    return {name: sum(1 for new, inserted in mapping.values() if inserted)
+            for name, mapping in maps.items()}
+
+
+def group_files(filenames, count):
+    """Split files into `count` groups of roughly equal total size"""
+    groups = [[] for i in range(count)]
+    sizes = [0] * count
+    for filename in sorted(filenames, key=os.path.getsize, reverse=True):
+        i = sizes.index(min(sizes))
+        groups[i].append(filename)
+        sizes[i] += os.path.getsize(filename)
+    return [group for group in groups if group]
+
+
+def _seed_shard(seed_uri, shard_path):
+    """Create a shard with reference data and checkpoints from `seed_uri`"""
+    import pokedex.db
+    from ptcgdex import tcg_tables
+    from ptcgdex import load as ptcg_load
+    source = pokedex.db.connect(seed_uri)
+    session = ptcg_load.make_scratch_session(source, 'sqlite:///' + shard_path)
+    checkpoints = tcg_tables.ImportCheckpoint.__table__
+    rows = [dict(row) for row in
+            source.connection().execute(checkpoints.select())]
+    if rows:
+        session.connection().execute(checkpoints.insert(), rows)
+        session.commit()
+    source.close()
+    return session
+
+
+def _import_shard(args):
+    shard_path, filenames, resume, seed_uri = args
+    import pokedex.db
+    from ptcgdex import load as ptcg_load
+    if seed_uri:
+        session = _seed_shard(seed_uri, shard_path)
+    else:
+        session = pokedex.db.connect('sqlite:///' + shard_path)
+    # Shards are scratch copies; durability doesn't matter
+    session.connection().execute("PRAGMA journal_mode=OFF")
+    session.connection().execute("PRAGMA synchronous=OFF")
+    cache = ptcg_load.ImportCache()
+    for filename in filenames:
+        with open(filename) as f:
+            identifier = os.path.splitext(os.path.basename(filename))[0]
+            ptcg_load.import_(session, f, filename, identifier,
+                              verbose=False, resume=resume, cache=cache)
+    session.close()
+    return shard_path, filenames
+
+
+def check_new_names(session, known_names, cache):
+    """Record the names added since `known_names` was built that are
+    similar to earlier ones in `cache.near_duplicates`"""
+    from ptcgdex import names
+    cache.name_indexes = known_names
+    for kind, index in sorted(names.build_indexes(session).items()):
+        for name in index.names:
+            if name not in known_names[kind]:
+                cache.check_new_name(session, kind, name)
+
+
+def import_sharded(session, filenames, shards, verbose=True, resume=False,
+                   cache=None):
+    """Import files into `shards` parallel SQLite shards and merge them
+
+    The session must be connected to an SQLite file or PostgreSQL database.
+    New names similar to existing ones are recorded in
+    `cache.near_duplicates`, as a plain import would; they are checked
+    after the merge, so names from different shards are compared too.
+    """
+    from pokedex.db import load as dex_load
+    from ptcgdex import load as ptcg_load
+    from ptcgdex import names
+    from ptcgdex import versions
+    print_start, print_status, print_done = dex_load._get_verbose_prints(
+        verbose)
+    engine = session.bind
+    postgresql = engine.dialect.name == 'postgresql'
+    target_path = engine.url.database
+    if not postgresql and (engine.dialect.name != 'sqlite' or not target_path):
+        raise ValueError('Sharded import needs an SQLite file or '
+                         'PostgreSQL database')
+    session.commit()
+    if cache is not None:
+        known_names = names.build_indexes(session)
+    if postgresql:
+        seed_uri = str(engine.url)
+        baseline = dict.fromkeys(ID_TABLES, 0)
+        state = MergeState(session, baseline, schema=None)
+        session.expunge_all()
+    else:
+        seed_uri = None
+        conn = session.connection()
+        baseline = {}
+        for table in ID_TABLES:
+            baseline[table] = conn.execute(
+                'SELECT max(id) FROM main.{}'.format(table)).scalar() or 0
+        state = MergeState(session, baseline)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        session.close()
+
+    groups = group_files(filenames, shards)
+    directory = tempfile.mkdtemp(prefix='ptcgdex-shards-')
+    try:
+        jobs = []
+        for i, group in enumerate(groups):
+            shard_path = os.path.join(directory, 'shard-{}.sqlite'.format(i))
+            if not postgresql:
+                shutil.copyfile(target_path, shard_path)
+            jobs.append((shard_path, group, resume, seed_uri))
+
+        print_start('Importing {} files into {} shards'.format(
+            len(filenames), len(jobs)))
+        pool = multiprocessing.Pool(len(jobs))
+        try:
+            results = pool.imap_unordered(_import_shard, jobs)
+            shard_paths = []
+            for shard_path, group in results:
+                shard_paths.append(shard_path)
+                print_status('{}/{}'.format(len(shard_paths), len(jobs)))
+        finally:
+            pool.close()
+            pool.join()
+        print_done()
+
+        totals = defaultdict(int)
+        print_start('Merging shards')
+        for i, shard_path in enumerate(sorted(shard_paths)):
+            print_status('{}/{}'.format(i + 1, len(shard_paths)))
+            if postgresql:
+                counts = merge_shard_copy(session.connection(), shard_path,
+                                          state)
+            else:
+                counts = merge_shard(engine, shard_path, state)
+            for table, count in counts.items():
+                totals[table] += count
+        if cache is not None:
+            check_new_names(session, known_names, cache)
+        ptcg_load.rebuild_derived(session)
+        versions.bump_all_sets(session)
+        session.commit()
+        print_done('{} cards, {} prints'.format(
+            totals['tcg_cards'], totals['tcg_prints']))
+    finally:
+        shutil.rmtree(directory)
+    return dict(totals)
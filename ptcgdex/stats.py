@@ -0,0 +1,206 @@
+# Encoding: UTF-8
+"""Attack and Energy cost statistics
+
+All attacks are read with one query (card, set, card type, base damage,
+total Energy cost), turned into NumPy arrays, and aggregated:
+
+- damage per Energy: mean base damage / total cost, by set and card type
+  (attacks with no damage or no cost are left out)
+- cost curve: number of attacks by total Energy cost
+- cost frontier: for each damage level, the cheapest attack reaching it,
+  which answers "cheapest attack doing at least N damage" by bisection
+
+Results depend only on the card data, so they are cached as JSON files
+keyed by the data version (see ptcgdex.versions and cached_stats()).
+NumPy is an optional dependency (pip install TCGdex[analytics]).
+"""
+from __future__ import division, unicode_literals
+
+import io
+import os
+import json
+import bisect
+import hashlib
+
+from sqlalchemy import and_, func, select
+
+from ptcgdex import tcg_tables
+from ptcgdex import versions
+from ptcgdex.cache import default_cache_dir
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+VERSIONED_TABLES = [
+    tcg_tables.Mechanic,
+    tcg_tables.MechanicCost,
+    tcg_tables.CardMechanic,
+    tcg_tables.CardType,
+    tcg_tables.SetPrint,
+]
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('Statistics need NumPy; '
+                          'install it with pip install numpy')
+
+
+def data_version(session):
+    """Return a string that changes whenever the attack data changes
+
+    This is the global tcg_data_versions token. For databases without
+    one, a hash of the attack tables' row counts is used.
+    """
+    token = versions.token(session)
+    if token:
+        return token
+    connection = session.connection()
+    parts = []
+    for cls in VERSIONED_TABLES:
+        table = cls.__table__
+        count, = connection.execute(
+            select([func.count()]).select_from(table)).fetchone()
+        parts.append('{}:{}'.format(table.name, count))
+    mechanics = tcg_tables.Mechanic.__table__
+    top, = connection.execute(select([func.max(mechanics.c.id)])).fetchone()
+    parts.append('max:{}'.format(top))
+    return hashlib.sha1(' '.join(parts).encode('utf-8')).hexdigest()
+
+
+def attack_rows(session):
+    """Return (set identifier, card id, mechanic id, type identifier,
+    damage, cost) for every printed attack, in one query"""
+    card_mechanics = tcg_tables.CardMechanic.__table__
+    mechanics = tcg_tables.Mechanic.__table__
+    mechanic_classes = tcg_tables.MechanicClass.__table__
+    costs = tcg_tables.MechanicCost.__table__
+    prints = tcg_tables.Print.__table__
+    set_prints = tcg_tables.SetPrint.__table__
+    sets = tcg_tables.Set.__table__
+    card_types = tcg_tables.CardType.__table__
+    types = tcg_tables.TCGType.__table__
+
+    total_cost = select([costs.c.mechanic_id,
+                         func.sum(costs.c.amount).label('cost')])
+    total_cost = total_cost.group_by(costs.c.mechanic_id).alias('total_cost')
+
+    joined = card_mechanics.join(
+        mechanics, mechanics.c.id == card_mechanics.c.mechanic_id
+    ).join(
+        mechanic_classes, mechanic_classes.c.id == mechanics.c.class_id
+    ).join(
+        prints, prints.c.card_id == card_mechanics.c.card_id
+    ).join(
+        set_prints, set_prints.c.print_id == prints.c.id
+    ).join(
+        sets, sets.c.id == set_prints.c.set_id
+    ).outerjoin(
+        total_cost, total_cost.c.mechanic_id == mechanics.c.id
+    ).outerjoin(
+        card_types, and_(card_types.c.card_id == card_mechanics.c.card_id,
+                         card_types.c.order == 0)
+    ).outerjoin(
+        types, types.c.id == card_types.c.type_id)
+    query = select([sets.c.identifier, card_mechanics.c.card_id,
+                    mechanics.c.id, types.c.identifier,
+                    mechanics.c.damage_base, total_cost.c.cost],
+                   mechanic_classes.c.identifier == 'attack',
+                   from_obj=joined, distinct=True)
+    return session.connection().execute(query).fetchall()
+
+
+def _grouped_means(keys, values):
+    """Return {key: (count, mean of values)} for parallel arrays"""
+    labels, inverse = numpy.unique(keys, return_inverse=True)
+    counts = numpy.bincount(inverse, minlength=len(labels))
+    sums = numpy.bincount(inverse, weights=values, minlength=len(labels))
+    return dict((label, (int(count), float(total) / int(count)))
+                for label, count, total in zip(labels.tolist(), counts, sums)
+                if count)
+
+
+def compute_stats(session):
+    """Compute all aggregates; return a JSON-serializable dict"""
+    _require_numpy()
+    rows = attack_rows(session)
+    set_ids = numpy.array([row[0] for row in rows], dtype=object)
+    type_ids = numpy.array([row[3] or 'none' for row in rows], dtype=object)
+    damage = numpy.array([row[4] or 0 for row in rows], dtype=numpy.int64)
+    cost = numpy.array([row[5] or 0 for row in rows], dtype=numpy.int64)
+
+    scoring = (damage > 0) & (cost > 0)
+    ratio = damage[scoring] / cost[scoring]
+    group_keys = numpy.array(
+        ['{}\t{}'.format(s, t) for s, t in
+         zip(set_ids[scoring], type_ids[scoring])], dtype=object)
+    damage_per_energy = []
+    for key, (count, mean) in sorted(
+            _grouped_means(group_keys, ratio).items()):
+        set_identifier, type_identifier = key.split('\t')
+        damage_per_energy.append(dict(
+            set=set_identifier, type=type_identifier, attacks=count,
+            mean=round(mean, 2)))
+
+    # Each card's attack counts once from here on, however often printed
+    first_rows = {}
+    for i, row in enumerate(rows):
+        first_rows.setdefault((row[1], row[2]), i)
+    unique = numpy.array(sorted(first_rows.values()), dtype=numpy.int64)
+    unique_damage = damage[unique]
+    unique_cost = cost[unique]
+    mechanic_ids = numpy.array([rows[i][2] for i in unique],
+                               dtype=numpy.int64)
+
+    histogram = numpy.bincount(unique_cost) if len(unique) else []
+    cost_curve = [dict(cost=c, attacks=int(n))
+                  for c, n in enumerate(histogram) if n]
+
+    frontier = []
+    order = numpy.lexsort((unique_cost, -unique_damage))
+    best_cost = None
+    for i in order[unique_damage[order] > 0]:
+        if best_cost is None or unique_cost[i] < best_cost:
+            best_cost = int(unique_cost[i])
+            frontier.append([int(unique_damage[i]), best_cost,
+                             int(mechanic_ids[i])])
+    frontier.reverse()
+    return dict(
+        version=data_version(session),
+        attacks=len(unique),
+        damage_per_energy=damage_per_energy,
+        cost_curve=cost_curve,
+        frontier=frontier,
+    )
+
+
+def cached_stats(session, cache_dir=None):
+    """Return compute_stats(), reusing a cached result for this data version
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    version = data_version(session)
+    path = os.path.join(cache_dir, 'stats-{}.json'.format(version))
+    try:
+        with io.open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        pass
+    result = compute_stats(session)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(unicode(json.dumps(result, sort_keys=True)))
+    return result
+
+
+def cheapest_attack(stats, min_damage):
+    """Return [damage, cost, mechanic id] of the cheapest attack doing at
+    least min_damage, or None"""
+    frontier = stats['frontier']
+    position = bisect.bisect_left([point[0] for point in frontier],
+                                  min_damage)
+    if position < len(frontier):
+        return frontier[position]
@@ -1,7 +1,7 @@
 # Encoding: UTF-8
 
-from sqlalchemy import (Column, ForeignKey, MetaData, PrimaryKeyConstraint,
-                        Table, UniqueConstraint)
+from sqlalchemy import (Column, ForeignKey, Index, MetaData,
+                        PrimaryKeyConstraint, Table, UniqueConstraint)
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.types import *
 from sqlalchemy.orm import backref, relationship
@@ -250,7 +250,7 @@ class MechanicCost(TableBase):
         primary_key=True, nullable=False,
         info=dict(description=u"The ID of the mechanic"))
     type_id = Column(Integer, ForeignKey('tcg_types.id'),
-        primary_key=True, nullable=False,
+        primary_key=True, nullable=False, index=True,
         info=dict(description=u"The type of Energy"))
     amount = Column(Integer, nullable=False,
         info=dict(description=u"The amount of this Energy required"))
@@ -422,11 +422,150 @@ class Evolution(TableBase):
         info=dict(description=u"Order of appearance on card."))
 
 
+class EvolutionClosure(TableBase):
+    """Transitive closure of evolutions between card families
+
+    Derived from tcg_evolutions; every family that appears in an evolution
+    also has a row linking it to itself, with depth 0.
+    """
+    __tablename__ = 'tcg_evolution_closure'
+    derived = True
+
+    ancestor_id = Column(Integer, ForeignKey('tcg_card_families.id'),
+        primary_key=True, nullable=False,
+        info=dict(description=u"The ID of the earlier family"))
+    descendant_id = Column(Integer, ForeignKey('tcg_card_families.id'),
+        primary_key=True, nullable=False, index=True,
+        info=dict(description=u"The ID of the family it evolves into"))
+    depth = Column(Integer, nullable=False,
+        info=dict(description=u"Number of evolution steps between the two"))
+
+
+class CardReprint(TableBase):
+    """A card's prints in release order, for reprint histories
+
+    Derived from tcg_set_prints; rows are ordered like Card.set_prints.
+    """
+    __tablename__ = 'tcg_card_reprints'
+    derived = True
+
+    card_id = Column(Integer, ForeignKey('tcg_cards.id'),
+        primary_key=True, nullable=False,
+        info=dict(description=u"The ID of the card"))
+    order = Column(Integer, primary_key=True, nullable=False,
+        info=dict(description=u"Position in release order, from 0"))
+    print_id = Column(Integer, ForeignKey('tcg_prints.id'),
+        nullable=False, index=True,
+        info=dict(description=u"The ID of the print"))
+    set_id = Column(Integer, ForeignKey('tcg_sets.id'),
+        nullable=False, index=True,
+        info=dict(description=u"The ID of the set it was printed in"))
+    number = Column(Unicode(5), nullable=True,
+        info=dict(description=u"The card number in the set"))
+    rarity_id = Column(Integer, ForeignKey('tcg_rarities.id'),
+        nullable=True,
+        info=dict(description=u"The ID of the print's rarity"))
+    latest = Column(Boolean, nullable=False,
+        info=dict(description=u"True for the card's most recent print"))
+
+
+class SetStat(TableBase):
+    """Precomputed counts of a set's prints, for set listings
+
+    Derived from the card tables; see ptcgdex/set_stats.py for the stats.
+    """
+    __tablename__ = 'tcg_set_stats'
+    derived = True
+
+    set_id = Column(Integer, ForeignKey('tcg_sets.id'),
+        primary_key=True, nullable=False,
+        info=dict(description=u"The ID of the set"))
+    stat = Column(Unicode(40), primary_key=True, nullable=False,
+        info=dict(description=u"What is counted, e.g. prints or rarity:rare"))
+    count = Column(Integer, nullable=False,
+        info=dict(description=u"The count"))
+
+
+class ScanFile(TableBase):
+    """Manifest of the scan image files, as of the last `ptcgdex scans` run
+
+    Not card data: it describes a directory of hosted images.
+    """
+    __tablename__ = 'tcg_scan_files'
+
+    filename = Column(Unicode(30), primary_key=True, nullable=False,
+        info=dict(description=u"Scan filename without extension, as in tcg_scans"))
+    path = Column(Unicode(200), nullable=False,
+        info=dict(description=u"Path of the file, relative to the scan directory"))
+    size = Column(Integer, nullable=False,
+        info=dict(description=u"File size in bytes"))
+    mtime = Column(Float, nullable=False,
+        info=dict(description=u"Modification time, as a Unix timestamp"))
+    sha1 = Column(Unicode(40), nullable=False,
+        info=dict(description=u"SHA-1 of the file contents"))
+    previous_sha1 = Column(Unicode(40), nullable=True,
+        info=dict(description=u"SHA-1 as of the run before, if the file existed"))
+
+
+class ImportCheckpoint(TableBase):
+    """Record of a YAML document that was imported and committed"""
+    __tablename__ = 'tcg_import_checkpoints'
+    __singlename__ = 'tcg_import_checkpoint'
+
+    identifier = Column(Unicode(30), primary_key=True, nullable=False,
+        info=dict(description=u"Identifier of the imported file"))
+    document = Column(Integer, primary_key=True, nullable=False,
+        info=dict(description=u"Index of the YAML document in the file"))
+    checksum = Column(Unicode(40), nullable=False,
+        info=dict(description=u"SHA-1 of the file contents when imported"))
+    prints = Column(Integer, nullable=False,
+        info=dict(description=u"Number of prints the document contained"))
+    duration = Column(Float, nullable=False,
+        info=dict(description=u"Time the import took, in seconds"))
+    completed = Column(DateTime, nullable=False,
+        info=dict(description=u"When the import was committed"))
+
+
+class DataVersion(TableBase):
+    """Change counter for data that caches are derived from
+
+    Import bumps the row of each set it touches, and the global row (with
+    an empty key) on every change. The token changes with every bump, so
+    it also tells apart databases that were rebuilt from scratch.
+    """
+    __tablename__ = 'tcg_data_versions'
+    __singlename__ = 'tcg_data_version'
+
+    key = Column(Unicode(30), primary_key=True, nullable=False,
+        info=dict(description=u"Set identifier, or '' for all data"))
+    version = Column(Integer, nullable=False,
+        info=dict(description=u"Number of times the data changed"))
+    token = Column(Unicode(32), nullable=False,
+        info=dict(description=u"Random token, new on every change"))
+
+
+# Indexes for the importer's card lookup, set listings and scan checks
+Index('ix_tcg_cards_lookup', Card.family_id, Card.stage_id, Card.hp,
+      Card.class_id, Card.retreat_cost)
+Index('ix_tcg_set_prints_set_order', SetPrint.set_id, SetPrint.order)
+Index('ix_tcg_scans_filename', Scan.filename)
+
+
 _pokedex_classes_set = set(pokedex_classes)
 tcg_classes = [c for c in dex_tables.mapped_classes if
                c not in _pokedex_classes_set]
 
 
+def create_derived_tables(bind):
+    """Create the derived and bookkeeping tables, if they don't exist yet
+
+    Databases set up before such a table was added lack it; the commands
+    that fill or read these tables call this first.
+    """
+    for cls in (EvolutionClosure, ImportCheckpoint, DataVersion, SetStat,
+                CardReprint, ScanFile):
+        cls.__table__.create(bind, checkfirst=True)
+
 
 Card.class_ = relationship(Class, backref='cards')
 Card.stage = relationship(Stage, backref='cards')
@@ -478,3 +617,14 @@ Scan.print_ = relationship(Print, backref=backref(
 Evolution.card = relationship(Card, backref=backref(
     'evolutions', order_by=Evolution.order.asc()))
 Evolution.family = relationship(CardFamily, backref='evolutions')
+
+EvolutionClosure.ancestor = relationship(CardFamily,
+    primaryjoin=EvolutionClosure.ancestor_id == CardFamily.id)
+EvolutionClosure.descendant = relationship(CardFamily,
+    primaryjoin=EvolutionClosure.descendant_id == CardFamily.id)
+
+CardReprint.card = relationship(Card, backref=backref(
+    'reprints', order_by=CardReprint.order.asc()))
+CardReprint.print_ = relationship(Print)
+CardReprint.set = relationship(Set)
+CardReprint.rarity = relationship(Rarity)
@@ -0,0 +1,300 @@
+# Encoding: UTF-8
+"""Schema validation for .cards files
+
+Checks every YAML document against the schema declared below and the
+reference CSV files, without touching a database. Importing only a valid
+file can still fail (e.g. on a wrong Pokédex number), but malformed
+keys and values are caught here, before any DB work starts.
+
+This module deliberately does not import pokedex or SQLAlchemy.
+"""
+from __future__ import division, unicode_literals
+
+import io
+import os
+import re
+import csv
+import multiprocessing
+from collections import namedtuple
+from datetime import datetime
+
+import yaml
+
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+ValidationError = namedtuple('ValidationError', 'filename document path message')
+
+default_csv_dir = os.path.join(os.path.dirname(__file__), 'data', 'csv')
+
+HEIGHT_RE = re.compile(r"^\d+'\d+$")
+DAMAGE_RE = re.compile(r'^-?\d*[-+?×]?$')
+# Blank operation & amount appear on cards with no printed modifier value
+DAMAGE_OPERATIONS = frozenset(['×', '+', '-', ''])
+
+
+def read_csv(directory, name):
+    with open(os.path.join(directory, name + '.csv'), 'rb') as f:
+        return [{k: v.decode('utf-8') for k, v in row.items()}
+                for row in csv.DictReader(f)]
+
+
+def load_references(directory=default_csv_dir):
+    """Load the sets of allowed values from the reference CSVs"""
+    [en_id] = [row['id'] for row in read_csv(directory, 'languages')
+               if row['identifier'] == 'en']
+
+    def names(table):
+        return frozenset(row['name'] for row in read_csv(directory, table)
+                         if row['local_language_id'] == en_id)
+
+    def identifiers(table):
+        return frozenset(row['identifier'] for row in read_csv(directory, table))
+
+    return dict(
+        rarities=identifiers('tcg_rarities'),
+        stages=names('tcg_stage_names'),
+        types=names('tcg_type_names'),
+        type_initials=frozenset(row['initial'] for row in
+                                read_csv(directory, 'tcg_types')),
+        mechanic_classes=identifiers('tcg_mechanic_classes'),
+        classes=frozenset(ident[0].upper() for ident in
+                          identifiers('tcg_classes')),
+    )
+
+
+# Value checkers. Each takes (value, references) and returns an error
+# message, or None if the value is fine.
+
+def text(value, refs):
+    if not isinstance(value, basestring):
+        return 'expected text, got {!r}'.format(value)
+
+def integer(value, refs):
+    if isinstance(value, bool) or not isinstance(value, (int, long)):
+        return 'expected integer, got {!r}'.format(value)
+
+def optional_integer(value, refs):
+    if value != '':
+        return integer(value, refs)
+
+def number(value, refs):
+    if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+        return 'expected number, got {!r}'.format(value)
+
+def boolean(value, refs):
+    if not isinstance(value, bool):
+        return 'expected true/false, got {!r}'.format(value)
+
+def date(value, refs):
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return 'expected YYYY-MM-DD date, got {!r}'.format(value)
+
+def height(value, refs):
+    if not isinstance(value, basestring) or not HEIGHT_RE.match(value):
+        return "expected feet'inches height, got {!r}".format(value)
+
+def damage(value, refs):
+    if not isinstance(value, basestring) or not DAMAGE_RE.match(value):
+        return 'expected damage such as 30, 10+ or 20×, got {!r}'.format(value)
+
+def cost(value, refs):
+    if value == '#':
+        return
+    if not isinstance(value, basestring):
+        return 'expected energy cost, got {!r}'.format(value)
+    bad = set(value) - refs['type_initials']
+    if bad:
+        return 'unknown energy initials {} in {!r}'.format(
+            ', '.join(sorted(bad)), value)
+
+def operation(value, refs):
+    if value not in DAMAGE_OPERATIONS:
+        return 'unknown damage operation {!r}'.format(value)
+
+def reference(kind):
+    def check(value, refs):
+        if value not in refs[kind]:
+            return 'unknown {} {!r}'.format(kind, value)
+    return check
+
+def optional_reference(kind):
+    check = reference(kind)
+    def check_optional(value, refs):
+        if value:
+            return check(value, refs)
+    return check_optional
+
+def list_of(item_checker):
+    def check(value, refs):
+        if not isinstance(value, list):
+            return 'expected list, got {!r}'.format(value)
+        for item in value:
+            error = item_checker(item, refs)
+            if error:
+                return error
+    return check
+
+
+MECHANIC_SCHEMA = {
+    'name': text,
+    'cost': cost,
+    'damage': damage,
+    'type': reference('mechanic_classes'),
+    'text': text,
+}
+
+DAMAGE_MODIFIER_SCHEMA = {
+    'amount': optional_integer,
+    'operation': operation,
+    'type': reference('types'),
+}
+
+PRINT_SCHEMA = {
+    'name': text,
+    'rarity': optional_reference('rarities'),
+    'holographic': boolean,
+    'class': reference('classes'),
+    'types': list_of(reference('types')),
+    'hp': integer,
+    'stage': reference('stages'),
+    'evolves from': list_of(text),
+    'evolves into': list_of(text),
+    'legal': boolean,
+    'filename': text,
+    'pokemon': text,
+    'subclasses': list_of(text),
+    'mechanics': MECHANIC_SCHEMA,
+    'damage modifiers': DAMAGE_MODIFIER_SCHEMA,
+    'retreat': integer,
+    'dex number': integer,
+    'species': text,
+    'weight': number,
+    'height': height,
+    'dex entry': text,
+    'illustrators': list_of(text),
+    'reprint of': text,
+    # Keys import_print knows to ignore
+    'orphan': None,
+    'has-variant': None,
+    'dated': None,
+    'in-set-variant-of': None,
+}
+
+PRINT_REQUIRED_KEYS = frozenset(['name', 'holographic', 'filename'])
+
+SET_ENTRY_SCHEMA = {
+    'number': text,
+    'card': None,  # checked by check_print
+}
+
+SET_SCHEMA = {
+    'name': text,
+    'total': integer,
+    'release date': date,
+    'modified ban date': date,
+    'cards': SET_ENTRY_SCHEMA,
+}
+
+
+def check_mapping(value, schema, refs, path):
+    """Yield (path, message) pairs for a mapping checked against a schema
+
+    Schema values are checker functions, nested schemas (for a list of
+    mappings), or None for keys whose value is not checked.
+    """
+    if not isinstance(value, dict):
+        yield path, 'expected mapping, got {!r}'.format(value)
+        return
+    for key, item in sorted(value.items()):
+        subpath = '{}.{}'.format(path, key) if path else key
+        try:
+            checker = schema[key]
+        except KeyError:
+            yield subpath, 'unknown key'
+            continue
+        if checker is None:
+            continue
+        elif isinstance(checker, dict):
+            if not isinstance(item, list):
+                yield subpath, 'expected list, got {!r}'.format(item)
+                continue
+            for i, element in enumerate(item):
+                for error in check_mapping(element, checker, refs,
+                                           '{}[{}]'.format(subpath, i)):
+                    yield error
+        else:
+            message = checker(item, refs)
+            if message:
+                yield subpath, message
+
+
+def check_print(info, refs, path=''):
+    for error in check_mapping(info, PRINT_SCHEMA, refs, path):
+        yield error
+    if not isinstance(info, dict):
+        return
+    prefix = path + '.' if path else ''
+    for key in sorted(PRINT_REQUIRED_KEYS - set(info)):
+        yield prefix + key, 'missing required key'
+    if 'dex number' in info and 'pokemon' not in info:
+        yield prefix + 'pokemon', "required with 'dex number'"
+
+
+def check_document(info, refs):
+    """Yield (path, message) pairs for problems in one YAML document"""
+    if isinstance(info, dict) and 'cards' in info:
+        for error in check_mapping(info, SET_SCHEMA, refs, ''):
+            yield error
+        if not isinstance(info['cards'], list):
+            return
+        for i, entry in enumerate(info['cards']):
+            if isinstance(entry, dict) and 'card' in entry:
+                for error in check_print(entry['card'], refs,
+                                         'cards[{}].card'.format(i)):
+                    yield error
+            else:
+                yield 'cards[{}].card'.format(i), 'missing required key'
+    else:
+        for error in check_print(info, refs):
+            yield error
+
+
+def validate_file(filename, refs):
+    errors = []
+    with io.open(filename, encoding='utf-8') as f:
+        try:
+            documents = list(yaml.load_all(f, Loader=SafeLoader))
+        except yaml.YAMLError as e:
+            return [ValidationError(filename, None, '', unicode(e))]
+    for doc_index, info in enumerate(documents):
+        for path, message in check_document(info, refs):
+            errors.append(ValidationError(filename, doc_index, path, message))
+    return errors
+
+
+_references = None
+
+def _init_worker(csv_dir):
+    global _references
+    _references = load_references(csv_dir)
+
+def _validate_file(filename):
+    return validate_file(filename, _references)
+
+
+def validate_files(filenames, csv_dir=default_csv_dir, jobs=None):
+    """Validate .cards files in parallel; return a list of ValidationErrors
+    """
+    if len(filenames) < 2 or jobs == 1:
+        refs = load_references(csv_dir)
+        results = [validate_file(filename, refs) for filename in filenames]
+    else:
+        pool = multiprocessing.Pool(jobs, _init_worker, (csv_dir, ))
+        try:
+            results = pool.map(_validate_file, filenames)
+        finally:
+            pool.close()
+            pool.join()
+    return [error for file_errors in results for error in file_errors]
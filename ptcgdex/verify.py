@@ -0,0 +1,145 @@
+# Encoding: UTF-8
+"""Round-trip verification of the card YAML corpus
+
+Every document is imported into a scratch in-memory SQLite database and
+exported back; the export must match the source document exactly.
+Files are checked in parallel, one worker process per CPU; each worker
+seeds its own scratch database once and rolls it back between files.
+"""
+from __future__ import division, unicode_literals
+
+import os
+import copy
+import multiprocessing
+from collections import namedtuple, defaultdict
+
+import yaml
+
+Mismatch = namedtuple('Mismatch', 'label path expected got')
+
+# Keys that import_print deliberately drops
+IGNORED_KEYS = frozenset(['orphan', 'has-variant', 'dated', 'in-set-variant-of',
+                          'reprint of'])
+
+MISSING = '<missing>'
+
+_scratch_session = None
+
+
+def diff_documents(expected, got, path=''):
+    """Yield (path, expected, got) for every difference between two documents
+    """
+    if isinstance(expected, dict) and isinstance(got, dict):
+        for key in sorted(set(expected) | set(got)):
+            if key in IGNORED_KEYS:
+                continue
+            subpath = '{}.{}'.format(path, key) if path else key
+            for item in diff_documents(expected.get(key, MISSING),
+                                       got.get(key, MISSING), subpath):
+                yield item
+    elif isinstance(expected, list) and isinstance(got, list):
+        for i in range(max(len(expected), len(got))):
+            a = expected[i] if i < len(expected) else MISSING
+            b = got[i] if i < len(got) else MISSING
+            for item in diff_documents(a, b, '{}[{}]'.format(path, i)):
+                yield item
+    elif expected != got:
+        yield path, expected, got
+
+
+def field_name(path):
+    """Strip list indices from a mismatch path: cards[3].card.hp -> cards.card.hp
+    """
+    parts = []
+    for part in path.split('.'):
+        parts.append(part.split('[')[0])
+    return '.'.join(parts)
+
+
+def _init_worker(engine_uri):
+    global _scratch_session
+    import pokedex.db
+    from ptcgdex import load as ptcg_load
+    source = pokedex.db.connect(engine_uri)
+    _scratch_session = ptcg_load.make_scratch_session(source)
+    source.close()
+
+
+def verify_documents(session, infos, label, identifier=None):
+    """Import and re-export the given documents, return a list of Mismatches
+
+    Nothing is committed; the session is rolled back afterwards.
+    """
+    from ptcgdex import tcg_tables
+    from ptcgdex import load as ptcg_load
+    mismatches = []
+    try:
+        for doc_index, info in enumerate(infos):
+            doc_label = '{}#{}'.format(label, doc_index)
+            source = copy.deepcopy(info)
+            if 'cards' in info:
+                ptcg_load.import_set(session, source, identifier,
+                                     lambda status: None)
+                session.flush()
+                if 'name' in info:
+                    set_ident = ptcg_load.identifier_from_name(info['name'])
+                else:
+                    set_ident = identifier
+                query = session.query(tcg_tables.Set)
+                query = query.filter_by(identifier=set_ident)
+                query = query.options(
+                    *ptcg_load.print_load_options('set_prints.print_.'))
+                exported = ptcg_load.export_set(query.one())
+            else:
+                print_ = ptcg_load.import_print(session, source,
+                                                do_commit=False)
+                exported = ptcg_load.export_print(print_)
+            for path, expected, got in diff_documents(info, exported):
+                mismatches.append(Mismatch(doc_label, path, expected, got))
+    finally:
+        session.rollback()
+    return mismatches
+
+
+def _verify_file(filename):
+    identifier = os.path.splitext(os.path.basename(filename))[0]
+    with open(filename) as f:
+        infos = list(yaml.safe_load_all(f))
+    try:
+        return filename, verify_documents(
+            _scratch_session, infos, identifier, identifier), None
+    except Exception as e:
+        return filename, [], '{}: {}'.format(type(e).__name__, e)
+
+
+def verify_files(engine_uri, filenames, jobs=None, print_status=None):
+    """Verify the given .cards files in parallel
+
+    Returns a (mismatches, errors) tuple; `errors` maps filenames to
+    messages for files that could not be imported at all.
+    """
+    pool = multiprocessing.Pool(jobs, _init_worker, (engine_uri, ))
+    mismatches = []
+    errors = {}
+    try:
+        results = pool.imap_unordered(_verify_file, filenames)
+        for i, (filename, file_mismatches, error) in enumerate(results):
+            if print_status:
+                print_status('{}/{} {}'.format(i + 1, len(filenames),
+                                               os.path.basename(filename)))
+            mismatches.extend(file_mismatches)
+            if error:
+                errors[filename] = error
+    finally:
+        pool.close()
+        pool.join()
+    mismatches.sort(key=lambda m: (m.label, m.path))
+    return mismatches, errors
+
+
+def summarize(mismatches):
+    """Return a list of (field, count) pairs, most common first"""
+    counts = defaultdict(int)
+    for mismatch in mismatches:
+        counts[field_name(mismatch.path)] += 1
+    return sorted(counts.items(), key=lambda f_c: (-f_c[1], f_c[0]))
@@ -0,0 +1,63 @@
+# Encoding: UTF-8
+"""Data version counters (the tcg_data_versions table)
+
+Caches of exported or computed data are keyed by a version token, so they
+are invalidated exactly when the data they came from changes.
+"""
+from __future__ import division, unicode_literals
+
+import uuid
+
+from sqlalchemy import inspect, select
+
+from ptcgdex import tcg_tables
+
+ALL = ''  # the key bumped on every change
+
+version_table = tcg_tables.DataVersion.__table__
+
+
+def has_versions(session):
+    table_names = inspect(session.connection()).get_table_names()
+    return version_table.name in table_names
+
+
+def bump(session, keys=()):
+    """Bump the given set identifiers' versions, and the global one
+
+    Does nothing if the database has no version table.
+    """
+    if not has_versions(session):
+        return
+    connection = session.connection()
+    c = version_table.c
+    for key in set(keys) | set([ALL]):
+        token = uuid.uuid4().hex
+        updated = connection.execute(version_table.update().where(
+            c.key == key).values(version=c.version + 1, token=token))
+        if not updated.rowcount:
+            connection.execute(version_table.insert().values(
+                key=key, version=1, token=token))
+
+
+def bump_all_sets(session):
+    """Bump every set's version, for changes not confined to some sets"""
+    sets = tcg_tables.Set.__table__
+    bump(session, [identifier for identifier, in session.connection().execute(
+        select([sets.c.identifier]))])
+
+
+def tokens(session, keys):
+    """Return {key: token} for the given keys that have a version
+
+    Returns an empty dict if the database has no version table.
+    """
+    if not has_versions(session):
+        return {}
+    c = version_table.c
+    query = select([c.key, c.token], c.key.in_(list(keys)))
+    return dict(session.connection().execute(query).fetchall())
+
+
+def token(session, key=ALL):
+    return tokens(session, [key]).get(key)
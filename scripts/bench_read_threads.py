@@ -0,0 +1,81 @@
+# Encoding: UTF-8
+"""Usage:
+  bench_read_threads.py [options]
+
+Options:
+  -h, --help        Display help
+  -e --engine-uri URI
+                    The database to read (default: the one ptcgdex uses)
+  --threads=LIST    Comma-separated thread counts to try; default: 1,2,4,8
+  --rounds=N        Times each set is exported per run; default: 1
+
+Measures export throughput of a thread pool sharing one read-only session
+factory (ptcgdex.db.connect_read_only): every set is exported to YAML,
+each by one thread with its own pooled connection. Prints sets per second
+for each thread count and the speedup over the first count.
+
+Rendering the YAML holds the GIL, so scaling comes from the time spent in
+the database driver; expect it to level off below the number of cores.
+"""
+
+from __future__ import division, print_function, unicode_literals
+
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+from docopt import docopt
+
+from ptcgdex import db
+from ptcgdex import tcg_tables
+from ptcgdex import load as ptcg_load
+
+
+def export_one(session, identifier):
+    try:
+        tcg_set = (session.query(tcg_tables.Set)
+                   .filter_by(identifier=identifier)
+                   .options(*ptcg_load.print_load_options(
+                       'set_prints.print_.'))
+                   .one())
+        return len(ptcg_load.yaml_dump(ptcg_load.export_set(tcg_set)))
+    finally:
+        session.remove()
+
+
+def run(session, identifiers, threads):
+    pool = ThreadPool(threads)
+    try:
+        start = time.time()
+        sizes = pool.map(lambda identifier: export_one(session, identifier),
+                         identifiers, chunksize=1)
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+    return elapsed, sum(sizes)
+
+
+def main(engine_uri, thread_counts, rounds):
+    session = db.connect_read_only(engine_uri, pool_size=max(thread_counts))
+    identifiers = [identifier for identifier, in
+                   session.query(tcg_tables.Set.identifier)] * rounds
+    session.remove()
+    baseline = None
+    print('{:>7} {:>9} {:>9} {:>8}'.format('threads', 'seconds', 'sets/s',
+                                           'speedup'))
+    for threads in thread_counts:
+        elapsed, size = run(session, identifiers, threads)
+        rate = len(identifiers) / elapsed
+        baseline = baseline or rate
+        print('{:7} {:9.2f} {:9.1f} {:7.2f}x'.format(
+            threads, elapsed, rate, rate / baseline))
+    print('{} sets, {:.1f} MiB of YAML per run'.format(
+        len(identifiers), size / 2 ** 20), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__, argv=sys.argv[1:], help=True, version=None)
+    main(arguments['--engine-uri'],
+         [int(n) for n in (arguments['--threads'] or '1,2,4,8').split(',')],
+         int(arguments['--rounds'] or 1))
@@ -0,0 +1,104 @@
+# Encoding: UTF-8
+"""Usage:
+  check_dbdiff.py [options] [<file> ...]
+
+Options:
+  -h, --help            Display help
+  -e, --engine-uri=URI  Database with the reference data (languages,
+                        species, types...) to seed the scratch databases
+                        from; default: pokedex's default database
+
+Imports the card files (default: the bundled ones) into two scratch
+SQLite databases and checks that `ptcgdex diff` finds no difference
+between them. The bundled cards include prints without a card class and
+prints in no set, which the diff must handle.
+
+Then leaves the first file out of the second database, checks that the
+diff reports its sets as added, syncs the second database from the first
+and checks that the diff is empty again.
+
+Exits with status 1 if any check fails.
+"""
+
+from __future__ import division, print_function, unicode_literals
+
+import os
+import sys
+import shutil
+import tempfile
+
+from docopt import docopt
+
+import pokedex.db
+
+from ptcgdex import dbdiff
+from ptcgdex import load as ptcg_load
+from ptcgdex.main import default_cards_dir
+
+
+def import_files(session, filenames):
+    cache = ptcg_load.ImportCache()
+    for filename in filenames:
+        with open(filename) as f:
+            identifier = os.path.splitext(os.path.basename(filename))[0]
+            ptcg_load.import_(session, f, filename, identifier,
+                              verbose=False, cache=cache)
+
+
+def differences(session, other):
+    diffs = dbdiff.diff(dbdiff.Fingerprints(session),
+                        dbdiff.Fingerprints(other))
+    return [(result.kind, sign, key)
+            for result in diffs
+            for sign, keys in [('+', result.added), ('-', result.removed),
+                               ('~', result.changed)]
+            for key in keys]
+
+
+def report(title, found):
+    print('{}: {} differences'.format(title, len(found)))
+    for kind, sign, key in found[:20]:
+        print('    {} {} {}'.format(sign, kind, key))
+    return not found
+
+
+def main(engine_uri, filenames):
+    source = pokedex.db.connect(engine_uri)
+    directory = tempfile.mkdtemp(prefix='ptcgdex-dbdiff-')
+    try:
+        full = ptcg_load.make_scratch_session(
+            source, 'sqlite:///' + os.path.join(directory, 'full.sqlite'))
+        partial = ptcg_load.make_scratch_session(
+            source, 'sqlite:///' + os.path.join(directory, 'copy.sqlite'))
+        import_files(full, filenames)
+        import_files(partial, filenames)
+        ok = report('Same files', differences(partial, full))
+
+        partial.close()
+        partial = ptcg_load.make_scratch_session(
+            source, 'sqlite:///' + os.path.join(directory, 'stale.sqlite'))
+        import_files(partial, filenames[1:])
+        found = differences(partial, full)
+        if not found:
+            print('Leaving out {}: no differences found'.format(filenames[0]))
+            ok = False
+        else:
+            print('Leaving out {}: {} differences'.format(
+                filenames[0], len(found)))
+        dbdiff.sync(partial, full)
+        ok = report('After sync', differences(partial, full)) and ok
+    finally:
+        shutil.rmtree(directory)
+    return ok
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__, argv=sys.argv[1:], help=True, version=None)
+    filenames = arguments['<file>']
+    if not filenames:
+        cards_dir = default_cards_dir()
+        filenames = sorted(os.path.join(cards_dir, name)
+                           for name in os.listdir(cards_dir)
+                           if name.endswith('.cards'))
+    if not main(arguments['--engine-uri'], filenames):
+        sys.exit(1)
@@ -0,0 +1,154 @@
+# Encoding: UTF-8
+"""Usage:
+  check_import_time.py [options]
+
+Options:
+  -h, --help        Display help
+  --overhead=RATIO  Allowed extra time of the command over the reference,
+                    as a fraction of the reference; default: 0.5
+  --runs=N          Number of fresh interpreters to time; default: 5
+
+Times `ptcgdex export-card --all` against an empty database (one with the
+full schema but no rows), each run in a fresh interpreter. That is what a
+script calling `ptcgdex export-card` in a loop pays on every call besides
+the export itself.
+
+The budget is calibrated in the same run: a reference interpreter
+imports SQLAlchemy and the pokedex tables, connects to the same database
+and runs one query. That is the least any pokedex-based command pays on
+this machine; the command may take at most RATIO more than it.
+
+Also checks that `import ptcgdex.main` alone does not pull in the
+database layer, so `help` and usage errors stay fast: SQLAlchemy, pokedex
+and the table declarations are only to be imported by the commands that
+need them.
+
+Exits with status 1 if either check fails. When over budget, prints how
+long each of the heavy imports takes in a fresh interpreter.
+"""
+
+from __future__ import division, print_function, unicode_literals
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+from docopt import docopt
+
+MODULE = 'ptcgdex.main'
+FORBIDDEN_PREFIXES = ['sqlalchemy', 'pokedex', 'ptcgdex.tcg_tables',
+                      'ptcgdex.load']
+# Imported one after another, so each time excludes the ones before
+STAGES = ['sqlalchemy', 'pokedex.db.tables', 'ptcgdex.tcg_tables',
+          'ptcgdex.load']
+
+COMMAND_CODE = 'import sys; from ptcgdex.main import main; main(sys.argv)'
+
+REFERENCE_CODE = '''
+import sys
+import pokedex.db
+from pokedex.db import tables
+session = pokedex.db.connect(sys.argv[1])
+session.query(tables.Language).first()
+'''
+
+MODULES_CODE = '''
+import json, sys
+import {module}
+print(json.dumps(sorted(sys.modules)))
+'''
+
+STAGES_CODE = '''
+import json, time
+stages = []
+for module in {modules!r}:
+    start = time.time()
+    __import__(module)
+    stages.append((module, time.time() - start))
+print(json.dumps(stages))
+'''
+
+
+def make_empty_database(path):
+    from sqlalchemy import create_engine
+    from pokedex.db import tables as dex_tables
+    from ptcgdex import tcg_tables
+    engine = create_engine('sqlite:///' + path)
+    dex_tables.metadata.create_all(engine)
+    engine.dispose()
+
+
+def time_process(args):
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        subprocess.check_call([sys.executable] + args, stdout=devnull)
+        return time.time() - start
+
+
+def time_command(engine_uri):
+    return time_process(['-c', COMMAND_CODE, '-q', '-e', engine_uri,
+                         'export-card', '--all'])
+
+
+def time_reference(engine_uri):
+    return time_process(['-c', REFERENCE_CODE, engine_uri])
+
+
+def imported_modules(module):
+    output = subprocess.check_output(
+        [sys.executable, '-c', MODULES_CODE.format(module=module)])
+    return json.loads(output.decode('utf-8'))
+
+
+def stage_times():
+    """Return (module, seconds) for each of STAGES, imported in order"""
+    output = subprocess.check_output(
+        [sys.executable, '-c', STAGES_CODE.format(modules=STAGES)])
+    return json.loads(output.decode('utf-8'))
+
+
+def main(overhead, runs):
+    directory = tempfile.mkdtemp(prefix='ptcgdex-import-time-')
+    try:
+        path = os.path.join(directory, 'empty.sqlite')
+        make_empty_database(path)
+        uri = 'sqlite:///' + path
+        # Interleaved, so both see the same machine load
+        commands = []
+        references = []
+        for i in range(runs):
+            references.append(time_reference(uri))
+            commands.append(time_command(uri))
+    finally:
+        shutil.rmtree(directory)
+    command = min(commands) * 1000
+    reference = min(references) * 1000
+    budget = reference * (1 + overhead)
+    print('pokedex reference: {:.1f} ms (best of {})'.format(reference, runs))
+    print('ptcgdex export-card: {:.1f} ms, budget {:.1f} ms'.format(
+        command, budget))
+    ok = True
+    heavy = [name for name in imported_modules(MODULE)
+             if any(name == prefix or name.startswith(prefix + '.')
+                    for prefix in FORBIDDEN_PREFIXES)]
+    if heavy:
+        ok = False
+        print('{} imports modules it should load lazily: {}'.format(
+            MODULE, ', '.join(heavy[:10])))
+    if command > budget:
+        ok = False
+        print('Over budget')
+        for module, seconds in stage_times():
+            print('{:10.1f} ms  import {}'.format(seconds * 1000, module))
+    return ok
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__, argv=sys.argv[1:], help=True, version=None)
+    if not main(float(arguments['--overhead'] or 0.5),
+                int(arguments['--runs'] or 5)):
+        sys.exit(1)
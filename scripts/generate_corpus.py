@@ -0,0 +1,204 @@
+# Encoding: UTF-8
+"""Usage:
+  generate_corpus.py [options] <scale> <destdir>
+
+Options:
+  -h, --help        Display help
+  --seed=SEED       Random seed; default: 0
+  --source=DIR      Real card files to model; default: ptcgdex/data/cards
+
+Writes <scale> times as many synthetic .cards files as there are in the
+source directory, for measuring how import, export and queries scale.
+
+Each copy ("replica") of a source file keeps its structure: set metadata,
+set size, card numbers, classes, stages, HP and the like. Card families
+get a replica suffix ("Pikachu 3"), so families grow with the corpus.
+Mechanics are swapped for random real mechanics of the same kind, and
+illustrators for random real ones. A share of entries, equal to the
+source's reprint ratio, are reprints of cards generated earlier.
+"""
+
+from __future__ import division, print_function, unicode_literals
+
+import os
+import io
+import sys
+import copy
+import json
+import random
+from collections import OrderedDict, defaultdict
+
+import yaml
+from docopt import docopt
+from ptcgdex.load import Text, yaml_dump
+
+
+class Loader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+    """Keeps mappings in file order, so output reads like the source"""
+
+def construct_ordered_mapping(loader, node):
+    return OrderedDict(loader.construct_pairs(node))
+
+Loader.add_constructor('tag:yaml.org,2002:map', construct_ordered_mapping)
+
+default_source = os.path.join(
+    os.path.dirname(__file__), '..', 'ptcgdex', 'data', 'cards')
+
+# Keys that make up a card's identity (as opposed to its print)
+CARD_KEYS = ['name', 'class', 'types', 'hp', 'stage', 'evolves from',
+             'evolves into', 'legal', 'subclasses', 'mechanics',
+             'damage modifiers', 'retreat']
+LONG_TEXT_KEYS = ['dex entry']
+MECHANIC_SWAP_RATE = 0.5
+
+
+def read_corpus(directory):
+    """Return [(filename, [documents])], sets in release order"""
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.cards'):
+            with io.open(os.path.join(directory, name), encoding='utf-8') as f:
+                corpus.append((name, list(yaml.load_all(f, Loader=Loader))))
+    def release_key(item):
+        dates = [doc.get('release date') or '' for doc in item[1]
+                 if 'cards' in doc]
+        return min(dates or ['']), item[0]
+    corpus.sort(key=release_key)
+    return corpus
+
+
+def prints_of(documents):
+    for document in documents:
+        if 'cards' in document:
+            for entry in document['cards']:
+                yield entry['card']
+        else:
+            yield document
+
+
+def card_key(card):
+    return json.dumps([card.get(key) for key in CARD_KEYS], sort_keys=True)
+
+
+class Model(object):
+    """What the generator samples from"""
+    def __init__(self, corpus):
+        self.mechanics = defaultdict(list)
+        self.illustrators = set()
+        seen = set()
+        prints = reprints = 0
+        for filename, documents in corpus:
+            for card in prints_of(documents):
+                prints += 1
+                key = card_key(card)
+                if key in seen:
+                    reprints += 1
+                seen.add(key)
+                for mechanic in card.get('mechanics', ()):
+                    self.mechanics[mechanic.get('type')].append(mechanic)
+                self.illustrators.update(card.get('illustrators', ()))
+        self.illustrators = sorted(self.illustrators)
+        self.reprint_ratio = reprints / max(1, prints)
+
+
+class Generator(object):
+    def __init__(self, model, seed):
+        self.model = model
+        self.random = random.Random(seed)
+        self.generated = []
+
+    def family(self, name, replica):
+        if replica == 0:
+            return name
+        return '{} {}'.format(name, replica)
+
+    def new_card(self, template, replica):
+        card = copy.deepcopy(template)
+        card['name'] = self.family(card['name'], replica)
+        for key in 'evolves from', 'evolves into':
+            if key in card:
+                card[key] = [self.family(name, replica) for name in card[key]]
+        mechanics = []
+        for mechanic in card.get('mechanics', ()):
+            if self.random.random() < MECHANIC_SWAP_RATE:
+                mechanic = self.random.choice(
+                    self.model.mechanics[mechanic.get('type')])
+            mechanics.append(copy.deepcopy(mechanic))
+        if mechanics:
+            card['mechanics'] = mechanics
+        if card.get('illustrators'):
+            card['illustrators'] = [
+                self.random.choice(self.model.illustrators)
+                for illustrator in card['illustrators']]
+        card.pop('reprint of', None)
+        return card
+
+    def card(self, template, replica):
+        if self.generated and self.random.random() < self.model.reprint_ratio:
+            card = copy.deepcopy(self.random.choice(self.generated))
+            for key in 'rarity', 'holographic', 'filename':
+                if key in template:
+                    card[key] = template[key]
+        else:
+            card = self.new_card(template, replica)
+        self.generated.append(card)
+        return card
+
+    def document(self, document, replica):
+        if 'cards' not in document:
+            return self.card(document, replica)
+        result = OrderedDict()
+        for key, value in document.items():
+            if key != 'cards':
+                result[key] = value
+        if replica and 'name' in result:
+            result['name'] = '{} {}'.format(result['name'], replica)
+        result['cards'] = [
+            OrderedDict([('number', entry['number']),
+                         ('card', self.card(entry['card'], replica))])
+            if 'number' in entry else
+            OrderedDict([('card', self.card(entry['card'], replica))])
+            for entry in document['cards']]
+        return result
+
+
+def textify(value, key=None):
+    """Mark long texts so yaml_dump folds them like the real files"""
+    if isinstance(value, dict):
+        return OrderedDict((k, textify(v, k)) for k, v in value.items())
+    if isinstance(value, list):
+        return [textify(item) for item in value]
+    if key in LONG_TEXT_KEYS or key == 'text':
+        return Text(value)
+    return value
+
+
+def main(scale, destdir, seed=0, source=default_source):
+    corpus = read_corpus(source)
+    model = Model(corpus)
+    generator = Generator(model, seed)
+    if not os.path.isdir(destdir):
+        os.makedirs(destdir)
+    print('Reprint ratio: {:.3f}'.format(model.reprint_ratio),
+          file=sys.stderr)
+    for replica in range(scale):
+        for filename, documents in corpus:
+            base, ext = os.path.splitext(filename)
+            out_name = '{}-{}{}'.format(base, replica, ext) if replica \
+                else filename
+            with io.open(os.path.join(destdir, out_name), 'wb') as f:
+                for document in documents:
+                    data = yaml_dump(textify(
+                        generator.document(document, replica)))
+                    if not isinstance(data, bytes):
+                        data = data.encode('utf-8')
+                    f.write(data)
+        print('Replica {}/{}: {} prints'.format(
+            replica + 1, scale, len(generator.generated)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__, argv=sys.argv[1:], help=True, version=None)
+    main(int(arguments['<scale>']), arguments['<destdir>'],
+         seed=int(arguments['--seed'] or 0),
+         source=arguments['--source'] or default_source)
@@ -12,6 +12,9 @@ setup(
         'pyyaml',
         'docopt',
     ],
+    extras_require={
+        'analytics': ['numpy'],
+    },
 
     entry_points = {
         'console_scripts': [